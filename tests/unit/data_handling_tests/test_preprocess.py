@@ -0,0 +1,466 @@
+"""
+This is a script for testing the PreProcess class and its backend.
+"""
+import pytest
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from scipy.stats import ttest_ind, ttest_rel, f_oneway, kruskal
+
+import xomics as xo
+import xomics.utils as ut
+from xomics.config import options
+from statsmodels.stats.multitest import multipletests
+from xomics.data_handling._backend.preprocess_ttest import get_prior_variance
+from xomics.data_handling._backend.preprocess_pvals import correct_pvals, LIST_PVALS_METHODS
+from xomics.data_handling._backend.preprocess_sam import _count_permuted, _get_sam_stats
+
+GROUPS = ["A", "B", "C"]
+N_REPS = 4
+
+
+def _create_df(n=100, pct_nan=0.1, seed=0):
+    """Create DataFrame with quantifications including missing values"""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(loc=20, scale=2, size=(n, len(GROUPS) * N_REPS))
+    X[:, :N_REPS] += rng.normal(scale=1, size=(n, 1))
+    X[rng.random(X.shape) < pct_nan] = np.nan
+    cols = [f"{ut.STR_QUANT}_{g}_{i}" for g in GROUPS for i in range(N_REPS)]
+    df = pd.DataFrame(X, columns=cols)
+    df.insert(0, ut.COL_PROT_ID, [f"P{i}" for i in range(n)])
+    df.insert(1, ut.COL_GENE_NAME, [f"G{i}" for i in range(n)])
+    return df
+
+
+@pytest.fixture(scope="module")
+def df_quant():
+    return _create_df()
+
+
+@pytest.fixture(scope="module")
+def df_complete():
+    return _create_df(pct_nan=0)
+
+
+class TestQuantLayout:
+    """Test cached layout of quantification columns"""
+
+    def test_match_substring_scan(self, df_quant):
+        groups = ["B", "A", "C"]
+        layout = ut.get_quant_layout(df=df_quant, groups=groups, str_quant=ut.STR_QUANT)
+        dict_group_qcols = {g: [c for c in df_quant if ut.STR_QUANT in c and g in c.replace(ut.STR_QUANT, "")]
+                            for g in groups}
+        assert layout.dict_group_qcols == dict_group_qcols
+        assert list(layout.cols_quant) == [c for g in groups for c in dict_group_qcols[g]]
+        X = layout.get_X(df=df_quant)
+        for g, pos in layout.dict_group_pos.items():
+            assert np.array_equal(X[:, pos], df_quant[dict_group_qcols[g]].to_numpy(), equal_nan=True)
+
+    def test_cache(self, df_quant):
+        layout = ut.get_quant_layout(df=df_quant, groups=GROUPS, str_quant=ut.STR_QUANT)
+        assert ut.get_quant_layout(df=df_quant.copy(), groups=list(GROUPS), str_quant=ut.STR_QUANT) is layout
+        assert ut.get_quant_layout(df=df_quant, groups=GROUPS[:2], str_quant=ut.STR_QUANT) is not layout
+        with pytest.raises(ValueError):
+            layout.pos_quant[0] = 1
+        ut.get_dict_group_qcols(df=df_quant, groups=GROUPS, str_quant=ut.STR_QUANT)["A"].append("x")
+        assert "x" not in layout.dict_group_qcols["A"]
+
+    def test_check_match_df_groups(self, df_quant, capsys):
+        ut.check_match_df_groups(df=df_quant, groups=GROUPS, str_quant=ut.STR_QUANT)
+        assert capsys.readouterr().out == ""
+        with pytest.raises(ValueError):
+            ut.check_match_df_groups(df=df_quant, groups=["D"], str_quant=ut.STR_QUANT)
+
+    def test_duplicated_columns(self, df_quant):
+        df = pd.concat([df_quant, df_quant[[f"{ut.STR_QUANT}_A_0"]]], axis=1)
+        with pytest.raises(ValueError):
+            ut.get_quant_layout(df=df, groups=GROUPS, str_quant=ut.STR_QUANT)
+
+
+class TestFilterGroups:
+    """Test group-wise filtering of missing values"""
+
+    @pytest.mark.parametrize("min_pct", [0, 0.5, 0.8, 1])
+    def test_match_row_wise(self, min_pct):
+        df = _create_df(n=200, pct_nan=0.4)
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        df_filtered, df_pct = pp.filter_groups(df=df, groups=GROUPS, min_pct=min_pct, return_pct=True)
+        dict_group_qcols = ut.get_dict_group_qcols(df=df, groups=GROUPS, str_quant=ut.STR_QUANT)
+        pct = np.array([[row[cols].notnull().mean() for cols in dict_group_qcols.values()] for _, row in df.iterrows()])
+        mask = (pct >= min_pct).any(axis=1)
+        assert df_filtered[ut.COL_PROT_ID].to_list() == df.loc[mask, ut.COL_PROT_ID].to_list()
+        assert list(df_pct) == GROUPS and np.allclose(df_pct.to_numpy(), pct[mask])
+        assert pp.filter_groups(df=df, groups=GROUPS, min_pct=min_pct).equals(df_filtered)
+
+    def test_invalid_input(self, df_quant):
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        with pytest.raises(ValueError):
+            pp.filter_groups(df=df_quant, groups=GROUPS, min_pct=1.5)
+        with pytest.raises(ValueError):
+            pp.filter_groups(df=df_quant, groups=GROUPS, return_pct="yes")
+
+
+class TestFilterDuplicatedNames:
+    """Test filtering of duplicated (split) names"""
+
+    @staticmethod
+    def _create_df_names():
+        names = ["A;B", "B", "A", None, datetime(2020, 3, 1), 1.5, 7, "C", "B;A", 7, "C"]
+        return pd.DataFrame({"name": names, "val": range(len(names))}, index=[f"r{i}" for i in range(len(names))])
+
+    @pytest.mark.parametrize("split_names", [False, True])
+    def test_match_row_wise(self, split_names):
+        df = self._create_df_names()
+        x = df["name"].dropna()
+        if split_names:
+            x = x.apply(lambda v: v.split(";")[0] if isinstance(v, str) else v)
+        x = x[x.apply(lambda v: not isinstance(v, (datetime, float)))]
+        index_kept = x.drop_duplicates(keep="first").index
+        index_dropped = x.index.difference(index_kept, sort=False)
+        df_filtered, index_out = xo.PreProcess.filter_duplicated_names(df=df, col="name", split_names=split_names,
+                                                                       return_dropped=True)
+        assert df_filtered["val"].to_list() == df.loc[index_kept, "val"].to_list()
+        assert df_filtered["name"].to_list() == x[index_kept].to_list()
+        assert list(index_out) == list(index_dropped)
+        df_only = xo.PreProcess.filter_duplicated_names(df=df, col="name", split_names=split_names)
+        assert df_only.equals(df_filtered)
+
+    def test_invalid_input(self):
+        df = self._create_df_names()
+        with pytest.raises(ValueError):
+            xo.PreProcess.filter_duplicated_names(df=df, col="name", return_dropped="yes")
+
+
+class TestApplyTransforms:
+    """Test logarithmic and exponential transformations"""
+
+    @staticmethod
+    def _create_df_vals(dtype=float):
+        X = np.array([[1, 4, np.nan], [8, 0.5, 100], [2, 16, 10]], dtype=dtype)
+        df = pd.DataFrame(X, columns=["a", "b", "c"])
+        df["name"] = ["x", "y", "z"]
+        return df
+
+    @pytest.mark.parametrize("log2", [True, False])
+    @pytest.mark.parametrize("neg", [True, False])
+    def test_log_exp(self, log2, neg):
+        df = self._create_df_vals()
+        cols = ["a", "b", "c"]
+        df_log = xo.PreProcess.apply_log(df=df, cols=cols, log2=log2, neg=neg, inplace=False)
+        x_log = (np.log2 if log2 else np.log10)(df[cols].to_numpy()) * (-1 if neg else 1)
+        assert np.allclose(df_log[cols].to_numpy(), x_log, equal_nan=True)
+        assert df_log["name"].equals(df["name"])
+        df_exp = xo.PreProcess.apply_exp(df=df_log, cols=cols, base=2 if log2 else 10, neg=neg, inplace=False)
+        assert np.allclose(df_exp[cols].to_numpy(), df[cols].to_numpy(), equal_nan=True)
+
+    def test_inplace_and_dtype(self):
+        df = self._create_df_vals()
+        df_log = xo.PreProcess.apply_log(df=df, cols=["a", "b"], inplace=False)
+        assert df["a"].to_list()[:2] == [1, 8] and df_log["a"].to_list()[:2] == [0, 3]
+        # Transformed in place by default
+        xo.PreProcess.apply_log(df=df, cols=["a", "b"])
+        assert df["a"].to_list()[:2] == [0, 3]
+        df_32 = self._create_df_vals(dtype=np.float32)
+        assert xo.PreProcess.apply_log(df=df_32, cols=["a"], inplace=False)["a"].dtype == np.float32
+        assert xo.PreProcess.apply_exp(df=df_32, cols=["a"], inplace=False)["a"].dtype == np.float32
+        assert xo.PreProcess.apply_log(df=df_32, cols=["a"], dtype="float64", inplace=False)["a"].dtype == np.float64
+
+    def test_invalid(self):
+        df = self._create_df_vals()
+        df.loc[0, "a"], df.loc[1, "b"] = 0, -1
+        with pytest.raises(ValueError):
+            xo.PreProcess.apply_log(df=df, cols=["a", "b"])
+        df_nan = xo.PreProcess.apply_log(df=df, cols=["a", "b"], invalid="nan", inplace=False)
+        assert np.isnan(df_nan.loc[0, "a"]) and np.isnan(df_nan.loc[1, "b"]) and df_nan.loc[1, "a"] == 3
+        df_ignore = xo.PreProcess.apply_log(df=df, cols=["a"], invalid="ignore", inplace=False)
+        assert np.isneginf(df_ignore.loc[0, "a"])
+        assert np.isneginf(xo.PreProcess.apply_log(df=df, cols=["a"], inplace=False).loc[0, "a"])
+        assert df.loc[1, "b"] == -1
+        with pytest.raises(ValueError):
+            xo.PreProcess.apply_log(df=df, cols=["a"], invalid="clip")
+        with pytest.raises(ValueError):
+            xo.PreProcess.apply_log(df=df, cols=["a"], dtype="int8")
+
+
+class TestAddSignificance:
+    """Test significance classification of fold changes and p-values"""
+
+    def test_match_row_wise(self, df_quant):
+        df_fc = xo.PreProcess(str_quant=ut.STR_QUANT).run(df=df_quant, groups=GROUPS)
+        col_fc, col_pval = f"{ut.STR_FC}_(A/B)", f"{ut.STR_PVAL}_(A/B)"
+        df_fc.loc[0, col_fc] = np.nan
+        df = xo.PreProcess.add_significance(df=df_fc.copy(), col_fc=col_fc, col_pval=col_pval, th_fc=0.5, th_pval=0.1)
+        th_pval = -np.log10(0.1)
+        sig_classes = [ut.STR_NON_SIG if row[col_pval] < th_pval else ut.STR_SIG_POS if row[col_fc] >= 0.5
+                       else ut.STR_SIG_NEG if row[col_fc] <= -0.5 else ut.STR_NON_SIG for _, row in df_fc.iterrows()]
+        assert isinstance(df[ut.COL_SIG_CLASS].dtype, pd.CategoricalDtype)
+        assert df[ut.COL_SIG_CLASS].to_list() == sig_classes
+
+    def test_contrasts(self, df_quant):
+        df_fc = xo.PreProcess(str_quant=ut.STR_QUANT).run(df=df_quant, groups=GROUPS)
+        df = xo.PreProcess.add_significance_contrasts(df=df_fc, th_fc=0.3, th_pval=0.2)
+        contrasts = [c.replace(f"{ut.STR_FC}_", "") for c in df_fc if c.startswith(ut.STR_FC)]
+        assert len(contrasts) == 3 and len(df.columns) == len(df_fc.columns) + 3
+        for c in contrasts:
+            df_single = xo.PreProcess.add_significance(df=df_fc.copy(), col_fc=f"{ut.STR_FC}_{c}",
+                                                       col_pval=f"{ut.STR_PVAL}_{c}", th_fc=0.3, th_pval=0.2)
+            assert df[f"{ut.COL_SIG_CLASS}_{c}"].equals(df_single[ut.COL_SIG_CLASS].rename(f"{ut.COL_SIG_CLASS}_{c}"))
+        with pytest.raises(ValueError):
+            xo.PreProcess.add_significance_contrasts(df=df_quant)
+
+class TestRun:
+    """Test PreProcess.run method"""
+
+    def test_basic(self, df_quant):
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        df_fc = pp.run(df=df_quant, groups=GROUPS)
+        n_contrasts = len(GROUPS) * (len(GROUPS) - 1) // 2
+        assert df_fc.shape == (len(df_quant), 2 + 2 * n_contrasts)
+        assert f"{ut.STR_FC}_(A/B)" in df_fc and f"{ut.STR_PVAL}_(A/B)" in df_fc
+
+    def test_match_ttest(self, df_quant):
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        df_fc = pp.run(df=df_quant, groups=GROUPS, pvals_neg_log10=False)
+        cols_a = [c for c in df_quant if "_A_" in c]
+        cols_b = [c for c in df_quant if "_B_" in c]
+        _, p_vals = ttest_ind(df_quant[cols_a], df_quant[cols_b], axis=1, nan_policy="omit")
+        fc = df_quant[cols_b].mean(axis=1) - df_quant[cols_a].mean(axis=1)
+        assert np.allclose(df_fc[f"{ut.STR_PVAL}_(A/B)"], p_vals, equal_nan=True)
+        assert np.allclose(df_fc[f"{ut.STR_FC}_(A/B)"], fc, equal_nan=True)
+
+
+    @pytest.mark.parametrize("pct_nan", [0.5, 0.8])
+    def test_match_ttest_many_nans(self, pct_nan):
+        # Groups with one or no detected value per protein
+        df = _create_df(n=300, pct_nan=pct_nan, seed=1)
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        df_fc = pp.run(df=df, groups=GROUPS, groups_ctrl=["C"], pvals_neg_log10=False)
+        for group in ["A", "B"]:
+            cols = [c for c in df if f"_{group}_" in c]
+            cols_ctrl = [c for c in df if "_C_" in c]
+            _, p_vals = ttest_ind(df[cols], df[cols_ctrl], axis=1, nan_policy="omit")
+            assert np.allclose(df_fc[f"{ut.STR_PVAL}_({group}/C)"], p_vals, equal_nan=True)
+
+    def test_dtype_option(self, df_quant):
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        options["dtype"] = "float32"
+        try:
+            df_fc = pp.run(df=df_quant, groups=GROUPS)
+        finally:
+            options["dtype"] = "float64"
+        df_fc_64 = pp.run(df=df_quant, groups=GROUPS)
+        cols = [c for c in df_fc if c.startswith((ut.STR_FC, ut.STR_PVAL))]
+        assert (df_fc[cols].dtypes == np.float32).all()
+        assert np.allclose(df_fc[cols], df_fc_64[cols], atol=1e-4, equal_nan=True)
+
+
+class TestRunTests:
+    """Test t-test modes of PreProcess.run method"""
+
+    @pytest.mark.parametrize("pct_nan", [0.1, 0.6])
+    def test_match_scipy(self, pct_nan):
+        df = _create_df(n=300, pct_nan=pct_nan, seed=1)
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        cols_a = [c for c in df if "_A_" in c]
+        cols_b = [c for c in df if "_B_" in c]
+        col_pval = f"{ut.STR_PVAL}_(A/B)"
+        df_welch = pp.run(df=df, groups=GROUPS, pvals_neg_log10=False, test="welch")
+        _, p_vals = ttest_ind(df[cols_a], df[cols_b], axis=1, nan_policy="omit", equal_var=False)
+        assert np.allclose(df_welch[col_pval], p_vals, equal_nan=True)
+        df_paired = pp.run(df=df, groups=GROUPS, pvals_neg_log10=False, test="paired")
+        _, p_vals = ttest_rel(df[cols_a], df[cols_b], axis=1, nan_policy="omit")
+        assert np.allclose(df_paired[col_pval], p_vals, equal_nan=True)
+
+    def test_moderated(self, df_complete):
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        df_mod = pp.run(df=df_complete, groups=GROUPS, test="moderated")
+        df_fc = pp.run(df=df_complete, groups=GROUPS)
+        cols = [c for c in df_fc if ut.STR_FC in c]
+        assert np.allclose(df_mod[cols], df_fc[cols])
+        assert df_mod[[c for c in df_fc if ut.STR_PVAL in c]].notna().all().all()
+
+    def test_moderated_zero_variance(self, df_complete):
+        # Low-resolution intensities: Most proteins have zero residual variance
+        df = df_complete.copy()
+        cols = [c for c in df if ut.STR_QUANT in c]
+        df[cols] = (df[cols] / 10).round() * 10
+        df.loc[:60, cols] = np.repeat(np.arange(len(GROUPS)), N_REPS) + 20.0
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        df_mod = pp.run(df=df, groups=GROUPS, pvals_neg_log10=False, test="moderated")
+        assert np.isfinite(df_mod[[c for c in df_mod if ut.STR_PVAL in c]].to_numpy()).all()
+        s2_prior, df_prior = get_prior_variance(s2=np.r_[np.zeros(60), np.random.default_rng(0).random(40)],
+                                                df=np.full(100, 6))
+        assert np.isfinite(s2_prior) and s2_prior > 0 and not np.isnan(df_prior)
+
+    def test_prior_variance(self):
+        rng = np.random.default_rng(0)
+        df_prior, s2_prior = 4, 0.5
+        sigma2 = s2_prior * df_prior / rng.chisquare(df_prior, size=20000)
+        s2 = sigma2 * rng.chisquare(6, size=20000) / 6
+        s2_est, df_est = get_prior_variance(s2=s2, df=np.full(20000, 6))
+        assert abs(s2_est - s2_prior) < 0.05
+        assert abs(df_est - df_prior) < 0.5
+        # Same variance for all proteins: Dispersion only due to sampling (large prior degrees of freedom)
+        s2_est, df_est = get_prior_variance(s2=2 * rng.chisquare(6, size=20000) / 6, df=np.full(20000, 6))
+        assert abs(s2_est - 2) < 0.05
+        assert df_est > 50
+
+    def test_invalid_test(self, df_quant):
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        with pytest.raises(ValueError):
+            pp.run(df=df_quant, groups=GROUPS, test="wilcoxon")
+        with pytest.raises(ValueError):
+            pp.run(df=df_quant.drop(columns=f"{ut.STR_QUANT}_A_0"), groups=GROUPS, test="paired")
+
+
+class TestCorrectPvals:
+    """Test vectorized multiple testing correction"""
+
+    @pytest.mark.parametrize("method", LIST_PVALS_METHODS)
+    def test_match_statsmodels(self, method):
+        rng = np.random.default_rng(0)
+        P = rng.random((200, 3)) ** 3
+        P[rng.random(P.shape) < 0.2] = np.nan
+        P[:20, 0] = P[25, 0]
+        mask = ~np.isnan(P)
+        P_adj = correct_pvals(P=P, method=method)
+        for i in range(P.shape[1]):
+            assert np.allclose(P_adj[mask[:, i], i], multipletests(P[mask[:, i], i], method=method)[1])
+        assert np.isnan(P_adj[~mask]).all()
+        P_adj = correct_pvals(P=P, method=method, family="global")
+        assert np.allclose(P_adj[mask], multipletests(P[mask], method=method)[1])
+
+    def test_run(self, df_quant):
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        df_fc = pp.run(df=df_quant, groups=GROUPS, pvals_neg_log10=False)
+        df_cor = pp.run(df=df_quant, groups=GROUPS, pvals_neg_log10=False, pvals_correction="fdr_bh")
+        df_glob = pp.run(df=df_quant, groups=GROUPS, pvals_neg_log10=False, pvals_correction="fdr_bh",
+                         pvals_family="global")
+        cols = [c for c in df_fc if ut.STR_PVAL in c]
+        assert np.allclose(df_cor[cols], correct_pvals(P=df_fc[cols].to_numpy(), method="fdr_bh"), equal_nan=True)
+        P_glob = correct_pvals(P=df_fc[cols].to_numpy(), method="fdr_bh", family="global")
+        assert np.allclose(df_glob[cols], P_glob, equal_nan=True)
+        with pytest.raises(ValueError):
+            pp.run(df=df_quant, groups=GROUPS, pvals_correction="fdr_bh", pvals_family="groups")
+
+
+
+class TestRunAnova:
+    """Test multi-group tests of PreProcess.run_anova"""
+
+    @pytest.mark.parametrize("test, func", [("anova", f_oneway), ("kruskal", kruskal)])
+    def test_match_scipy(self, df_quant, test, func):
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        df = df_quant.round(0)
+        df_anova = pp.run_anova(df=df, groups=GROUPS, test=test, pvals_neg_log10=False)
+        dict_group_qcols = ut.get_dict_group_qcols(df=df, groups=GROUPS, str_quant=ut.STR_QUANT)
+        for i in range(len(df)):
+            samples = [df.loc[i, cols].dropna().to_numpy(dtype=float) for cols in dict_group_qcols.values()]
+            stat, p_val = func(*samples)
+            assert np.isclose(df_anova.iloc[i, 2], stat) and np.isclose(df_anova.iloc[i, 3], p_val)
+
+    def test_filter(self, df_quant):
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        df_anova = pp.run_anova(df=df_quant, groups=GROUPS, pvals_correction="fdr_bh", th_pval=0.5)
+        assert 0 < len(df_anova) < len(df_quant)
+        assert (df_anova[ut.STR_PVAL] >= -np.log10(0.5)).all()
+        df_fc = pp.run(df=df_quant.loc[df_anova.index], groups=GROUPS)
+        assert df_fc[ut.COL_PROT_ID].to_list() == df_anova[ut.COL_PROT_ID].to_list()
+
+    def test_invalid_input(self, df_quant):
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        with pytest.raises(ValueError):
+            pp.run_anova(df=df_quant, groups=GROUPS, test="student")
+        with pytest.raises(ValueError):
+            pp.run_anova(df=df_quant, groups=GROUPS, th_pval=5)
+
+class TestRunSam:
+    """Test SAM statistics with permutation-based FDR"""
+
+    def test_basic(self, df_quant):
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        df_sam, df_th = pp.run_sam(df=df_quant, groups=GROUPS, n_permutations=50, random_state=0)
+        assert len(df_sam) == len(df_quant) and len(df_th) == 3
+        cols_q = [c for c in df_sam if ut.STR_QVAL in c]
+        assert len(cols_q) == 3
+        assert ((df_sam[cols_q] >= 0) & (df_sam[cols_q] <= 1)).to_numpy().all()
+        _df_sam, _df_th = pp.run_sam(df=df_quant, groups=GROUPS, n_permutations=50, random_state=0)
+        assert df_sam.equals(_df_sam) and df_th.equals(_df_th)
+
+    def test_match_loop(self):
+        rng = np.random.default_rng(1)
+        X = rng.normal(20, 1, (100, 7))
+        X[rng.random(X.shape) < 0.15] = np.nan
+        perms = rng.permuted(np.tile(np.arange(7), (20, 1)), axis=1)
+        x_diff, x_se, _ = _get_sam_stats(X1=X[:, :3], X2=X[:, 3:])
+        x_abs = np.abs(x_diff / (x_se + 0.1))
+        thresholds = x_abs[~np.isnan(x_abs)] * (1 - 1e-9)
+        X0 = np.nan_to_num(X - np.nanmean(X, axis=1, keepdims=True))
+        counts = _count_permuted(X0=X0, M=(~np.isnan(X)).astype(float), perms=perms, n1=3, s0=0.1,
+                                 thresholds=thresholds)
+        counts_loop = np.zeros(len(thresholds))
+        for p in perms:
+            diff, se, _ = _get_sam_stats(X1=X[:, p[:3]], X2=X[:, p[3:]])
+            d = np.abs(diff / (se + 0.1))
+            counts_loop += (d[~np.isnan(d)][:, np.newaxis] >= thresholds).sum(axis=0)
+        assert np.array_equal(counts, counts_loop)
+
+    def test_detect_signal(self):
+        df = _create_df(n=500, pct_nan=0, seed=1)
+        df.iloc[:50, 2:2 + N_REPS] += 10
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        df_sam, df_th = pp.run_sam(df=df, groups=GROUPS[:2], n_permutations=100, random_state=0)
+        is_sig = df_sam[f"{ut.STR_QVAL}_(A/B)"] <= 0.05
+        assert is_sig[:50].mean() > 0.8 and is_sig[50:].mean() < 0.05
+        c, s0, df_t = df_th.loc[0, ["c", "s0", "df"]]
+        y_curve = pp.get_sam_curve(x_fc=[0, c * s0, 2 * c * s0 + 1], c=c, s0=s0, df=int(df_t))
+        assert np.isnan(y_curve[:2]).all() and y_curve[2] > 0
+
+    def test_invalid_input(self, df_quant):
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        with pytest.raises(ValueError):
+            pp.run_sam(df=df_quant, groups=GROUPS, n_permutations=0)
+        with pytest.raises(ValueError):
+            pp.run_sam(df=df_quant, groups=GROUPS, fdr=2)
+        with pytest.raises(ValueError):
+            pp.run_sam(df=df_quant, groups=GROUPS, s0=-1)
+
+class TestRunPooled:
+    """Test PreProcess.run_pooled method (Rubin's rules)"""
+
+    def test_identical_imputations(self, df_complete):
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        cols_quant = pp.get_qcols(df=df_complete, groups=GROUPS)
+        X_imps = np.stack([df_complete[cols_quant].to_numpy()] * 5)
+        df_fc = pp.run(df=df_complete, groups=GROUPS, pvals_neg_log10=False)
+        df_pooled = pp.run_pooled(df=df_complete, X_imps=X_imps, groups=GROUPS, pvals_neg_log10=False)
+        assert list(df_fc) == list(df_pooled)
+        col_fc, col_pval = f"{ut.STR_FC}_(A/C)", f"{ut.STR_PVAL}_(A/C)"
+        assert np.allclose(df_fc[col_fc], df_pooled[col_fc])
+        # Only difference: small-sample adjustment of degrees of freedom
+        assert np.allclose(df_fc[col_pval], df_pooled[col_pval], atol=0.02)
+
+    def test_between_variance(self, df_complete):
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        cols_quant = pp.get_qcols(df=df_complete, groups=GROUPS)
+        X = df_complete[cols_quant].to_numpy()
+        rng = np.random.default_rng(0)
+        X_imps = np.stack([X + rng.normal(scale=0.5, size=X.shape) for _ in range(10)])
+        X_same = np.stack([X] * 10)
+        col_pval = f"{ut.STR_PVAL}_(A/B)"
+        p_vals = pp.run_pooled(df=df_complete, X_imps=X_imps, groups=GROUPS, pvals_neg_log10=False)[col_pval]
+        p_vals_same = pp.run_pooled(df=df_complete, X_imps=X_same, groups=GROUPS, pvals_neg_log10=False)[col_pval]
+        assert p_vals.between(0, 1).all()
+        assert p_vals.median() > p_vals_same.median()
+
+    def test_with_cimpute(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        X_imps = ci.run(df=df_quant, groups=GROUPS, min_cs=0, n_imputations=3, random_state=0)
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        df_fc = pp.run_pooled(df=df_quant, X_imps=X_imps, groups=GROUPS)
+        assert len(df_fc) == len(df_quant)
+
+    def test_invalid_shape(self, df_quant):
+        pp = xo.PreProcess(str_quant=ut.STR_QUANT)
+        with pytest.raises(ValueError):
+            pp.run_pooled(df=df_quant, X_imps=np.zeros((2, 3, 4)), groups=GROUPS)
@@ -0,0 +1,332 @@
+"""
+This is a script for testing the cImpute class and its backend.
+"""
+import pytest
+import numpy as np
+import pandas as pd
+
+import xomics as xo
+import xomics.utils as ut
+from xomics.config import options
+from xomics.imputation._backend.knn import knn_impute, get_chunk_size
+from xomics.imputation._backend.cimpute import get_mv_codes, get_mv_codes_groups, get_cs
+
+GROUPS = ["A", "B", "C"]
+N_REPS = 4
+
+
+def _classify_of_mvs_loop(df_group=None, up_mnar=None):
+    """Row-wise reference implementation of the missing value classification"""
+    n = len(list(df_group))
+    mv_classes = []
+    for i, row in df_group.iterrows():
+        n_nan = row.isnull().sum()
+        n_higher = np.array(row > up_mnar).sum()
+        n_lower_or_equal = np.array(row <= up_mnar).sum()
+        if n_nan == 0:
+            mv_classes.append(ut.STR_NM)
+        elif n_lower_or_equal + n_nan == n:
+            mv_classes.append(ut.STR_MNAR)
+        elif n_higher + n_nan == n:
+            mv_classes.append(ut.STR_MCAR)
+        else:
+            mv_classes.append(ut.STR_MAR)
+    return mv_classes
+
+
+def _create_df(n=200, n_reps=4, pct_nan=0.3, seed=0):
+    """Create DataFrame with quantifications including missing values"""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(loc=20, scale=3, size=(n, len(GROUPS) * n_reps))
+    X[rng.random(X.shape) < pct_nan] = np.nan
+    cols = [f"{ut.STR_QUANT}_{g}_{i}" for g in GROUPS for i in range(n_reps)]
+    df = pd.DataFrame(X, columns=cols)
+    df.insert(0, ut.COL_PROT_ID, [f"P{i}" for i in range(n)])
+    return df
+
+
+@pytest.fixture(scope="module")
+def df_quant():
+    return _create_df()
+
+
+class TestClassifyMVs:
+    """Test vectorized classification of missing values"""
+
+    @pytest.mark.parametrize("up_mnar", [14, 18, 20, 25])
+    def test_match_row_wise_classification(self, df_quant, up_mnar):
+        df_group = df_quant[[c for c in df_quant if "_A_" in c]]
+        mv_codes = get_mv_codes(X=df_group.to_numpy(), up_mnar=up_mnar)
+        assert [ut.LIST_MV_CLASSES[i] for i in mv_codes] == _classify_of_mvs_loop(df_group, up_mnar)
+
+    def test_all_classes(self):
+        X = np.array([[19, 20, 21], [10, np.nan, 11], [21, np.nan, 22], [10, np.nan, 22], [np.nan] * 3])
+        labels = [ut.LIST_MV_CLASSES[i] for i in get_mv_codes(X=X, up_mnar=15)]
+        assert labels == [ut.STR_NM, ut.STR_MNAR, ut.STR_MCAR, ut.STR_MAR, ut.STR_MNAR]
+
+    def test_3d_groups(self, df_quant):
+        X = df_quant.drop(columns=ut.COL_PROT_ID).to_numpy()
+        list_group_pos = [np.arange(4) + 4 * i for i in range(3)]
+        mv_codes = get_mv_codes_groups(X=X, list_group_pos=list_group_pos, up_mnar=19)
+        assert mv_codes.shape == (len(X), 3)
+        for i, pos in enumerate(list_group_pos):
+            assert np.array_equal(mv_codes[:, i], get_mv_codes(X=X[:, pos], up_mnar=19))
+
+    def test_unequal_groups(self, df_quant):
+        X = df_quant.drop(columns=ut.COL_PROT_ID).to_numpy()
+        list_group_pos = [np.arange(3), np.arange(3, 12)]
+        mv_codes = get_mv_codes_groups(X=X, list_group_pos=list_group_pos, up_mnar=19)
+        assert np.array_equal(mv_codes[:, 1], get_mv_codes(X=X[:, 3:], up_mnar=19))
+
+
+class TestComputeCS:
+    """Test vectorized computation of confidence scores"""
+
+    @pytest.mark.parametrize("n_reps", [1, 3, 4, 7, 8])
+    def test_match_scalar_cs(self, n_reps):
+        df = _create_df(n=300, n_reps=n_reps, pct_nan=0.4, seed=n_reps)
+        df_group = df[[c for c in df if "_B_" in c]]
+        X = df_group.to_numpy()
+        mv_codes = get_mv_codes(X=X, up_mnar=19)
+        mv_classes = [ut.LIST_MV_CLASSES[i] for i in mv_codes]
+        n_nan = df_group.isnull().sum(axis=1).to_numpy()
+        dict_cs = {ut.STR_NM: lambda k: 1, ut.STR_MAR: lambda k: 0,
+                   ut.STR_MCAR: lambda k: round((n_reps - k) / n_reps, 2),
+                   ut.STR_MNAR: lambda k: round(k / n_reps, 2)}
+        expected = [dict_cs[mv_class](k) for mv_class, k in zip(mv_classes, n_nan)]
+        assert np.allclose(get_cs(X=X, mv_codes=mv_codes), expected)
+
+    def test_duplicated_ids(self):
+        X = np.array([[19, 20, 21], [10, np.nan, 11], [21, np.nan, np.nan]])
+        df_group = pd.DataFrame(X, index=["P1", "P1", "P1"])
+        cs = get_cs(X=df_group.to_numpy(), mv_codes=get_mv_codes(X=df_group.to_numpy(), up_mnar=15))
+        assert np.allclose(cs, [1, 0.33, 0.33])
+
+    def test_aligned_to_codes(self):
+        X = np.array([[np.nan, 20, 21], [10, np.nan, 22]])
+        cs = get_cs(X=X, mv_codes=get_mv_codes(X=X, up_mnar=15))
+        assert isinstance(cs, np.ndarray)
+        assert np.allclose(cs, [0.67, 0])
+
+
+class TestKNNBackends:
+    """Test nearest neighbour backends for MCAR imputation"""
+
+    @pytest.mark.parametrize("n_neighbors", [1, 3, 5])
+    def test_chunked_exact(self, df_quant, n_neighbors):
+        X = df_quant.drop(columns=ut.COL_PROT_ID).to_numpy()
+        X_brute = knn_impute(X=X, n_neighbors=n_neighbors, knn_backend="brute")
+        X_chunked = knn_impute(X=X, n_neighbors=n_neighbors, knn_backend="chunked")
+        assert np.allclose(X_brute, X_chunked, equal_nan=True)
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 64, 10000])
+    def test_chunk_size(self, df_quant, chunk_size):
+        X = df_quant.drop(columns=ut.COL_PROT_ID).to_numpy()
+        X_brute = knn_impute(X=X, knn_backend="brute")
+        X_chunked = knn_impute(X=X, knn_backend="chunked", chunk_size=chunk_size)
+        assert np.allclose(X_brute, X_chunked, equal_nan=True)
+
+    def test_max_memory_mb(self):
+        assert get_chunk_size(n_ref=50000, max_memory_mb=256) == 256 * 2 ** 20 // (50000 * 8 * 6)
+        assert get_chunk_size(n_ref=50000, max_memory_mb=0.001) == 1
+        assert get_chunk_size(n_ref=50000, chunk_size=10, max_memory_mb=256) == 10
+
+    def test_tree_complete(self, df_quant):
+        X = df_quant.drop(columns=ut.COL_PROT_ID).to_numpy()
+        X_tree = knn_impute(X=X, knn_backend="tree")
+        assert not np.isnan(X_tree).any()
+        assert np.array_equal(X_tree[~np.isnan(X)], X[~np.isnan(X)])
+
+    def test_empty_column(self):
+        X = np.array([[1, np.nan, 2], [2, np.nan, 3], [np.nan, np.nan, 4]])
+        for knn_backend in ["brute", "chunked", "tree"]:
+            X_imp = knn_impute(X=X, n_neighbors=2, knn_backend=knn_backend)
+            assert np.isnan(X_imp[:, 1]).all()
+            assert not np.isnan(X_imp[:, [0, 2]]).any()
+
+    def test_eval_knn_backends(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        df_eval = ci.eval_knn_backends(df=df_quant, groups=GROUPS, loc_pct_upmnar=0.1)
+        assert list(df_eval["knn_backend"]) == ["brute", "chunked", "tree"]
+        assert np.allclose(df_eval["rmse"].iloc[:2], 0)
+
+    def test_run_chunked(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        df_imp = ci.run(df=df_quant, groups=GROUPS, knn_backend="chunked", max_memory_mb=0.01)
+        assert len(df_imp) == len(df_quant)
+        with pytest.raises(ValueError):
+            ci.run(df=df_quant, groups=GROUPS, knn_backend="chunked", chunk_size=0)
+
+    def test_invalid_knn_backend(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        with pytest.raises(ValueError):
+            ci.run(df=df_quant, groups=GROUPS, knn_backend="ball")
+
+
+class TestCImputeRun:
+    """Test cImpute.run method"""
+
+    def test_basic(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        df_imp = ci.run(df=df_quant, groups=GROUPS)
+        assert isinstance(df_imp, pd.DataFrame)
+        assert len(df_imp) == len(df_quant)
+        assert all(f"MV_{g}" in df_imp for g in GROUPS)
+        assert all(f"CS_{g}" in df_imp for g in GROUPS)
+        assert set(df_imp[f"MV_{GROUPS[0]}"]).issubset(ut.LIST_MV_CLASSES)
+
+    def test_detected_values_kept(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        df_imp = ci.run(df=df_quant, groups=GROUPS, random_state=0)
+        cols_quant = ut.get_qcols(df=df_quant, groups=GROUPS, str_quant=ut.STR_QUANT)
+        X, X_imp = df_quant[cols_quant].to_numpy(), df_imp[cols_quant].to_numpy()
+        mask = ~np.isnan(X)
+        assert list(df_imp.index) == list(df_quant[ut.COL_PROT_ID])
+        assert np.array_equal(X[mask], X_imp[mask])
+        # Only proteins with CS >= min_cs (except of MAR) are imputed
+        for g in GROUPS:
+            cols = [c for c in cols_quant if f"_{g}_" in c]
+            is_imputed = (df_imp[f"CS_{g}"] >= 0.5) & (df_imp[f"MV_{g}"] != ut.STR_MAR)
+            assert not df_imp.loc[is_imputed.to_numpy(), cols].isna().any().any()
+
+    @pytest.mark.parametrize("n_jobs", [2, -1])
+    def test_n_jobs(self, df_quant, n_jobs):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        df_imp = ci.run(df=df_quant, groups=GROUPS, n_jobs=1)
+        df_imp_parallel = ci.run(df=df_quant, groups=GROUPS, n_jobs=n_jobs)
+        cols = [f"{x}_{g}" for x in ["CS", "MV"] for g in GROUPS]
+        pd.testing.assert_frame_equal(df_imp[cols], df_imp_parallel[cols])
+        assert np.array_equal(df_imp.isnull(), df_imp_parallel.isnull())
+
+    def test_random_state(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        df_imp = ci.run(df=df_quant, groups=GROUPS, random_state=42)
+        pd.testing.assert_frame_equal(df_imp, ci.run(df=df_quant, groups=GROUPS, random_state=42))
+        pd.testing.assert_frame_equal(df_imp, ci.run(df=df_quant, groups=GROUPS, random_state=42, n_jobs=2))
+        assert not df_imp.equals(ci.run(df=df_quant, groups=GROUPS, random_state=1))
+
+    def test_random_state_option(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        options["random_state"] = 42
+        try:
+            df_imp = ci.run(df=df_quant, groups=GROUPS, random_state=1)
+        finally:
+            options["random_state"] = "off"
+        pd.testing.assert_frame_equal(df_imp, ci.run(df=df_quant, groups=GROUPS, random_state=42))
+
+    def test_dtype_option(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        cols_quant = ut.get_qcols(df=df_quant, groups=GROUPS, str_quant=ut.STR_QUANT)
+        options["dtype"] = "float32"
+        try:
+            df_imp = ci.run(df=df_quant, groups=GROUPS, knn_backend="chunked", random_state=0)
+            df_trans = ci.fit(df=df_quant, groups=GROUPS).transform(df=df_quant, random_state=0)
+        finally:
+            options["dtype"] = "float64"
+        df_imp_64 = ci.run(df=df_quant, groups=GROUPS, knn_backend="chunked", random_state=0)
+        assert (df_imp[cols_quant].dtypes == np.float32).all()
+        assert (df_trans[cols_quant].dtypes == np.float32).all()
+        assert (df_imp_64[cols_quant].dtypes == np.float64).all()
+        assert np.allclose(df_imp[cols_quant], df_imp_64[cols_quant], atol=1e-4, equal_nan=True)
+        with pytest.raises(ValueError):
+            options["dtype"] = "int8"
+
+    def test_mnar_within_limits(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        d_min, up_mnar, _ = ci.get_limits(df=df_quant, groups=GROUPS, loc_pct_upmnar=0.5)
+        df_imp = ci.run(df=df_quant, groups=GROUPS, loc_pct_upmnar=0.5, random_state=0)
+        cols = [c for c in df_quant if "_A_" in c]
+        mask = ((df_imp["MV_A"] == ut.STR_MNAR) & (df_imp["CS_A"] >= 0.5)).to_numpy()[:, None]
+        mask = mask & df_quant[cols].isnull().to_numpy()
+        vals = df_imp[cols].to_numpy()[mask]
+        assert len(vals) > 0
+        assert np.all((vals >= d_min) & (vals <= d_min + up_mnar - d_min / 2))
+
+    def test_n_imputations(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        X_imps = ci.run(df=df_quant, groups=GROUPS, loc_pct_upmnar=0.5, n_imputations=4, random_state=0)
+        df_imp = ci.run(df=df_quant, groups=GROUPS, loc_pct_upmnar=0.5, random_state=0)
+        cols_quant = [c for c in df_quant if ut.STR_QUANT in c]
+        assert X_imps.shape == (4, len(df_quant), len(cols_quant))
+        assert X_imps.dtype == np.float32
+        # Missing values are identical and only MNAR values differ between imputations
+        assert np.array_equal(np.isnan(X_imps[0]), df_imp[cols_quant].isnull().to_numpy())
+        mask_mnar = (df_imp["MV_A"] == ut.STR_MNAR).to_numpy()
+        diff = np.nan_to_num(X_imps[0] - X_imps[1])
+        assert np.all(diff[~mask_mnar][:, :N_REPS] == 0)
+        assert np.any(diff[mask_mnar] != 0)
+
+    def test_n_jobs_no_multiprocessing(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        options["allow_multiprocessing"] = False
+        try:
+            df_imp = ci.run(df=df_quant, groups=GROUPS, n_jobs=4)
+        finally:
+            options["allow_multiprocessing"] = True
+        assert len(df_imp) == len(df_quant)
+
+    def test_invalid_min_cs(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        with pytest.raises(ValueError):
+            ci.run(df=df_quant, groups=GROUPS, min_cs=2)
+
+
+class TestCImputeFitTransform:
+    """Test cImpute.fit, cImpute.transform, and persistence of the fitted model"""
+
+    def test_transform_fitted_data(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        df_imp = ci.run(df=df_quant, groups=GROUPS, knn_backend="chunked", random_state=0)
+        df_trans = ci.fit(df=df_quant, groups=GROUPS).transform(df=df_quant, random_state=0)
+        assert list(df_imp) == list(df_trans)
+        cols = [f"{x}_{g}" for x in ["CS", "MV"] for g in GROUPS]
+        pd.testing.assert_frame_equal(df_imp[cols], df_trans[cols])
+        # KNN imputed values equal to imputation from scratch
+        for g in GROUPS:
+            cols_g = [c for c in df_quant if f"_{g}_" in c]
+            mask = (df_imp[f"MV_{g}"] == ut.STR_MCAR).to_numpy()
+            assert np.allclose(df_imp[cols_g][mask], df_trans[cols_g][mask], equal_nan=True)
+
+    @pytest.mark.parametrize("min_cs", [0, 0.5])
+    def test_transform_equals_run(self, df_quant, min_cs):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        df_imp = ci.run(df=df_quant, groups=GROUPS, min_cs=min_cs, knn_backend="chunked", random_state=0)
+        df_trans = ci.fit(df=df_quant, groups=GROUPS, min_cs=min_cs).transform(df=df_quant, random_state=0)
+        pd.testing.assert_frame_equal(df_imp, df_trans)
+
+    def test_transform_chunk_size(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT)
+        ci.fit(df=df_quant, groups=GROUPS, chunk_size=3, max_memory_mb=0.5)
+        assert int(ci.model["chunk_size"]) == 3 and float(ci.model["max_memory_mb"]) == 0.5
+        df_new = _create_df(n=50, seed=1)
+        df_new[ut.COL_PROT_ID] = [f"N{i}" for i in range(50)]
+        df_trans = ci.transform(df=df_new, random_state=0)
+        ci.model.update(chunk_size=np.int64(0), max_memory_mb=np.float64(np.nan))
+        pd.testing.assert_frame_equal(df_trans, ci.transform(df=df_new, random_state=0))
+
+    def test_transform_new_proteins(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT).fit(df=df_quant, groups=GROUPS)
+        df_new = _create_df(n=50, seed=1)
+        df_new[ut.COL_PROT_ID] = [f"N{i}" for i in range(50)]
+        df_trans = ci.transform(df=df_new)
+        assert len(df_trans) == 50
+        mask = (df_trans["MV_A"] == ut.STR_MCAR) & (df_trans["CS_A"] >= 0.5)
+        assert not df_trans.loc[mask, [c for c in df_new if "_A_" in c]].isnull().any().any()
+
+    def test_save_load(self, df_quant, tmp_path):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT).fit(df=df_quant, groups=GROUPS)
+        file_path = str(tmp_path / "model.npz")
+        ci.save_model(file_path=file_path)
+        ci_loaded = xo.cImpute(str_quant=ut.STR_QUANT).load_model(file_path=file_path)
+        assert set(ci.model) == set(ci_loaded.model)
+        pd.testing.assert_frame_equal(ci.transform(df=df_quant, random_state=0),
+                                      ci_loaded.transform(df=df_quant, random_state=0))
+
+    def test_not_fitted(self, df_quant):
+        with pytest.raises(ValueError):
+            xo.cImpute(str_quant=ut.STR_QUANT).transform(df=df_quant)
+
+    def test_missing_columns(self, df_quant):
+        ci = xo.cImpute(str_quant=ut.STR_QUANT).fit(df=df_quant, groups=GROUPS)
+        with pytest.raises(ValueError):
+            ci.transform(df=df_quant.drop(columns=df_quant.columns[1]))
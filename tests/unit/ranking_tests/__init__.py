@@ -1,32 +1,3 @@
 """
-This is a script for ...
+This is a script for ranking tests.
 """
-import time
-import pandas as pd
-import numpy as np
-
-import scripts._utils as ut
-
-# Settings
-pd.set_option('expand_frame_repr', False)  # Single line print for pd.Dataframe
-
-
-# I Helper Functions
-
-
-# II Main Functions
-
-
-# III Test/Caller Functions
-
-
-# IV Main
-def main():
-    t0 = time.time()
-
-    t1 = time.time()
-    print("Time:", t1 - t0)
-
-
-if __name__ == "__main__":
-    main()
@@ -9,7 +9,7 @@ import xomics as xo
 # Test xo.e_hits function
 class TestEHits:
     def test_basic_functionality(self):
-        result = xo.e_hits(
+        result = xo.pRank.e_hits(
             ids=['gene1', 'gene2', 'gene3'],
             id_lists=[['gene1', 'gene2'], ['gene2', 'gene3']],
             terms=['term1', 'term2'],
@@ -21,22 +21,22 @@ class TestEHits:
 
     def test_empty_input(self):
         with pytest.raises(ValueError):
-            xo.e_hits(ids=[], id_lists=[], terms=[])
+            xo.pRank.e_hits(ids=[], id_lists=[], terms=[])
 
     #def test_invalid_id(self):
     #    with pytest.raises(ValueError):
-    #        xo.e_hits(ids=['gene4'], id_lists=[['gene1', 'gene2'], ['gene2', 'gene3']], list_terms=['term1', 'term2'])
+    #        xo.pRank.e_hits(ids=['gene4'], id_lists=[['gene1', 'gene2'], ['gene2', 'gene3']], list_terms=['term1', 'term2'])
 
     def test_invalid_term_length(self):
         with pytest.raises(ValueError):
-            xo.e_hits(ids=['gene1', 'gene2', 'gene3'], id_lists=[['gene1', 'gene2'], ['gene2', 'gene3']], terms=['term1'])
+            xo.pRank.e_hits(ids=['gene1', 'gene2', 'gene3'], id_lists=[['gene1', 'gene2'], ['gene2', 'gene3']], terms=['term1'])
 
     def test_non_list_id_lists(self):
         with pytest.raises(ValueError):
-            xo.e_hits(ids=['gene1', 'gene2', 'gene3'], id_lists=['gene1', 'gene2', 'gene3'], terms=['term1', 'term2'])
+            xo.pRank.e_hits(ids=['gene1', 'gene2', 'gene3'], id_lists=['gene1', 'gene2', 'gene3'], terms=['term1', 'term2'])
 
     def test_valid_n_ids(self):
-        result = xo.e_hits(
+        result = xo.pRank.e_hits(
             ids=['gene1', 'gene2', 'gene3'],
             id_lists=[['gene1', 'gene2'], ['gene2', 'gene3']],
             terms=['term1', 'term2'],
@@ -46,7 +46,7 @@ class TestEHits:
         assert result.shape == (2, 2)
 
     def test_valid_n_terms(self):
-        result = xo.e_hits(
+        result = xo.pRank.e_hits(
             ids=['gene1', 'gene2', 'gene3'],
             id_lists=[['gene1', 'gene2'], ['gene2', 'gene3']],
             terms=['term1', 'term2'],
@@ -56,7 +56,7 @@ class TestEHits:
         assert result.shape == (1, 3)
 
     def test_valid_n_ids_and_n_terms(self):
-        result = xo.e_hits(
+        result = xo.pRank.e_hits(
             ids=['gene1', 'gene2', 'gene3'],
             id_lists=[['gene1', 'gene2'], ['gene2', 'gene3']],
             terms=['term1', 'term2'],
@@ -67,8 +67,32 @@ class TestEHits:
 
     def test_invalid_n_ids(self):
         with pytest.raises(ValueError):
-            xo.e_hits(ids=['gene1', 'gene2', 'gene3'], id_lists=[['gene1', 'gene2'], ['gene2', 'gene3']], terms=['term1', 'term2'], n_ids=-1)
+            xo.pRank.e_hits(ids=['gene1', 'gene2', 'gene3'], id_lists=[['gene1', 'gene2'], ['gene2', 'gene3']], terms=['term1', 'term2'], n_ids=-1)
 
     def test_invalid_n_terms(self):
         with pytest.raises(ValueError):
-            xo.e_hits(ids=['gene1', 'gene2', 'gene3'], id_lists=[['gene1', 'gene2'], ['gene2', 'gene3']], terms=['term1', 'term2'], n_terms=-1)
+            xo.pRank.e_hits(ids=['gene1', 'gene2', 'gene3'], id_lists=[['gene1', 'gene2'], ['gene2', 'gene3']], terms=['term1', 'term2'], n_terms=-1)
+
+    def test_exact_matches(self):
+        # Ids are matched exactly and not as substrings (e.g., 'APP' in 'APPL1')
+        result = xo.pRank.e_hits(ids=['APP', 'APPL1', 'gene2'], id_lists=[['APPL1', 'gene2', 'gene2'], ['APP']],
+                                 terms=['term1', 'term2'])
+        assert result.values.tolist() == [[0, 1, 1], [1, 0, 0]]
+
+    def test_top_n_ordering(self):
+        ids = ['gene1', 'gene2', 'gene3', 'gene4']
+        id_lists = [['gene3'], ['gene2', 'gene3'], ['gene1', 'gene2', 'gene3', 'gene4'], ['gene4', 'gene3']]
+        terms = ['term1', 'term2', 'term3', 'term4']
+        result = xo.pRank.e_hits(ids=ids, id_lists=id_lists, terms=terms, n_ids=3, n_terms=2)
+        assert list(result.columns) == ['gene3', 'gene2', 'gene4'] and list(result.index) == ['term3', 'term2']
+        result = xo.pRank.e_hits(ids=ids, id_lists=id_lists, terms=terms, n_ids=3, n_terms=2, sort_alpha=True)
+        assert list(result.columns) == ['gene2', 'gene3', 'gene4'] and list(result.index) == ['term2', 'term3']
+
+    def test_sparse_output(self):
+        args = dict(ids=['gene1', 'gene2', 'gene3'], id_lists=[['gene1', 'gene2'], ['gene2', 'gene3']],
+                    terms=['term1', 'term2'], n_ids=2)
+        result = xo.pRank.e_hits(**args)
+        result_sparse = xo.pRank.e_hits(**args, sparse=True)
+        assert all(isinstance(dtype, pd.SparseDtype) for dtype in result_sparse.dtypes)
+        assert result_sparse.sparse.to_dense().equals(result)
+        assert (result_sparse.sparse.to_coo().toarray() == result.values).all()
@@ -6,49 +6,63 @@ Recommended testing commands:
 """
 import pytest
 import numpy as np
+import pandas as pd
+from scipy.stats import beta
 
 import xomics as xo
+import xomics.utils as ut
+from xomics.ranking._backend.prank import get_hit_matrix, p_score, e_score, e_score_only_pvals
+from xomics.ranking._backend import rank_aggregation
 
 
 # Test p_score function
 class TestPScore:
+    @staticmethod
+    def _p_score(x_fc=None, x_pvals=None):
+        df_fc = pd.DataFrame({"fc": x_fc, "pval": x_pvals})
+        return xo.pRank.p_score(df_fc=df_fc, col_fc="fc", col_pval="pval")[ut.COL_P_SCORE].to_numpy()
+
     def test_basic(self):
         # Test basic functionality
-        result = xo.p_score(ids=['protein1', 'protein2'], x_fc=[2.4, 1.5], x_pvals=[0.05, 0.2])
+        result = self._p_score(x_fc=[2.4, 1.5], x_pvals=[0.05, 0.2])
         assert isinstance(result, np.ndarray)
         assert len(result) == 2
 
     def test_empty_input(self):
         # Test empty input
         with pytest.raises(ValueError):
-            xo.p_score(ids=[], x_fc=[], x_pvals=[])
+            self._p_score(x_fc=[], x_pvals=[])
 
-    def test_invalid_input_length(self):
-        # Test different lengths of inputs
+    def test_missing_columns(self):
+        # Test columns not in df_fc
         with pytest.raises(ValueError):
-            xo.p_score(ids=['protein1'], x_fc=[2.4, 1.5], x_pvals=[0.05])
+            xo.pRank.p_score(df_fc=pd.DataFrame({"fc": [2.4, 1.5]}), col_fc="fc", col_pval="pval")
 
     def test_non_numeric_input(self):
         # Test non-numeric input
         with pytest.raises(ValueError):
-            xo.p_score(ids=['protein1', 'protein2'], x_fc=['a', 'b'], x_pvals=[0.05, 0.2])
+            self._p_score(x_fc=['a', 'b'], x_pvals=[0.05, 0.2])
 
     def test_negative_values(self):
         # Test negative fold change values
-        result = xo.p_score(ids=['protein1', 'protein2'], x_fc=[-2.4, -1.5], x_pvals=[0.05, 0.2])
+        result = self._p_score(x_fc=[-2.4, -1.5], x_pvals=[0.05, 0.2])
         assert np.allclose(result, [1.0, 0.], atol=1e-2)
 
 
 # Test e_score function
 class TestEScore:
+    @staticmethod
+    def _e_score(names=None, name_lists=None, x_fe=None, x_pvals=None):
+        df_fc = pd.DataFrame({"name": names})
+        df_enrich = pd.DataFrame({"fe": x_fe, "pval": x_pvals, "names": name_lists})
+        df_fc = xo.pRank.e_score(df_fc=df_fc, col_name="name", df_enrich=df_enrich, col_fe="fe", col_pval="pval",
+                                 col_name_lists="names")
+        return df_fc[ut.COL_E_SCORE].to_numpy()
+
     def test_basic(self):
         # Test basic functionality
-        result = xo.e_score(
-            ids=['protein1', 'protein2'],
-            id_lists=[['protein1', 'protein2'], ['protein2']],
-            x_fe=[2, 1.5],
-            x_pvals=[0.05, 0.1]
-        )
+        result = self._e_score(names=['protein1', 'protein2'], name_lists=['protein1, protein2', 'protein2'],
+                               x_fe=[2, 1.5], x_pvals=[0.05, 0.1])
         assert isinstance(result, np.ndarray)
         assert len(result) == 2
         assert np.allclose(result, [0., 1.0], atol=1e-5)
@@ -56,39 +70,174 @@ class TestEScore:
     def test_empty_input(self):
         # Test empty input
         with pytest.raises(ValueError):
-            xo.e_score(ids=[], id_lists=[], x_fe=[], x_pvals=[])
+            self._e_score(names=[], name_lists=[], x_fe=[], x_pvals=[])
 
-    def test_invalid_input_length(self):
-        # Test different lengths of inputs
+    def test_missing_columns(self):
+        # Test columns not in df_enrich
+        df_enrich = pd.DataFrame({"pval": [0.05, 0.1], "names": ['protein1, protein2', 'protein2']})
         with pytest.raises(ValueError):
-            xo.e_score(ids=['protein1'], id_lists=[['protein1', 'protein2'], ['protein2']], x_fe=[2, 1.5], x_pvals=[0.05])
+            xo.pRank.e_score(df_fc=pd.DataFrame({"name": ['protein1']}), col_name="name", df_enrich=df_enrich,
+                             col_fe="fe", col_pval="pval", col_name_lists="names")
 
     def test_non_numeric_input(self):
         # Test non-numeric input
         with pytest.raises(ValueError):
-            xo.e_score(
-                ids=['protein1', 'protein2'],
-                id_lists=[['protein1', 'protein2'], ['protein2']],
-                x_fe=['a', 'b'],
-                x_pvals=[0.05, 0.1]
-            )
+            self._e_score(names=['protein1', 'protein2'], name_lists=['protein1, protein2', 'protein2'],
+                          x_fe=['a', 'b'], x_pvals=[0.05, 0.1])
 
     def test_negative_values(self):
-        # Test negative fold enrichment values
-        with pytest.raises(ValueError):
-            xo.e_score(
-                ids=['protein1', 'protein2'],
-                id_lists=[['protein1', 'protein2'], ['protein2']],
-                x_fe=[-2, -1.5],
-                x_pvals=[0.05, 0.1]
-            )
+        # Test negative fold enrichment values (absolute values are scored)
+        result = self._e_score(names=['protein1', 'protein2'], name_lists=['protein1, protein2', 'protein2'],
+                               x_fe=[-2, -1.5], x_pvals=[0.05, 0.1])
+        assert np.allclose(result, self._e_score(names=['protein1', 'protein2'],
+                                                 name_lists=['protein1, protein2', 'protein2'],
+                                                 x_fe=[2, 1.5], x_pvals=[0.05, 0.1]))
 
     def test_invalid_ids(self):
-        # Test for ids not in id_lists
-        result = xo.e_score(
-            ids=['protein3'],
-            id_lists=[['protein1', 'protein2'], ['protein2']],
-            x_fe=[2, 1.5],
-            x_pvals=[0.05, 0.1]
-        )
-        assert result == [0]
+        # Test for names not in name lists
+        result = self._e_score(names=['protein3'], name_lists=['protein1, protein2', 'protein2'],
+                               x_fe=[2, 1.5], x_pvals=[0.05, 0.1])
+        assert np.array_equal(result, [0])
+
+
+# Test sparse hit matrix of E score backend
+class TestHitMatrix:
+    def test_exact_matches(self):
+        # Names are matched exactly and not as substrings (e.g., 'APP' in 'APPL1')
+        x_hit, unique_ids = get_hit_matrix(name_lists=["APPL1, GENE2", "APP,GENE3, APP", np.nan])
+        assert unique_ids == ["APPL1", "GENE2", "APP", "GENE3"]
+        assert x_hit.shape == (3, 4)
+        assert np.array_equal(x_hit.toarray(), [[1, 1, 0, 0], [0, 0, 1, 1], [0, 0, 0, 0]])
+
+    def test_match_dense(self):
+        # Test sparse scoring against dense hit matrix
+        name_lists = ["A, B", "B, C, D", "A, D", "E"]
+        x_fe, x_pval = np.array([2, 1.5, 0.5, 1]), np.array([3, 1, 2, 4])
+        names = ["A", "B", "C", "D", "E", "F"]
+        result = e_score(names=names, name_lists=name_lists, x_fe=x_fe, x_pval=x_pval)
+        x_hit = np.array([[x in [n.strip() for n in s.split(",")] for x in names[:5]] for s in name_lists])
+        norm_fe = (x_fe - x_fe.mean()) / x_fe.std()
+        norm_pval = (x_pval - x_pval.mean()) / x_pval.std()
+        x_s = (norm_fe - norm_fe.min() + norm_pval - norm_pval.min() + 2e-5) @ x_hit
+        expected = np.append((x_s - x_s.min()) / (x_s.max() - x_s.min()), 0)
+        assert np.allclose(result, expected)
+        result_pvals = e_score_only_pvals(names=names, name_lists=name_lists, x_pval=x_pval)
+        x_s = (norm_pval - norm_pval.min() + 1e-5) @ x_hit
+        assert np.allclose(result_pvals, np.append((x_s - x_s.min()) / (x_s.max() - x_s.min()), 0))
+
+
+# Test flattening and interning of name lists
+class TestInternList:
+    def test_flatten_list(self):
+        list_in = ["B, A", "A,C", ["D", "B, E"], np.nan]
+        assert ut.flatten_list(list_in) == ["B", "A", "C", "D", "E"]
+        assert ut.flatten_list(pd.Series(list_in)) == ["B", "A", "C", "D", "E"]
+
+    def test_codes(self):
+        list_in = ["B, A", "A,C", ["D", "B, E"], np.nan, "A"]
+        unique_items, codes, indptr = ut.intern_list(list_in)
+        assert unique_items == ut.flatten_list(list_in)
+        assert codes.tolist() == [0, 1, 1, 2, 3, 0, 4, 1]
+        assert indptr.tolist() == [0, 2, 4, 7, 7, 8]
+
+
+# Test P scores of multiple contrasts
+class TestPScoreContrasts:
+    @staticmethod
+    def _create_df_fc(n=50, contrasts=("(a/c)", "(b/c)", "(a/b)")):
+        rng = np.random.default_rng(0)
+        dict_cols = {}
+        for i, c in enumerate(contrasts):
+            dict_cols[f"{ut.STR_FC}_{c}"] = rng.normal(i, 1 + i, n)
+            dict_cols[f"{ut.STR_PVAL}_{c}"] = rng.exponential(2, n)
+        return pd.DataFrame(dict_cols, index=[f"p{i}" for i in range(n)])
+
+    def test_match_single(self):
+        # Test batched scores against scores of each contrast
+        df_fc = self._create_df_fc()
+        df_p_scores = xo.pRank.p_score_contrasts(df_fc=df_fc)
+        assert list(df_p_scores) == [f"{ut.COL_P_SCORE}_{c}" for c in ["(a/c)", "(b/c)", "(a/b)"]]
+        assert df_p_scores.index.equals(df_fc.index)
+        for c in ["(a/c)", "(b/c)", "(a/b)"]:
+            x_p_scores = p_score(x_fc=df_fc[f"{ut.STR_FC}_{c}"], x_pvals=df_fc[f"{ut.STR_PVAL}_{c}"])
+            assert np.allclose(df_p_scores[f"{ut.COL_P_SCORE}_{c}"], x_p_scores)
+        df_sub = xo.pRank.p_score_contrasts(df_fc=df_fc, contrasts=["(a/b)"])
+        assert df_sub.equals(df_p_scores[[f"{ut.COL_P_SCORE}_(a/b)"]])
+
+    def test_nan_values(self):
+        df_fc = self._create_df_fc()
+        df_fc.iloc[:5, 0] = np.nan
+        df_p_scores = xo.pRank.p_score_contrasts(df_fc=df_fc)
+        assert df_p_scores.iloc[:5, 0].isna().all() and df_p_scores.iloc[5:].notna().all().all()
+        assert np.isclose(df_p_scores.iloc[5:, 0].min(), 0) and np.isclose(df_p_scores.iloc[5:, 0].max(), 1)
+
+    def test_invalid_input(self):
+        df_fc = self._create_df_fc()
+        with pytest.raises(ValueError):
+            xo.pRank.p_score_contrasts(df_fc=df_fc, contrasts=["(x/c)"])
+        with pytest.raises(ValueError):
+            xo.pRank.p_score_contrasts(df_fc=df_fc.drop(columns=[f"{ut.STR_PVAL}_(a/c)", f"{ut.STR_PVAL}_(b/c)",
+                                                                 f"{ut.STR_PVAL}_(a/b)"]))
+
+
+# Test rank aggregation
+class TestAggregateRanks:
+    @staticmethod
+    def _create_df_scores(n=200, m=4):
+        rng = np.random.default_rng(0)
+        X = rng.normal(size=(n, m))
+        X[:10] += 4
+        X[rng.random((n, m)) < 0.1] = np.nan
+        return pd.DataFrame(X, columns=[f"score_{i}" for i in range(m)], index=[f"p{i}" for i in range(n)])
+
+    @pytest.mark.parametrize("method", ["rra", "mean", "borda"])
+    def test_top_k(self, method):
+        df_scores = self._create_df_scores()
+        df_agg = xo.pRank.aggregate_ranks(df_scores=df_scores, method=method)
+        assert df_agg.index.equals(df_scores.index)
+        assert (("agg_p-value" in df_agg) == (method == "rra")) and df_agg["agg_rank"].min() == 1
+        df_top = xo.pRank.aggregate_ranks(df_scores=df_scores, method=method, top_k=10)
+        assert df_top["agg_rank"].is_monotonic_increasing
+        assert df_top.equals(df_agg.sort_values("agg_rank", kind="stable").iloc[:10])
+        if method != "borda":
+            assert sorted(df_top.index) == sorted(df_scores.index[:10])
+
+    def test_top_k_ties(self):
+        # Ranks of top proteins with tied aggregated scores equal ranks among all proteins
+        df_scores = pd.DataFrame({"score_0": [3, 5, 5, 1, 5, 2, np.nan], "score_1": [3, 5, 5, 1, 5, 2, 4]})
+        df_agg = xo.pRank.aggregate_ranks(df_scores=df_scores, method="mean")
+        df_top = xo.pRank.aggregate_ranks(df_scores=df_scores, method="mean", top_k=4)
+        assert df_top["agg_rank"].to_list() == [1, 1, 1, 4]
+        assert df_top.equals(df_agg.sort_values("agg_rank", kind="stable").iloc[:4])
+
+    def test_top_k_partial(self, monkeypatch):
+        # Only the top k proteins are ranked (no ranking of all proteins)
+        df_scores = self._create_df_scores(n=500)
+        df_agg = xo.pRank.aggregate_ranks(df_scores=df_scores, method="mean")
+        monkeypatch.setattr(rank_aggregation, "_get_order_ranks", lambda **kwargs: pytest.fail("All proteins ranked"))
+        df_top = xo.pRank.aggregate_ranks(df_scores=df_scores, method="mean", top_k=5)
+        assert df_top["agg_rank"].to_list() == [1, 2, 3, 4, 5]
+        assert df_top.equals(df_agg.sort_values("agg_rank", kind="stable").iloc[:5])
+
+    def test_rra(self):
+        # Test rho scores against order statistics of each protein
+        df_scores = self._create_df_scores(n=30)
+        df_agg = xo.pRank.aggregate_ranks(df_scores=df_scores, method="rra")
+        R = (-df_scores).rank(method="average") / df_scores.notna().sum()
+        for i, r in enumerate(R.to_numpy()):
+            r = np.sort(r[~np.isnan(r)])
+            rho = min(beta.cdf(x, k + 1, len(r) - k) for k, x in enumerate(r))
+            assert np.isclose(df_agg["agg_score"].iloc[i], rho)
+            assert np.isclose(df_agg["agg_p-value"].iloc[i], min(rho * len(r), 1))
+
+    def test_weights(self):
+        df_scores = self._create_df_scores()
+        df_agg = xo.pRank.aggregate_ranks(df_scores=df_scores, method="mean", weights=[1, 0, 0, 0])
+        ranks = (-df_scores["score_0"]).rank(method="min")
+        assert df_agg.loc[ranks.notna(), "agg_rank"].equals(ranks[ranks.notna()].astype(np.int64))
+        with pytest.raises(ValueError):
+            xo.pRank.aggregate_ranks(df_scores=df_scores, method="rra", weights=[1, 1, 1, 1])
+        with pytest.raises(ValueError):
+            xo.pRank.aggregate_ranks(df_scores=df_scores, method="mean", weights=[1, 1])
+        with pytest.raises(ValueError):
+            xo.pRank.aggregate_ranks(df_scores=df_scores, method="median")
@@ -1,6 +1,102 @@
 """
 This is a script for functions to access group information from a provided dataframe.
 """
+from functools import lru_cache
+import numpy as np
+
+
+# I Helper Functions
+class QuantLayout:
+    """
+    Layout of quantification columns resolving the column-group mapping once as integer positions.
+
+    Quantification columns (``cols_quant``) are ordered by group, such that the columns of each group form
+    a contiguous block given by ``list_group_pos``. Layouts are shared via a cache and thus read-only.
+
+    Attributes
+    ----------
+    groups: Tuple with group names
+    cols_quant: Tuple with quantification columns of all groups (ordered by group)
+    pos_quant: Positions of ``cols_quant`` in the columns of the DataFrame
+    list_group_pos: Positions of quantification columns of each group in ``cols_quant``
+    """
+    def __init__(self, cols=None, groups=None, str_quant=None):
+        dict_col_group = {}
+        cols_quant = [col for col in cols if isinstance(col, str) and str_quant in col]
+        if len(set(cols_quant)) < len(cols_quant):
+            cols_dup = sorted({col for col in cols_quant if cols_quant.count(col) > 1})
+            raise ValueError(f"Quantification columns should not be duplicated in 'df': {cols_dup}")
+        for col in cols:
+            if isinstance(col, str) and str_quant in col:
+                col_wo_str_quant = col.replace(str_quant, "")
+                # Last matching group is used (as by substring scan over all groups)
+                for group in groups:
+                    if group in col_wo_str_quant:
+                        dict_col_group[col] = group
+        self.groups = tuple(groups)
+        self._dict_col_group = dict_col_group
+        self._dict_group_cols = {g: tuple(c for c, v in dict_col_group.items() if v == g) for g in self.groups}
+        self.cols_quant = tuple(c for g in self.groups for c in self._dict_group_cols[g])
+        dict_col_pos = {col: i for i, col in enumerate(cols)}
+        self.pos_quant = np.array([dict_col_pos[c] for c in self.cols_quant], dtype=np.int64)
+        list_n = [len(self._dict_group_cols[g]) for g in self.groups]
+        starts = np.concatenate([[0], np.cumsum(list_n)]).astype(np.int64)
+        self.list_group_pos = [np.arange(starts[i], starts[i + 1]) for i in range(len(self.groups))]
+        for pos in [self.pos_quant, *self.list_group_pos]:
+            pos.setflags(write=False)
+
+    @property
+    def dict_qcol_group(self):
+        """Dictionary with quantification columns and their group"""
+        return dict(self._dict_col_group)
+
+    @property
+    def dict_group_qcols(self):
+        """Dictionary with groups and their quantification columns"""
+        return {g: list(cols) for g, cols in self._dict_group_cols.items()}
+
+    @property
+    def dict_group_pos(self):
+        """Dictionary with groups and positions of their quantification columns in ``cols_quant``"""
+        return dict(zip(self.groups, self.list_group_pos))
+
+    def get_X(self, df=None, dtype=float):
+        """Get quantifications of all groups as array (n_samples, n_quant_columns) ordered as ``cols_quant``"""
+        return df.iloc[:, self.pos_quant].to_numpy(dtype=dtype)
+
+
+@lru_cache(maxsize=64)
+def _get_quant_layout(cols=None, groups=None, str_quant=None):
+    """Cached quantification layout per (columns, groups, str_quant)"""
+    return QuantLayout(cols=cols, groups=groups, str_quant=str_quant)
+
+
+@lru_cache(maxsize=64)
+def _get_col_substrings(cols=None, str_quant=None):
+    """Cached set of '_'-separated substrings of all columns (without ``str_quant``)"""
+    return frozenset(x.strip() for col in cols for substr in str(col).replace(str_quant, "").split("_")
+                     for x in substr.split(","))
+
+
+# II Main Functions
+def get_quant_layout(df=None, groups=None, str_quant=None):
+    """
+    Get (cached) layout of quantification columns of df for given groups
+
+    Parameters
+    ----------
+    df: DataFrame containing quantified features including missing values
+    groups: List with group names
+    str_quant: Substring in column indicating quantification
+    """
+    if str_quant is None:
+        raise ValueError("'str_quant' must be given")
+    return _get_quant_layout(cols=tuple(df.columns), groups=tuple(groups), str_quant=str_quant)
+
+
+def get_col_substrings(df=None, str_quant=None):
+    """Get set of '_'-separated substrings of all columns of df (without ``str_quant``)"""
+    return _get_col_substrings(cols=tuple(df.columns), str_quant=str_quant)
 
 
 def get_dict_qcol_group(df=None, groups=None, str_quant=None):
@@ -15,14 +111,7 @@ def get_dict_qcol_group(df=None, groups=None, str_quant=None):
     """
     if str_quant is None:
         raise ValueError("'str_quant' must be given")
-    dict_col_group = {}
-    for col in list(df):
-        if str_quant in col:
-            col_wo_str_quant = col.replace(str_quant, "")
-            for group in groups:
-                if group in col_wo_str_quant:
-                    dict_col_group[col] = group
-    return dict_col_group
+    return get_quant_layout(df=df, groups=groups, str_quant=str_quant).dict_qcol_group
 
 
 def get_dict_group_qcols(df=None, groups=None, str_quant=None):
@@ -37,9 +126,7 @@ def get_dict_group_qcols(df=None, groups=None, str_quant=None):
     """
     if str_quant is None:
         raise ValueError("'str_quant' must be given")
-    dict_col_group = get_dict_qcol_group(df=df, groups=groups, str_quant=str_quant)
-    dict_group_cols = {g: [k for k, v in dict_col_group.items() if v == g] for g in groups}
-    return dict_group_cols
+    return get_quant_layout(df=df, groups=groups, str_quant=str_quant).dict_group_qcols
 
 
 def get_qcols(df=None, groups=None, str_quant=None):
@@ -54,7 +141,4 @@ def get_qcols(df=None, groups=None, str_quant=None):
     """
     if str_quant is None:
         raise ValueError("'str_quant' should not be None")
-    dict_col_group = get_dict_qcol_group(df=df, groups=groups, str_quant=str_quant)
-    dict_group_cols = {g: [k for k, v in dict_col_group.items() if v == g] for g in groups}
-    list_group_cols = [col for group_cols in dict_group_cols.values() for col in group_cols]
-    return list_group_cols
+    return list(get_quant_layout(df=df, groups=groups, str_quant=str_quant).cols_quant)
@@ -3,6 +3,7 @@ This is a script for setting system level options for xOmics.
 """
 from typing import Dict, Any
 import os
+import numpy as np
 
 from ._utils.check_type import check_bool, check_number_val, check_number_range, check_str
 from ._utils.check_data import check_df
@@ -13,8 +14,11 @@ _dict_options = {
     'random_state': "off",
     'allow_multiprocessing': True,
     'replace_underscore_in_plots': True,
+    'dtype': "float64",
 }
 
+LIST_DTYPES = ["float32", "float64"]
+
 
 # Check system level (option) parameters or depending parameters
 def check_verbose(verbose=None):
@@ -60,6 +64,18 @@ def check_n_jobs(n_jobs=None):
     return n_jobs
 
 
+def check_dtype(dtype=None):
+    """Get float data type for quantifications. Set by global 'dtype' option if not given"""
+    dtype = options["dtype"] if dtype is None else dtype
+    try:
+        np_dtype = np.dtype(dtype)
+    except TypeError:
+        np_dtype = None
+    if str(np_dtype) not in LIST_DTYPES:
+        raise ValueError(f"'dtype' ({dtype}) should be one of: {LIST_DTYPES}")
+    return np_dtype
+
+
 # DEV: Parameters are used as directive to get better documentation style
 # Enables setting of system level variables like in matplotlib
 def _check_option(name_option="", option=None):
@@ -72,6 +88,10 @@ def _check_option(name_option="", option=None):
             check_random_state(random_state=option)
     if name_option == "allow_multiprocessing":
         check_bool(name=name_option, val=option)
+    if name_option == "dtype":
+        if option is None:
+            raise ValueError(f"'dtype' (option) should be one of: {LIST_DTYPES}")
+        check_dtype(dtype=option)
 
 
 class Settings:
@@ -99,6 +119,9 @@ class Settings:
         Whether multiprocessing is allowed in general. If ``False``, ``n_jobs`` is automatically set to 1.
     replace_underscore_in_plots : bool, default=True
         Whether to replace underscores from variables in plot labels.
+    dtype : {'float64', 'float32'}, default='float64'
+        Float data type of quantifications used by :class:`PreProcess`, :class:`cImpute`, and :class:`pRank`.
+        Log-transformed intensities are sufficiently represented by 'float32', halving memory consumption.
 
 
     See Also
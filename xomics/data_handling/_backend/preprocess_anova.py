@@ -0,0 +1,105 @@
+"""
+This is a script for the vectorized multi-group tests (one-way ANOVA and Kruskal-Wallis) of PreProcess.run_anova().
+"""
+import pandas as pd
+import numpy as np
+from scipy.stats import f as f_dist, chi2
+
+import xomics.utils as ut
+from .preprocess_ttest import _get_group_stats, _get_ss
+from .preprocess_pvals import correct_pvals
+
+LIST_ANOVA_TESTS = ["anova", "kruskal"]
+COL_F = "F"
+COL_H = "H"
+
+
+# I Helper Functions
+def _rank_rows(X=None):
+    """Average ranks (1-based) within each row ignoring NaNs, and tie sums (sum of t^3 - t over ties) per row"""
+    n_rows, n_cols = X.shape
+    idx_sort = np.argsort(X, axis=1)
+    X_sorted = np.take_along_axis(X, idx_sort, axis=1)
+    # Runs of identical values in sorted rows (NaNs are never identical)
+    is_start = np.ones(X.shape, dtype=bool)
+    is_start[:, 1:] = X_sorted[:, 1:] != X_sorted[:, :-1]
+    run_ids = np.cumsum(is_start, axis=1) - 1 + (np.arange(n_rows) * n_cols)[:, np.newaxis]
+    ties = np.bincount(run_ids.ravel(), minlength=n_rows * n_cols)[run_ids]
+    pos_start = np.maximum.accumulate(np.where(is_start, np.arange(n_cols), 0), axis=1)
+    ranks_sorted = pos_start + (ties + 1) / 2
+    mask_nan = np.isnan(X_sorted)
+    ranks_sorted[mask_nan] = np.nan
+    ranks = np.empty(X.shape)
+    np.put_along_axis(ranks, idx_sort, ranks_sorted, axis=1)
+    # Each tie of size t contributes t times (t^2 - 1)
+    tie_sums = np.where(mask_nan, 0, ties ** 2 - 1).sum(axis=1)
+    return ranks, tie_sums
+
+
+def _get_n_groups(n=None):
+    """Number of groups with at least one value and total number of values per row"""
+    return (n > 0).sum(axis=1), n.sum(axis=1)
+
+
+# II Main Functions
+def anova_groups(X=None, list_group_pos=None):
+    """One-way ANOVA F statistics and p-values for each row of ``X`` from group-wise statistics.
+
+    Groups without values are omitted for the respective row.
+    """
+    n, mean, var = (np.stack(x, axis=1) for x in zip(*[_get_group_stats(X[:, pos]) for pos in list_group_pos]))
+    k, n_total = _get_n_groups(n=n)
+    mean = np.where(n > 0, mean, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_total = (n * mean).sum(axis=1) / n_total
+        ss_between = (n * (mean - mean_total[:, np.newaxis]) ** 2).sum(axis=1)
+        ss_within = _get_ss(n=n, var=var).sum(axis=1)
+        df_between, df_within = k - 1, n_total - k
+        f_stat = (ss_between / df_between) / (ss_within / df_within)
+    valid = (df_between > 0) & (df_within > 0)
+    f_stat = np.where(valid, f_stat, np.nan)
+    p_values = f_dist.sf(f_stat, np.where(valid, df_between, 1), np.where(valid, df_within, 1))
+    return f_stat, p_values
+
+
+def kruskal_groups(X=None, list_group_pos=None):
+    """Kruskal-Wallis H statistics (corrected for ties) and p-values for each row of ``X``.
+
+    Values are ranked once for all groups. Groups without values are omitted for the respective row.
+    """
+    ranks, tie_sums = _rank_rows(X=X)
+    n = np.stack([(~np.isnan(X[:, pos])).sum(axis=1) for pos in list_group_pos], axis=1)
+    rank_sums = np.stack([np.nansum(ranks[:, pos], axis=1) for pos in list_group_pos], axis=1)
+    k, n_total = _get_n_groups(n=n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h_stat = 12 / (n_total * (n_total + 1)) * np.where(n > 0, rank_sums ** 2 / n, 0).sum(axis=1)
+        h_stat = (h_stat - 3 * (n_total + 1)) / (1 - tie_sums / (n_total ** 3 - n_total))
+    valid = (k > 1) & np.isfinite(h_stat)
+    h_stat = np.where(valid, h_stat, np.nan)
+    p_values = chi2.sf(h_stat, np.where(valid, k - 1, 1))
+    return h_stat, p_values
+
+
+def run_anova(df=None, layout=None, test="anova", pvals_method=None, pvals_neg_log10=True, dtype=float):
+    """
+    Perform one multi-group test (one-way ANOVA or Kruskal-Wallis) per protein over all groups to obtain
+    F or H statistics and (-log10) p-values, with optional p-value correction.
+    """
+    X = layout.get_X(df=df, dtype=dtype).astype(float, copy=False)
+    list_group_pos = layout.list_group_pos
+    if test == "anova":
+        col_stat = COL_F
+        x_stat, p_values = anova_groups(X=X, list_group_pos=list_group_pos)
+    elif test == "kruskal":
+        col_stat = COL_H
+        x_stat, p_values = kruskal_groups(X=X, list_group_pos=list_group_pos)
+    else:
+        raise ValueError(f"'test' ({test}) should be one of: {LIST_ANOVA_TESTS}")
+    if pvals_method is not None:
+        p_values = correct_pvals(P=p_values, method=pvals_method)
+    if pvals_neg_log10:
+        with np.errstate(divide="ignore"):
+            p_values = -np.log10(p_values)
+    df_anova = pd.DataFrame({col_stat: x_stat.astype(dtype, copy=False),
+                             ut.STR_PVAL: p_values.astype(dtype, copy=False)}, index=df.index)
+    return df_anova
@@ -1,54 +1,88 @@
 """
 This is a script for backend of the PreProcess.filter() method.
 """
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype, is_float_dtype, is_integer_dtype, is_bool_dtype
 import numpy as np
 from datetime import datetime
 
 
 # Helper functions
-def _split_names(df=None, col=None, str_split=";"):
+def _get_str_mask(values=None):
+    """Get boolean mask of string values of an object array (one pass without Series.apply)"""
+    return np.fromiter((isinstance(v, str) for v in values), dtype=bool, count=len(values))
+
+
+def _split_names(x=None, str_split=";"):
     """
-    Split names for provided column and filter duplicates by keeping first occurring.
+    Split string names by ``str_split`` and keep first part (other values are kept).
     """
-    df[col] = df[col].apply(lambda x: x.split(str_split)[0] if isinstance(x, str) and str_split in x else x)
-    return df
+    if is_datetime64_any_dtype(x) or is_float_dtype(x) or is_integer_dtype(x) or is_bool_dtype(x):
+        return x
+    values = x.to_numpy(dtype=object, copy=True)
+    mask_str = _get_str_mask(values=values)
+    values[mask_str] = [v.split(str_split, 1)[0] for v in values[mask_str]]
+    return pd.Series(values, index=x.index, name=x.name)
 
 
-def _filter_invalid_and_duplicates(df, col):
+def _get_valid_mask(x=None):
     """
-    Filter out invalid (datetime and nan) and duplicate entries based on a column.
+    Get boolean mask of valid entries, where datetime (e.g., gene names converted by Excel) and float values
+    are invalid. Only non-string values of object columns are checked one by one.
     """
-    if col not in df.columns:
-        raise ValueError(f"{col} from 'cols' should be in columns of 'df': {list(df)}")
-    df = df[df[col].apply(lambda x: not isinstance(x, (datetime, type(np.nan))))]
-    return df.drop_duplicates(subset=col, keep="first")
+    if is_datetime64_any_dtype(x) or is_float_dtype(x):
+        return np.zeros(len(x), dtype=bool)
+    if is_integer_dtype(x) or is_bool_dtype(x):
+        return np.ones(len(x), dtype=bool)
+    values = x.to_numpy(dtype=object)
+    mask_valid = _get_str_mask(values=values)
+    idx_other = np.flatnonzero(~mask_valid)
+    mask_valid[idx_other] = [not isinstance(v, (datetime, float)) for v in values[idx_other]]
+    return mask_valid
 
 
 # Main functions
-def filter_duplicated_names(df=None, cols=None, split_names=False, str_split=";"):
+def filter_duplicated_names(df=None, cols=None, split_names=False, str_split=";", return_dropped=False):
     """
     Filter DataFrame according to specified criteria and columns.
     """
+    if cols not in df.columns:
+        raise ValueError(f"{cols} from 'cols' should be in columns of 'df': {list(df)}")
+    x = df[cols]
     if split_names:
-        df = _split_names(df=df, col=cols, str_split=str_split)
-    df = _filter_invalid_and_duplicates(df, cols)
-    return df
+        x = _split_names(x=x, str_split=str_split)
+        df = df.assign(**{cols: x})
+    mask_valid = _get_valid_mask(x=x)
+    mask_dup = x[mask_valid].duplicated(keep="first").to_numpy()
+    idx_valid = np.flatnonzero(mask_valid)
+    mask_keep = np.zeros(len(df), dtype=bool)
+    mask_keep[idx_valid[~mask_dup]] = True
+    df_filtered = df[mask_keep]
+    if return_dropped:
+        index_dropped = df.index[idx_valid[mask_dup]]
+        return df_filtered, index_dropped
+    return df_filtered
 
 
-def _compute_pct_non_nan(row, dict_groups_qcols, list_n_group):
-    list_n_non_nan_group = [row[cols].notnull().sum() for cols in dict_groups_qcols.values()]
-    return np.array(list_n_non_nan_group) / list_n_group
+def get_pct_groups(df=None, layout=None):
+    """Get percentage of non-missing values per group (columns) for each sample (rows) by one grouped reduction
+    of the NaN mask over group-wise contiguous column blocks (NaN for groups without columns)"""
+    list_n_group = np.array([len(pos) for pos in layout.list_group_pos])
+    mask_non_nan = df.iloc[:, layout.pos_quant].notna().to_numpy()
+    # Block sums as differences of cumulative sums at group boundaries
+    cum_non_nan = np.zeros((len(mask_non_nan), mask_non_nan.shape[1] + 1), dtype=np.int64)
+    np.cumsum(mask_non_nan, axis=1, out=cum_non_nan[:, 1:])
+    ends = np.cumsum(list_n_group)
+    n_non_nan = cum_non_nan[:, ends] - cum_non_nan[:, ends - list_n_group]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return n_non_nan / list_n_group
 
 
-def filter_groups(df=None, groups=None, dict_groups_qcols=None, min_pct=None):
+def filter_groups(df=None, layout=None, min_pct=None, return_pct=False):
     """Filter df such that for at least one group a minimum percentage of values is given"""
-    list_n_group = [len(dict_groups_qcols[g]) for g in groups]
-    pct_non_nan_groups = df.apply(lambda row: _compute_pct_non_nan(row, dict_groups_qcols, list_n_group),
-                                  axis=1, result_type='expand')
-    mask = np.any(pct_non_nan_groups >= min_pct, axis=1)
+    pct_groups = get_pct_groups(df=df, layout=layout)
+    mask = np.any(pct_groups >= min_pct, axis=1)
+    if return_pct:
+        df_pct = pd.DataFrame(pct_groups[mask], columns=list(layout.groups), index=df.index[mask])
+        return df[mask], df_pct
     return df[mask]
-
-
-
-
-
@@ -0,0 +1,74 @@
+"""
+This is a script for the vectorized multiple testing correction of p-values used by PreProcess.run().
+"""
+import numpy as np
+from statsmodels.stats.multitest import multipletests
+
+LIST_PVALS_METHODS = ["bonferroni", "sidak", "holm", "hommel", "fdr_bh", "fdr_by"]
+LIST_PVALS_FAMILIES = ["contrast", "global"]
+
+
+# I Helper Functions
+def _adjust_sorted(p_sorted=None, n=None, method=None):
+    """Adjust p-values sorted in ascending order along first axis (NaNs at the end), where ``n`` is the number
+    of (non-NaN) p-values per column"""
+    rank = np.arange(1, len(p_sorted) + 1)[:, np.newaxis]
+    if method == "holm":
+        # Step-down: Cumulative maximum from smallest p-value
+        p_adj = np.fmax.accumulate(p_sorted * (n - rank + 1), axis=0)
+    elif method in ["fdr_bh", "fdr_by"]:
+        p_adj = p_sorted * n / rank
+        if method == "fdr_by":
+            harmonic = np.cumsum(1 / np.arange(1, len(p_sorted) + 1))
+            p_adj *= harmonic[np.maximum(n - 1, 0)]
+        # Step-up: Cumulative minimum from largest p-value (NaNs ignored by fmin)
+        p_adj = np.fmin.accumulate(p_adj[::-1], axis=0)[::-1]
+    else:
+        raise ValueError(f"'method' ({method}) should be one of: {LIST_PVALS_METHODS}")
+    return p_adj
+
+
+def _correct_columns(P=None, method=None):
+    """Correct p-values for each column of 2D array ``P`` as one family (NaNs are ignored)"""
+    mask = np.isnan(P)
+    n = (~mask).sum(axis=0)
+    if method == "bonferroni":
+        return np.minimum(P * n, 1)
+    if method == "sidak":
+        return -np.expm1(n * np.log1p(-P))
+    if method == "hommel":
+        P_adj = np.full(P.shape, np.nan)
+        for i in np.flatnonzero(n > 0):
+            P_adj[~mask[:, i], i] = multipletests(P[~mask[:, i], i], method="hommel")[1]
+        return P_adj
+    # Sort-based step-down and step-up procedures (NaNs are sorted to the end)
+    idx_sort = np.argsort(P, axis=0)
+    p_sorted = np.take_along_axis(P, idx_sort, axis=0)
+    p_adj = np.minimum(_adjust_sorted(p_sorted=p_sorted, n=n, method=method), 1)
+    p_adj[np.isnan(p_sorted)] = np.nan
+    P_adj = np.empty(P.shape)
+    np.put_along_axis(P_adj, idx_sort, p_adj, axis=0)
+    return P_adj
+
+
+# II Main Functions
+def correct_pvals(P=None, method="fdr_bh", family="contrast"):
+    """NaN-aware multiple testing correction of p-values.
+
+    Parameters
+    ----------
+    P: array-like, shape (n_samples,) or (n_samples, n_contrasts)
+        P-values, where NaNs are ignored and kept.
+    method: str, default='fdr_bh'
+        Correction method (Bonferroni, Sidak, Holm, Hommel, Benjamini-Hochberg, or Benjamini-Yekutieli).
+    family: str, default='contrast'
+        Whether each contrast (column) is corrected as one family ('contrast') or all p-values at once ('global').
+    """
+    P = np.asarray(P, dtype=float)
+    shape = P.shape
+    P = P.reshape(len(P), -1)
+    if family == "global":
+        P_adj = _correct_columns(P=P.reshape(-1, 1), method=method).reshape(P.shape)
+    else:
+        P_adj = _correct_columns(P=P, method=method)
+    return P_adj.reshape(shape)
@@ -3,80 +3,115 @@ This is a script for backend of the PreProcess.run() method.
 """
 import pandas as pd
 import numpy as np
-from statsmodels.stats.multitest import multipletests
-from scipy.stats import ttest_ind
-import warnings
+from scipy.stats import t as t_dist
 
 import xomics.utils as ut
+from .preprocess_ttest import _get_group_stats, ttest_contrasts
+from .preprocess_pvals import correct_pvals
 
 
 # I Helper Functions
-def _calculate_group_stats(df, group_cols):
-    """Calculate the mean for each group's columns."""
-    return df[group_cols].mean(axis=1)
-
-
-def _correct_p_val(p_vals=None, method=None):
-    """Correct p values with given methods"""
-    p_vals = [p if str(p) != "nan" else 1 for p in p_vals]
-    cor_p_vals = multipletests(p_vals, method=method)[1]
-    p_vals = [p if str(p_vals[i]) != "nan" else np.nan for i, p in enumerate(cor_p_vals)]
-    return p_vals
-
-
-# II Main Functions
-def run_preprocess(df=None, groups=None, groups_ctrl=None, pvals_method=None, pvals_neg_log10=True,  str_quant=None):
-    """
-    Perform pairwise t-tests for groups to obtain -log10 p-values and log2 fold changes,
-    with optional p-value correction, nan policy, and log-scale output.
-    """
-    df = df.copy()
-    # Get the mapping dictionaries
-    dict_group_cols_quant = ut.get_dict_group_qcols(df=df, groups=groups, str_quant=str_quant)
-    cols_quant = ut.get_qcols(df=df, groups=groups, str_quant=str_quant)
-    # Remove rows with NaNs
-    df_quant = df[cols_quant]
-    # Initialize lists to collect results
-    log2_FC_columns = {}
-    p_value_columns = {}
+def _get_contrasts(groups=None, groups_ctrl=None):
+    """Get unique pairs of groups and control groups (self-comparisons omitted)"""
+    contrasts = []
     ratio_pairs = set()
-
     for group in groups:
         for group_ctrl in groups_ctrl:
             # Use frozenset to ensure the pair is unique regardless of order
             pair = frozenset([group, group_ctrl])
             if group == group_ctrl or pair in ratio_pairs:
                 continue
-            # Calculate mean for each group
-            mean1 = _calculate_group_stats(df_quant, dict_group_cols_quant[group])
-            mean2 = _calculate_group_stats(df_quant, dict_group_cols_quant[group_ctrl])
+            contrasts.append((group, group_ctrl))
+            ratio_pairs.add(pair)
+    return contrasts
 
-            # Calculate log2 fold change and p-values
-            fold_change = mean2 - mean1
-            # Ignore RuntimeWarning due to missing values
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore", category=RuntimeWarning)
-                _, p_values = ttest_ind(df_quant[dict_group_cols_quant[group]],
-                                        df_quant[dict_group_cols_quant[group_ctrl]],
-                                        axis=1, nan_policy="omit")
-            # Correct p-values if method is specified
-            if pvals_method is not None:
-                p_values = _correct_p_val(p_vals=p_values, method=pvals_method)
-            # Create column names
-            log2_FC_col_name = f"{ut.STR_FC}_({group}/{group_ctrl})"
-            p_value_col_name = f"{ut.STR_PVAL}_({group}/{group_ctrl})"
 
-            # Convert pandas Series or numpy arrays to lists
-            fold_change_list = fold_change.tolist()
-            p_value_list = (-np.log10(p_values) if pvals_neg_log10 else p_values).tolist()
-            # Append the results to the respective lists
-            log2_FC_columns[log2_FC_col_name] = fold_change_list
-            p_value_columns[p_value_col_name] = p_value_list
-            # Add to ratio pairs to avoid duplicate comparisons
-            ratio_pairs.add(pair)
+def pool_rubin(x_estimates=None, x_variances=None, df_com=None):
+    """Pool estimates and variances of multiple imputations (first axis) by Rubin's rules.
+
+    Degrees of freedom are adjusted for small samples following Barnard and Rubin (1999).
+    Returns pooled estimate, total variance, and degrees of freedom.
+    """
+    m = len(x_estimates)
+    q_mean = x_estimates.mean(axis=0)
+    w = x_variances.mean(axis=0)                                # Within-imputation variance
+    b = x_estimates.var(axis=0, ddof=1) if m > 1 else np.zeros_like(w)   # Between-imputation variance
+    t = w + (1 + 1 / m) * b                                     # Total variance
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lam = np.where(t > 0, (1 + 1 / m) * b / t, 0)          # Fraction of missing information
+        df_old = np.where(lam > 0, (m - 1) / lam ** 2, np.inf)
+        df_obs = (df_com + 1) / (df_com + 3) * df_com * (1 - lam)
+        df = 1 / (1 / df_old + 1 / df_obs)
+    return q_mean, t, df
+
+
+# II Main Functions
+def run_preprocess(df=None, layout=None, groups_ctrl=None, pvals_method=None, pvals_neg_log10=True, dtype=float,
+                   test="student", pvals_family="contrast"):
+    """
+    Perform pairwise t-tests (Student's, Welch's, paired, or moderated) for groups to obtain -log10 p-values
+    and log2 fold changes, with optional p-value correction, nan policy, and log-scale output.
+    """
+    # Quantifications are extracted once in the given float data type
+    X = layout.get_X(df=df, dtype=dtype)
+    # All pairwise t-tests from group-wise statistics (computed once)
+    contrasts = _get_contrasts(groups=layout.groups, groups_ctrl=groups_ctrl)
+    fold_changes, _, p_values = ttest_contrasts(X=X, dict_group_pos=layout.dict_group_pos, contrasts=contrasts,
+                                                test=test)
+    # Correct p-values of all contrasts at once if method is specified
+    if pvals_method is not None:
+        p_values = correct_pvals(P=p_values, method=pvals_method, family=pvals_family)
+    if pvals_neg_log10:
+        with np.errstate(divide="ignore"):
+            p_values = -np.log10(p_values)
+    # Append the results in the given data type
+    log2_FC_columns = {}
+    p_value_columns = {}
+    for i, (group, group_ctrl) in enumerate(contrasts):
+        log2_FC_columns[f"{ut.STR_FC}_({group}/{group_ctrl})"] = fold_changes[:, i].astype(dtype, copy=False)
+        p_value_columns[f"{ut.STR_PVAL}_({group}/{group_ctrl})"] = p_values[:, i].astype(dtype, copy=False)
 
     # Combine both dictionaries
     results = {**log2_FC_columns, **p_value_columns}
     # Convert dictionary to DataFrame
     df_fc = pd.DataFrame(results)
     return df_fc
+
+
+def run_preprocess_pooled(X_imps=None, layout=None, groups_ctrl=None, pvals_method=None, pvals_neg_log10=True,
+                          dtype=float, pvals_family="contrast"):
+    """
+    Perform pairwise t-tests for each imputation in ``X_imps`` and combine log2 fold changes and p-values by
+    Rubin's rules.
+    """
+    X_imps = np.asarray(X_imps, dtype=dtype)
+    dict_stats = {g: _get_group_stats(X_imps[:, :, pos]) for g, pos in layout.dict_group_pos.items()}
+    contrasts = _get_contrasts(groups=layout.groups, groups_ctrl=groups_ctrl)
+    list_fold_changes, list_p_values = [], []
+    for group, group_ctrl in contrasts:
+        n1, mean1, var1 = dict_stats[group]
+        n2, mean2, var2 = dict_stats[group_ctrl]
+        # Pooled variance of Student's t-test for each imputation
+        df_com = n1 + n2 - 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            var_pooled = ((n1 - 1) * var1 + (n2 - 1) * var2) / df_com
+            x_variances = var_pooled * (1 / n1 + 1 / n2)
+        # Missing values (not imputed due to low CS) are identical across imputations
+        fold_change, var_total, df = pool_rubin(x_estimates=mean2 - mean1, x_variances=x_variances,
+                                                df_com=df_com[0])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_stat = fold_change / np.sqrt(var_total)
+        list_fold_changes.append(fold_change)
+        list_p_values.append(2 * t_dist.sf(np.abs(t_stat), df))
+    p_values = np.stack(list_p_values, axis=1)
+    if pvals_method is not None:
+        p_values = correct_pvals(P=p_values, method=pvals_method, family=pvals_family)
+    if pvals_neg_log10:
+        with np.errstate(divide="ignore"):
+            p_values = -np.log10(p_values)
+    log2_FC_columns = {f"{ut.STR_FC}_({group}/{group_ctrl})": fc.astype(dtype, copy=False)
+                       for (group, group_ctrl), fc in zip(contrasts, list_fold_changes)}
+    p_value_columns = {f"{ut.STR_PVAL}_({group}/{group_ctrl})": p_values[:, i].astype(dtype, copy=False)
+                       for i, (group, group_ctrl) in enumerate(contrasts)}
+    df_fc = pd.DataFrame({**log2_FC_columns, **p_value_columns})
+    return df_fc
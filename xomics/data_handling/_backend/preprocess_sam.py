@@ -0,0 +1,170 @@
+"""
+This is a script for the permutation-based FDR estimation of SAM statistics used by PreProcess.run_sam().
+"""
+import pandas as pd
+import numpy as np
+from scipy.stats import t as t_dist
+from joblib import Parallel, delayed
+import warnings
+
+import xomics.utils as ut
+from .preprocess_ttest import _get_group_stats, _get_ss
+from .preprocess_run import _get_contrasts
+
+COL_CONTRAST = "contrast"
+COL_S0 = "s0"
+COL_C = "c"
+COL_DF = "df"
+
+# Maximum number of permuted statistics (proteins x permutations) per chunk
+_MAX_CHUNK_SIZE = 2 ** 22
+# Relative tolerance for ties of permuted and observed statistics (e.g., for the original label assignment)
+_REL_TOL = 1e-9
+
+
+# I Helper Functions
+def _get_sam_stats(X1=None, X2=None):
+    """Mean differences (mean(X2) - mean(X1)), standard errors of Student's t-test, and degrees of freedom"""
+    n1, mean1, var1 = _get_group_stats(X1)
+    n2, mean2, var2 = _get_group_stats(X2)
+    df = n1 + n2 - 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var_pooled = (_get_ss(n=n1, var=var1) + _get_ss(n=n2, var=var2)) / df
+        s = np.sqrt(var_pooled * (1 / n1 + 1 / n2))
+    return mean2 - mean1, s, df
+
+
+def _count_exceeding(x_abs=None, thresholds=None):
+    """Count values of ``x_abs`` greater or equal to each threshold (NaNs are ignored)"""
+    x_sorted = np.sort(x_abs[~np.isnan(x_abs)])
+    return len(x_sorted) - np.searchsorted(x_sorted, thresholds, side="left")
+
+
+def _count_permuted(X0=None, M=None, perms=None, n1=None, s0=None, thresholds=None):
+    """Count absolute SAM statistics of permutations (rows of ``perms``) exceeding each threshold.
+
+    Group-wise sums are obtained for all permutations at once by multiplying the zero-filled quantifications
+    ``X0`` and detection mask ``M`` with the (n_samples, n_permutations) group assignment matrix.
+    """
+    n_perm, n_tot = perms.shape
+    A = np.zeros((n_tot, n_perm))
+    A[perms[:, :n1], np.arange(n_perm)[:, np.newaxis]] = 1
+    # Sufficient statistics of first group and of both groups together
+    n_a, sum_a, sq_a = M @ A, X0 @ A, (X0 ** 2) @ A
+    n_t, sum_t, sq_t = M.sum(axis=1, keepdims=True), X0.sum(axis=1, keepdims=True), (X0 ** 2).sum(axis=1, keepdims=True)
+    n_b, sum_b, sq_b = n_t - n_a, sum_t - sum_a, sq_t - sq_a
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_a, mean_b = sum_a / n_a, sum_b / n_b
+        ss = np.maximum(sq_a - n_a * mean_a ** 2, 0) + np.maximum(sq_b - n_b * mean_b ** 2, 0)
+        s = np.sqrt(ss / (n_t - 2) * (1 / n_a + 1 / n_b))
+        d = np.abs(mean_b - mean_a) / (s + s0)
+    return _count_exceeding(x_abs=d.ravel(), thresholds=thresholds)
+
+
+# II Main Functions
+def estimate_s0(x_diff=None, x_se=None, n_bins=100):
+    """Estimate fudge factor ``s0`` of SAM statistics as percentile of standard errors minimizing the coefficient
+    of variation of the median absolute deviation of SAM statistics across standard error bins (Tusher et al., 2001).
+    """
+    mask = np.isfinite(x_diff) & np.isfinite(x_se)
+    x_diff, x_se = x_diff[mask], x_se[mask]
+    if len(x_se) == 0:
+        return 0.0
+    n_bins = max(1, min(n_bins, len(x_se) // 10))
+    edges = np.quantile(x_se, np.linspace(0, 1, n_bins + 1))[1:-1]
+    bins = np.searchsorted(edges, x_se, side="right")
+    list_idx = [np.flatnonzero(bins == i) for i in np.unique(bins)]
+    list_s0 = np.quantile(x_se, np.linspace(0, 1, 21))
+    list_cv = []
+    for s0 in list_s0:
+        d = x_diff / (x_se + s0)
+        mads = np.array([np.median(np.abs(d[idx] - np.median(d[idx]))) for idx in list_idx])
+        list_cv.append(mads.std() / mads.mean() if mads.mean() > 0 else np.inf)
+    return float(list_s0[int(np.argmin(list_cv))])
+
+
+def get_qvals(x_abs=None, counts_perm=None, n_perm=None):
+    """Permutation-based q-values for absolute SAM statistics from counts of permuted statistics exceeding them"""
+    q_vals = np.full(len(x_abs), np.nan)
+    mask = ~np.isnan(x_abs)
+    counts_obs = _count_exceeding(x_abs=x_abs, thresholds=x_abs[mask])
+    fdr = np.minimum(counts_perm / n_perm / counts_obs, 1)
+    # Monotone in threshold: q-value is the minimum FDR of all lower thresholds
+    idx_sort = np.argsort(x_abs[mask])
+    fdr[idx_sort] = np.minimum.accumulate(fdr[idx_sort])
+    q_vals[mask] = fdr
+    return q_vals
+
+
+def get_sam_curve(x_fc=None, c=None, s0=None, df=None):
+    """Hyperbolic FDR threshold curve (-log10 p-values) of SAM statistics for given log2 fold changes.
+
+    Proteins with ``|fc| / (s + s0) >= c`` are significant, which gives the standard error ``s = |fc| / c - s0``
+    and thus the p-value of the corresponding t-test at the threshold. Undefined (NaN) for ``|fc| <= c * s0``.
+    """
+    x_fc = np.abs(np.asarray(x_fc, dtype=float))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = x_fc / c - s0
+        t_stat = np.where(s > 0, x_fc / s, np.nan)
+        return -np.log10(2 * t_dist.sf(t_stat, df))
+
+
+def sam_contrast(X1=None, X2=None, n_permutations=1000, fdr=0.05, s0=None, random_state=None):
+    """SAM statistics with permutation-based q-values and threshold ``c`` for one contrast (X1 vs. X2)"""
+    X_pair = np.concatenate([X1, X2], axis=1).astype(float)
+    n1, n_tot = X1.shape[1], X_pair.shape[1]
+    x_diff, x_se, x_df = _get_sam_stats(X1=X1.astype(float), X2=X2.astype(float))
+    s0 = estimate_s0(x_diff=x_diff, x_se=x_se) if s0 is None else s0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_d = x_diff / (x_se + s0)
+    x_abs = np.abs(x_d)
+    thresholds = x_abs[~np.isnan(x_abs)]
+    # Centering rows keeps statistics unchanged and sums of squares numerically stable
+    M = (~np.isnan(X_pair)).astype(float)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        X0 = np.nan_to_num(X_pair - np.nanmean(X_pair, axis=1, keepdims=True))
+    # Shuffle sample labels within contrast and process permutations in chunks of bounded memory
+    rng = np.random.default_rng(random_state)
+    perms = rng.permuted(np.tile(np.arange(n_tot), (n_permutations, 1)), axis=1)
+    chunk_size = max(1, _MAX_CHUNK_SIZE // max(len(X_pair), 1))
+    counts_perm = np.zeros(len(thresholds))
+    for i in range(0, n_permutations, chunk_size):
+        counts_perm += _count_permuted(X0=X0, M=M, perms=perms[i:i + chunk_size], n1=n1, s0=s0,
+                                       thresholds=thresholds * (1 - _REL_TOL))
+    q_vals = get_qvals(x_abs=x_abs, counts_perm=counts_perm, n_perm=n_permutations)
+    # Threshold c is the lowest absolute SAM statistic with a q-value below the FDR level
+    mask_sig = q_vals <= fdr
+    c = float(x_abs[mask_sig].min()) if mask_sig.any() else np.nan
+    df = int(np.median(x_df)) if len(x_df) else 0
+    return x_diff, x_d, q_vals, s0, c, df
+
+
+def run_sam(df=None, layout=None, groups_ctrl=None, n_permutations=1000, fdr=0.05, s0=None, n_jobs=None,
+            random_state=None, dtype=float):
+    """
+    Compute SAM statistics for all pairwise contrasts with q-values and thresholds (``s0``, ``c``) estimated
+    by shuffling sample labels within each contrast.
+    """
+    X = layout.get_X(df=df, dtype=dtype)
+    dict_group_pos = layout.dict_group_pos
+    contrasts = _get_contrasts(groups=layout.groups, groups_ctrl=groups_ctrl)
+    # Independent random generator per contrast (results do not depend on n_jobs)
+    list_seeds = np.random.SeedSequence(random_state).spawn(len(contrasts))
+    args = dict(n_permutations=n_permutations, fdr=fdr, s0=s0)
+    list_args = [dict(X1=X[:, dict_group_pos[group]], X2=X[:, dict_group_pos[group_ctrl]], random_state=seed, **args)
+                 for (group, group_ctrl), seed in zip(contrasts, list_seeds)]
+    if n_jobs is None or n_jobs == 1 or len(list_args) == 1:
+        results = [sam_contrast(**kwargs) for kwargs in list_args]
+    else:
+        n_jobs = min(n_jobs, len(list_args))
+        results = Parallel(n_jobs=n_jobs)(delayed(sam_contrast)(**kwargs) for kwargs in list_args)
+    names = [f"({group}/{group_ctrl})" for group, group_ctrl in contrasts]
+    cols = {}
+    for i, str_col in enumerate([ut.STR_FC, ut.STR_SAM, ut.STR_QVAL]):
+        for name, result in zip(names, results):
+            cols[f"{str_col}_{name}"] = result[i].astype(dtype, copy=False)
+    df_sam = pd.DataFrame(cols)
+    df_th = pd.DataFrame([[name, *result[3:]] for name, result in zip(names, results)],
+                         columns=[COL_CONTRAST, COL_S0, COL_C, COL_DF])
+    return df_sam, df_th
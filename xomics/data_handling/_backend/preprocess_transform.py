@@ -0,0 +1,71 @@
+"""
+This is a script for the in-place logarithmic and exponential transformations of PreProcess.apply_log()
+and PreProcess.apply_exp().
+"""
+import numpy as np
+
+LIST_INVALID = ["raise", "nan", "ignore"]
+
+
+# I Helper Functions
+def get_transform_dtype(dtypes=None, dtype=None):
+    """Float data type of transformed values: ``dtype`` if given, otherwise the common float type of ``dtypes``
+    (float64 if not all are float)"""
+    if dtype is not None:
+        return np.dtype(dtype)
+    dtype = np.result_type(*dtypes) if len(dtypes) > 0 else np.dtype(np.float64)
+    return dtype if np.issubdtype(dtype, np.floating) else np.dtype(np.float64)
+
+
+def get_values(df=None, cols=None, dtype=None):
+    """Copy of ``cols`` of df as 2D array in ``dtype``, column-major such that columns can be set back into df
+    without further copies"""
+    X = np.empty((len(df), len(cols)), dtype=dtype, order="F")
+    for i, col in enumerate(cols):
+        X[:, i] = df[col].to_numpy()
+    return X
+
+
+# II Main Functions
+def apply_log(X=None, log2=True, neg=False, invalid="raise", out=None):
+    """Logarithm of 2D array ``X`` computed by a single ufunc call written into ``out`` (``X`` if None).
+
+    Non-positive values are handled via ``invalid``: 'raise' for negative values (zeros give -inf), 'nan' to
+    mask all values <= 0 as NaN, or 'ignore' to keep IEEE results (-inf for zeros, NaN for negative values).
+    NaNs are kept.
+    """
+    out = X if out is None else out
+    f = np.log2 if log2 else np.log10
+    if invalid == "nan":
+        mask = X > 0
+        f(X, out=out, where=mask)
+        out[~mask] = np.nan
+    elif invalid == "raise":
+        # Negative values are detected by the floating point status of the ufunc (no separate scan)
+        with np.errstate(divide="ignore", invalid="raise"):
+            try:
+                f(X, out=out)
+            except FloatingPointError:
+                raise ValueError("Values to log-transform should be >= 0 (use 'invalid' to mask them)")
+    elif invalid == "ignore":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            f(X, out=out)
+    else:
+        raise ValueError(f"'invalid' ({invalid}) should be one of: {LIST_INVALID}")
+    if neg:
+        np.negative(out, out=out)
+    return out
+
+
+def apply_exp(X=None, base=2, neg=False, out=None):
+    """Exponential ``base**X`` (or ``base**-X`` if ``neg``) of 2D array ``X`` written into ``out`` (``X`` if None)"""
+    out = X if out is None else out
+    if neg:
+        np.negative(X, out=out)
+        X = out
+    with np.errstate(over="ignore"):
+        if base == 2:
+            np.exp2(X, out=out)
+        else:
+            np.power(out.dtype.type(base), X, out=out)
+    return out
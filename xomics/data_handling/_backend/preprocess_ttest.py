@@ -0,0 +1,161 @@
+"""
+This is a script for the vectorized t-test engines used by PreProcess.run() for all pairwise contrasts.
+"""
+import numpy as np
+from scipy.special import digamma, polygamma
+from scipy.stats import t as t_dist
+import warnings
+
+LIST_TESTS = ["student", "welch", "paired", "moderated"]
+
+
+# I Helper Functions
+def _get_group_stats(X=None):
+    """Get number of detected values, mean, and variance (ddof=1) for each row of (..., n_samples, n_reps) array"""
+    n = (~np.isnan(X)).sum(axis=-1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        mean = np.nanmean(X, axis=-1)
+        var = np.nanvar(X, axis=-1, ddof=1)
+    return n, mean, var
+
+
+def _get_ss(n=None, var=None):
+    """Sum of squares from number of values and variance (zero for groups with a single value)"""
+    return np.where(n > 1, (n - 1) * var, 0)
+
+
+def _p_two_sided(t_stat=None, df=None):
+    """Two-sided p-values of t statistics (undefined for df <= 0)"""
+    df = np.where(df > 0, df, np.nan)
+    return 2 * t_dist.sf(np.abs(t_stat), df)
+
+
+def _trigamma_inverse(x=None):
+    """Solve trigamma(y) = x for y by Newton iteration (Smyth, 2004)"""
+    if x > 1e7:
+        return 1 / np.sqrt(x)
+    if x < 1e-6:
+        return 1 / x
+    y = 0.5 + 1 / x
+    for _ in range(50):
+        tri = polygamma(1, y)
+        dif = tri * (1 - tri / x) / polygamma(2, y)
+        y += dif
+        if -dif / y < 1e-8:
+            break
+    return y
+
+
+def _student(n1=None, mean1=None, var1=None, n2=None, mean2=None, var2=None):
+    """Two-sided Student's t-test (pooled variance) from group sizes, means, and variances (ddof=1)"""
+    df = n1 + n2 - 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var_pooled = (_get_ss(n=n1, var=var1) + _get_ss(n=n2, var=var2)) / df
+        t_stat = (mean1 - mean2) / np.sqrt(var_pooled * (1 / n1 + 1 / n2))
+    return t_stat, _p_two_sided(t_stat=t_stat, df=df)
+
+
+def _welch(n1=None, mean1=None, var1=None, n2=None, mean2=None, var2=None):
+    """Two-sided Welch's t-test with Welch-Satterthwaite degrees of freedom"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        se1, se2 = var1 / n1, var2 / n2
+        t_stat = (mean1 - mean2) / np.sqrt(se1 + se2)
+        df = (se1 + se2) ** 2 / (se1 ** 2 / (n1 - 1) + se2 ** 2 / (n2 - 1))
+    return t_stat, _p_two_sided(t_stat=t_stat, df=df)
+
+
+def _paired(X1=None, X2=None):
+    """Two-sided paired t-test for replicates paired by position (last axis), omitting incomplete pairs"""
+    n, mean, var = _get_group_stats(X1 - X2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_stat = mean / np.sqrt(var / n)
+    return t_stat, _p_two_sided(t_stat=t_stat, df=n - 1)
+
+
+def _moderated(n1=None, mean1=None, n2=None, mean2=None, s2_post=None, df_total=None):
+    """Two-sided moderated t-test using posterior residual variances"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_stat = (mean1 - mean2) / np.sqrt(s2_post * (1 / n1 + 1 / n2))
+    return t_stat, _p_two_sided(t_stat=t_stat, df=df_total)
+
+
+# II Main Functions
+def get_prior_variance(s2=None, df=None):
+    """Estimate prior variance ``s2_prior`` and prior degrees of freedom ``df_prior`` from residual variances
+    of all proteins by fitting a scaled F-distribution (empirical Bayes, Smyth 2004).
+
+    Proteins without residual degrees of freedom are ignored. Returns infinite ``df_prior`` if variances are
+    less dispersed than expected.
+    """
+    mask = (df > 0) & np.isfinite(s2)
+    s2, df = s2[mask].astype(float), df[mask].astype(float)
+    if len(s2) < 2:
+        return np.nan, 0.0
+    # Avoid log of zero variances (floor relative to median or 1 if at least half of the variances are zero)
+    s2_median = np.median(s2)
+    s2 = np.maximum(s2, 1e-5 * (s2_median if s2_median > 0 else 1))
+    e = np.log(s2) - digamma(df / 2) + np.log(df / 2)
+    e_mean = e.mean()
+    e_var = ((e - e_mean) ** 2).sum() / (len(e) - 1) - polygamma(1, df / 2).mean()
+    if e_var <= 0:
+        return np.exp(e_mean), np.inf
+    df_prior = 2 * _trigamma_inverse(e_var)
+    s2_prior = np.exp(e_mean + digamma(df_prior / 2) - np.log(df_prior / 2))
+    return s2_prior, df_prior
+
+
+def get_moderated_variance(n=None, var=None):
+    """Posterior (moderated) residual variances and total degrees of freedom of a one-way design over all groups.
+
+    The prior is estimated once for the dataset and shared across all contrasts.
+
+    Parameters
+    ----------
+    n, var: array-like, shape (n_samples, n_groups)
+        Number of detected values and variance (ddof=1) per group
+    """
+    df_res = np.maximum(n - 1, 0).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s2 = _get_ss(n=n, var=var).sum(axis=1) / df_res
+    s2_prior, df_prior = get_prior_variance(s2=s2, df=df_res)
+    s2 = np.where(df_res > 0, s2, 0)
+    if np.isinf(df_prior):
+        s2_post = np.full(len(s2), s2_prior)
+    else:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            s2_post = (df_prior * s2_prior + df_res * s2) / (df_prior + df_res)
+    # Total degrees of freedom limited by residual degrees of freedom of whole dataset
+    df_total = np.minimum(df_prior + df_res, df_res.sum())
+    return s2_post, df_total
+
+
+def ttest_contrasts(X=None, dict_group_pos=None, contrasts=None, test="student"):
+    """Batched pairwise t-tests for all contrasts (group, group_ctrl) computed from group-wise statistics.
+
+    Group sizes, means, and variances are obtained once for all groups. For ``test='paired'``, replicates of
+    both groups are paired by their position. Returns log2 fold changes (mean(group_ctrl) - mean(group)),
+    t statistics, and p-values, each of shape (n_samples, n_contrasts).
+    """
+    groups = list(dict_group_pos)
+    list_group_pos = [dict_group_pos[g] for g in groups]
+    n, mean, var = (np.stack(x, axis=1) for x in zip(*[_get_group_stats(X[:, pos]) for pos in list_group_pos]))
+    i1 = [groups.index(group) for group, _ in contrasts]
+    i2 = [groups.index(group_ctrl) for _, group_ctrl in contrasts]
+    args1, args2 = dict(n1=n[:, i1], mean1=mean[:, i1]), dict(n2=n[:, i2], mean2=mean[:, i2])
+    if test == "student":
+        t_stats, p_values = _student(**args1, **args2, var1=var[:, i1], var2=var[:, i2])
+    elif test == "welch":
+        t_stats, p_values = _welch(**args1, **args2, var1=var[:, i1], var2=var[:, i2])
+    elif test == "paired":
+        X1 = np.stack([X[:, dict_group_pos[group]] for group, _ in contrasts], axis=1)
+        X2 = np.stack([X[:, dict_group_pos[group_ctrl]] for _, group_ctrl in contrasts], axis=1)
+        t_stats, p_values = _paired(X1=X1, X2=X2)
+    elif test == "moderated":
+        s2_post, df_total = get_moderated_variance(n=n, var=var)
+        t_stats, p_values = _moderated(**args1, **args2, s2_post=s2_post[:, np.newaxis],
+                                       df_total=df_total[:, np.newaxis])
+    else:
+        raise ValueError(f"'test' ({test}) should be one of: {LIST_TESTS}")
+    fold_changes = mean[:, i2] - mean[:, i1]
+    return fold_changes, t_stats, p_values
@@ -3,24 +3,24 @@ This is a script for pre the interface of preprocessing omics data.
 """
 import pandas as pd
 import numpy as np
-from typing import Optional
+from typing import Optional, Tuple, Union
 
 import xomics.utils as ut
-from ._backend.preprocess_run import run_preprocess
+from xomics.config import check_dtype, check_n_jobs, check_random_state
+from ._backend.preprocess_run import run_preprocess, run_preprocess_pooled
+from ._backend.preprocess_ttest import LIST_TESTS
+from ._backend.preprocess_pvals import LIST_PVALS_METHODS, LIST_PVALS_FAMILIES
+from ._backend.preprocess_anova import run_anova, LIST_ANOVA_TESTS
+from ._backend.preprocess_sam import run_sam, get_sam_curve
 from ._backend.preprocess_filter import filter_duplicated_names, filter_groups
+from ._backend.preprocess_transform import (apply_log, apply_exp, get_values, get_transform_dtype,
+                                             LIST_INVALID)
 
 # TODO finish testing, test on real data in dev_scripts
 # TODO Filter for number of quantifications
 
 
 # I Helper Functions
-def check_all_positive(df=None):
-    """"""
-    min_val = df.min().min()
-    if min_val < 0:
-        raise ValueError(f"Minimum value ({min_val}) in 'df' should be >= 0")
-
-
 def check_base(base=None):
     """Ensure 'base' is a valid numerical type and has an acceptable value"""
     if not isinstance(base, (int, float)) or base not in [2, 10]:
@@ -42,6 +42,26 @@ def check_match_df_ids(df=None, list_ids=None):
         raise ValueError("'ids' should be a list or a pandas.DataFrame column")
 
 
+def check_match_df_x_imps(df=None, X_imps=None, cols_quant=None):
+    """Check if stacked imputations match with rows and quantification columns of df"""
+    if not isinstance(X_imps, np.ndarray) or X_imps.ndim != 3:
+        raise ValueError("'X_imps' should be a 3D numpy array (n_imputations, n_samples, n_quant_columns)")
+    if X_imps.shape[1:] != (len(df), len(cols_quant)):
+        raise ValueError(f"Shape of 'X_imps' ({X_imps.shape}) does not match with 'df' "
+                         f"(n_samples={len(df)}, n_quant_columns={len(cols_quant)})")
+
+
+def check_match_groups_paired(df=None, groups=None, groups_ctrl=None, str_quant=None):
+    """Check if groups and control groups have the same number of replicates for paired t-tests"""
+    dict_group_qcols = ut.get_dict_group_qcols(df=df, groups=groups, str_quant=str_quant)
+    for group in groups:
+        for group_ctrl in groups_ctrl:
+            n, n_ctrl = len(dict_group_qcols[group]), len(dict_group_qcols.get(group_ctrl, []))
+            if group != group_ctrl and n != n_ctrl:
+                raise ValueError(f"For paired t-tests, '{group}' (n={n}) and '{group_ctrl}' (n={n_ctrl}) "
+                                 f"should have the same number of replicates")
+
+
 # II Main Functions
 class PreProcess:
     """
@@ -197,7 +217,8 @@ class PreProcess:
                       df: pd.DataFrame = None,
                       groups: Optional[ut.ArrayLike1D] = None,
                       min_pct: float = 0.8,
-                      ) -> pd.DataFrame:
+                      return_pct: bool = False,
+                      ) -> Union[pd.DataFrame, Tuple[pd.DataFrame, pd.DataFrame]]:
         """
         Remove samples with missing values unless one group has at least ``min_pct`` non-missing values.
 
@@ -209,18 +230,32 @@ class PreProcess:
             List with names grouping conditions from ``df`` columns.
         min_pct
             Minimum percentage threshold of non-missing values in at least one group.
+        return_pct
+            Whether to return the percentage of non-missing values per group for the retained samples.
 
         Returns
         -------
         df
             The filtered DataFrame.
+        df_pct : pd.DataFrame, shape (n_samples, n_groups)
+            Percentage of non-missing values (between 0 and 1) for each group (columns) aligned to the rows of
+            the filtered ``df``. Only returned if ``return_pct=True``.
+
+        Notes
+        -----
+        - Percentages are obtained for all samples at once by summing the non-missing mask over the
+          quantification columns of each group.
         """
         ut.check_df(df=df)
         ut.check_match_df_groups(groups=groups, df=df, str_quant=self.str_quant)
         ut.check_number_range(name="min_pct", val=min_pct, min_val=0, max_val=1, just_int=False, accept_none=False)
+        ut.check_bool(name="return_pct", val=return_pct)
         # Filtering
-        dict_groups_qcols = self.get_dict_group_qcols(df=df, groups=groups)
-        df = filter_groups(df=df, groups=groups, dict_groups_qcols=dict_groups_qcols, min_pct=min_pct)
+        layout = ut.get_quant_layout(df=df, groups=groups, str_quant=self.str_quant)
+        if return_pct:
+            df, df_pct = filter_groups(df=df, layout=layout, min_pct=min_pct, return_pct=True)
+            return df.reset_index(drop=True), df_pct.reset_index(drop=True)
+        df = filter_groups(df=df, layout=layout, min_pct=min_pct)
         df = df.reset_index(drop=True)
         return df
 
@@ -229,7 +264,8 @@ class PreProcess:
                                 col: str = None,
                                 str_split: str = ";",
                                 split_names: bool = False,
-                                ) -> pd.DataFrame:
+                                return_dropped: bool = False,
+                                ) -> Union[pd.DataFrame, Tuple[pd.DataFrame, pd.Index]]:
         """
         Filter for duplicated items in columns (e.g., names). Items can be split by ``str_split``.
 
@@ -244,18 +280,33 @@ class PreProcess:
             The string character(s) to use for splitting string values in ``col``.
         split_names
             Whether to split names using `str_split` in the specified `cols`.
+        return_dropped
+            Whether to return the index of rows dropped as duplicates.
 
         Returns
         -------
         df
             The modified and filtered DataFrame.
+        index_dropped : pd.Index
+            Index labels of ``df`` (before filtering) of rows dropped as duplicates of a preceding row.
+            Only returned if ``return_dropped=True``.
+
+        Notes
+        -----
+        - Rows with missing, datetime (e.g., gene names converted by Excel), or float values in ``col``
+          are removed. From duplicates, the first occurring row is kept.
         """
         ut.check_df(df=df)
         df = ut.check_df(df=df, name="df", cols_requiered=col, accept_none=False, accept_nan=True)
         ut.check_str(name="str_split", val=str_split)
         ut.check_bool(name="split_names", val=split_names)
+        ut.check_bool(name="return_dropped", val=return_dropped)
         # Filtering
         df = df.dropna(subset=col)
+        if return_dropped:
+            df, index_dropped = filter_duplicated_names(df=df, cols=col, split_names=split_names,
+                                                        str_split=str_split, return_dropped=True)
+            return df.reset_index(drop=True), index_dropped
         df = filter_duplicated_names(df=df, cols=col, split_names=split_names, str_split=str_split)
         df = df.reset_index(drop=True)
         return df
@@ -265,6 +316,9 @@ class PreProcess:
                   cols: list = None,
                   log2: bool = True,
                   neg: bool = False,
+                  invalid: str = "raise",
+                  inplace: bool = True,
+                  dtype: Optional[str] = None,
                   ) -> pd.DataFrame:
         """
         Apply a logarithmic transformation to specified columns of a DataFrame.
@@ -279,6 +333,19 @@ class PreProcess:
             If True, apply a log2 transformation. Otherwise, apply a log10 transformation.
         neg
             If True, multiply the logarithmic result by -1.
+        invalid : {'raise', 'nan', 'ignore'}, default='raise'
+            How to handle non-positive values:
+
+            - 'raise': Raise an error for negative values (zeros are transformed into -inf).
+            - 'nan': Mask all values <= 0 as NaN.
+            - 'ignore': Keep results of the logarithm (-inf for zeros and NaN for negative values).
+
+        inplace
+            If True (default), transformed columns are set in ``df``. Otherwise, a copy of ``df`` is returned
+            and ``df`` is not modified.
+        dtype : {'float32', 'float64'}, optional
+            Float data type of transformed columns. If None, the float type of ``cols`` is preserved
+            (float64 for non-float columns).
 
         Returns
         -------
@@ -287,7 +354,7 @@ class PreProcess:
 
         Notes
         -----
-        - Make sure all values in the specified columns of df are > 0 before applying this function.
+        - The transformation is computed by a single ufunc call over all specified columns.
         - NaN values will remain NaN after the transformation.
         """
         # Check input
@@ -295,14 +362,18 @@ class PreProcess:
             cols = list(df)
         cols = ut.check_list_like(name="cols", val=cols, accept_none=False, accept_str=True)
         df = ut.check_df(df=df, name="df", cols_requiered=cols, accept_none=False, accept_nan=True)
-        check_all_positive(df=df[cols])
         ut.check_bool(name="log2", val=log2)
         ut.check_bool(name="neg", val=neg)
-        # Log transform
-        f = np.log2 if log2 else np.log10
-        df[cols] = df[cols].apply(f)
-        if neg:
-            df[cols] *= -1
+        ut.check_bool(name="inplace", val=inplace)
+        if invalid not in LIST_INVALID:
+            raise ValueError(f"'invalid' ({invalid}) should be one of: {LIST_INVALID}")
+        dtype = get_transform_dtype(dtypes=df.dtypes[cols], dtype=None if dtype is None else check_dtype(dtype))
+        # Log transform (on a copy of the values)
+        X = get_values(df=df, cols=cols, dtype=dtype)
+        apply_log(X=X, log2=log2, neg=neg, invalid=invalid)
+        if not inplace:
+            df = df.copy(deep=False)
+        df[cols] = X
         return df
 
     @staticmethod
@@ -310,6 +381,8 @@ class PreProcess:
                   cols: list = None,
                   base: int = 2.0,
                   neg: bool = False,
+                  inplace: bool = True,
+                  dtype: Optional[str] = None,
                   ) -> pd.DataFrame:
         """
         Apply an exponential transformation to specified columns of a DataFrame.
@@ -324,7 +397,14 @@ class PreProcess:
             The base of the exponential function. If ``base=2``, apply a 2**x transformation,
             otherwise apply a 10**x transformation if ``base=10``.
         neg
-            If True, multiply the exponential result by -1.
+            If True, multiply the values by -1 before the exponential transformation (inverse of ``apply_log``
+            with ``neg=True``).
+        inplace
+            If True (default), transformed columns are set in ``df``. Otherwise, a copy of ``df`` is returned
+            and ``df`` is not modified.
+        dtype : {'float32', 'float64'}, optional
+            Float data type of transformed columns. If None, the float type of ``cols`` is preserved
+            (float64 for non-float columns).
 
         Returns
         -------
@@ -333,6 +413,7 @@ class PreProcess:
 
         Notes
         -----
+        - The transformation is computed by a single ufunc call over all specified columns.
         - NaN values will remain NaN after the transformation.
         """
         # Check input
@@ -342,11 +423,15 @@ class PreProcess:
         cols = ut.check_list_like(name="cols", val=cols, accept_none=False, accept_str=True)
         df = ut.check_df(df=df, name="df", cols_requiered=cols, accept_none=False, accept_nan=True)
         ut.check_bool(name="neg", val=neg)
+        ut.check_bool(name="inplace", val=inplace)
         check_base(base=base)
-        # Exponential transform
-        if neg:
-            df[cols] *= -1
-        df[cols] = df[cols].apply(lambda x: np.power(base, x))
+        dtype = get_transform_dtype(dtypes=df.dtypes[cols], dtype=None if dtype is None else check_dtype(dtype))
+        # Exponential transform (on a copy of the values)
+        X = get_values(df=df, cols=cols, dtype=dtype)
+        apply_exp(X=X, base=base, neg=neg)
+        if not inplace:
+            df = df.copy(deep=False)
+        df[cols] = X
         return df
 
     def add_ids(self,
@@ -419,12 +504,62 @@ class PreProcess:
         df[ut.COL_SIG_CLASS] = ut.get_sig_classes(df=df, col_fc=col_fc, col_pval=col_pval, th_pval=th_pval, th_fc=th_fc)
         return df
 
+    @staticmethod
+    def add_significance_contrasts(df: pd.DataFrame = None,
+                                   th_fc: float = 0.5,
+                                   th_pval: float = 0.05
+                                   ) -> pd.DataFrame:
+        """Add a significance column for each group comparison regarding threshold for fold change and p-value
+
+        Significance classes (Up, Down, Unchanged) are defined as in :meth:`PreProcess.add_significance` and
+        obtained for all group comparisons at once.
+
+        Parameters
+        ----------
+        df
+            DataFrame containing fold-change and p-values for group comparisons as obtained by :meth:`PreProcess.run`.
+        th_fc
+            Threshold for fold-change, applied for negative and positive values.
+        th_pval
+            Threshold for p-value, -log10 transformed before applied.
+
+        Returns
+        -------
+        df
+            DataFrame with added categorical significance column (``sig_class_(group/group_ctrl)``) for each
+            group comparison.
+
+        Notes
+        -----
+        - Group comparisons are given by pairs of fold change (``log2_fc_(group/group_ctrl)``) and
+          p-value (``-log10_p-value_(group/group_ctrl)``) columns.
+        """
+        # Check input
+        df = ut.check_df(name="df", df=df, accept_none=False)
+        ut.check_number_range(name="th_fc", val=th_fc, min_val=0, just_int=False)
+        ut.check_number_range(name="th_pval", val=th_pval, min_val=0, max_val=1, just_int=False)
+        contrasts = ut.get_contrast_names(df=df)
+        if len(contrasts) == 0:
+            raise ValueError(f"'df' should contain fold change ('{ut.STR_FC}_*') and corresponding p-value "
+                             f"('{ut.STR_PVAL}_*') columns.")
+        # Add significant classes (Up, Down, Not Sig.) of all contrasts at once
+        X_fc = df[[f"{ut.STR_FC}_{c}" for c in contrasts]].to_numpy(dtype=float)
+        X_pval = df[[f"{ut.STR_PVAL}_{c}" for c in contrasts]].to_numpy(dtype=float)
+        sig_codes = ut.get_sig_codes(x_fc=X_fc, x_pval=X_pval, th_pval=-np.log10(th_pval), th_fc=th_fc)
+        dtype_sig = pd.CategoricalDtype(categories=ut.LIST_SIG_CLASSES)
+        df_sig = pd.DataFrame({f"{ut.COL_SIG_CLASS}_{c}": pd.Categorical.from_codes(sig_codes[:, i], dtype=dtype_sig)
+                               for i, c in enumerate(contrasts)}, index=df.index)
+        df = pd.concat([df, df_sig], axis=1)
+        return df
+
     def run(self,
             df: pd.DataFrame = None,
             groups: ut.ArrayLike1D = None,
             groups_ctrl: list = None,
             pvals_correction: Optional[str] = None,
-            pvals_neg_log10: bool = True
+            pvals_neg_log10: bool = True,
+            test: str = "student",
+            pvals_family: str = "contrast",
             ) -> pd.DataFrame:
         """
         Perform pairwise t-tests for groups to obtain -log10 p-values and log2 fold changes,
@@ -439,9 +574,21 @@ class PreProcess:
         groups_ctrl
             List with names control grouping conditions from ``df`` columns.
         pvals_correction
-            Correction method for t-tests {"bonferroni", "sidak", "holm", "hommel", "fdr_bh"}.
+            Correction method for t-tests {"bonferroni", "sidak", "holm", "hommel", "fdr_bh", "fdr_by"}.
+            Missing p-values are ignored for the correction.
         pvals_neg_log10
             Whether to return p-values in -log10 scale.
+        test : {'student', 'welch', 'paired', 'moderated'}, default='student'
+            Type of two-sided t-test:
+
+            - ``student``: Student's t-test assuming equal variances.
+            - ``welch``: Welch's t-test for unequal variances.
+            - ``paired``: Paired t-test, where replicates of both groups are paired by their order in ``df``.
+            - ``moderated``: Empirical Bayes moderated t-test (as in limma), where protein-wise variances are
+              shrunk towards a prior variance estimated once from all proteins and groups.
+
+        pvals_family : {'contrast', 'global'}, default='contrast'
+            Whether p-values are corrected for each group comparison (``contrast``) or all at once (``global``).
 
         Returns
         -------
@@ -450,8 +597,13 @@ class PreProcess:
 
         Notes
         -----
-        Fold changes (FC) and P-values will be computed for each group in ``groups`` compared against
-        each group in ``group_ctrl`` (group/group_ctrl), where self-comparison is omitted.
+        - Fold changes (FC) and P-values will be computed for each group in ``groups`` compared against
+          each group in ``group_ctrl`` (group/group_ctrl), where self-comparison is omitted.
+        - Quantifications, FC, and p-values are kept in the float data type given by ``options['dtype']``.
+        - Fold changes are the difference of group means for all types of t-tests. For paired t-tests,
+          incomplete pairs are omitted.
+        - For moderated t-tests, residual variances are pooled over all groups in ``groups`` such that
+          the prior (Smyth, 2004) is shared across all contrasts.
         """
         # Check input
         df = ut.check_df(df=df, accept_none=False)
@@ -459,15 +611,255 @@ class PreProcess:
         if groups_ctrl is None:
             groups_ctrl = groups
         groups_ctrl = ut.check_list_like(name="groups_ctrl", val=groups_ctrl)
-        ut.check_str_in_list(name="pvals_method", val=pvals_correction, accept_none=True,
-                             list_options=["bonferroni", "sidak", "holm", "hommel", "fdr_bh"])
+        ut.check_str_in_list(name="pvals_correction", val=pvals_correction, accept_none=True,
+                             list_options=LIST_PVALS_METHODS)
+        ut.check_str_in_list(name="pvals_family", val=pvals_family, list_options=LIST_PVALS_FAMILIES)
         ut.check_bool(name="pvals_neg_log10", val=pvals_neg_log10)
         ut.check_match_df_groups(df=df, groups=groups, str_quant=self.str_quant)
         ut.check_match_df_groups(df=df, groups=groups_ctrl, name_groups="groups_ctrl", str_quant=self.str_quant)
-        # Get the mapping dictionaries
-        df_fc = run_preprocess(df=df, groups=groups, groups_ctrl=groups_ctrl,
+        ut.check_str_in_list(name="test", val=test, list_options=LIST_TESTS)
+        if test == "paired":
+            check_match_groups_paired(df=df, groups=groups, groups_ctrl=groups_ctrl, str_quant=self.str_quant)
+        # Pairwise t-tests using column layout of groups
+        layout = ut.get_quant_layout(df=df, groups=groups, str_quant=self.str_quant)
+        df_fc = run_preprocess(df=df, layout=layout, groups_ctrl=groups_ctrl,
                                pvals_method=pvals_correction, pvals_neg_log10=pvals_neg_log10,
-                               str_quant=self.str_quant)
-        df_fc.insert(0, self.col_id, df[self.col_id])
-        df_fc.insert(1, self.col_name, df[self.col_name])
+                               dtype=check_dtype(), test=test, pvals_family=pvals_family)
+        df_fc.insert(0, self.col_id, df[self.col_id].to_numpy())
+        df_fc.insert(1, self.col_name, df[self.col_name].to_numpy())
+        return df_fc
+
+    def run_anova(self,
+                  df: pd.DataFrame = None,
+                  groups: ut.ArrayLike1D = None,
+                  test: str = "anova",
+                  pvals_correction: Optional[str] = None,
+                  pvals_neg_log10: bool = True,
+                  th_pval: Optional[float] = None,
+                  ) -> pd.DataFrame:
+        """
+        Perform one multi-group test per protein over all groups (omnibus test) to obtain F or H statistics
+        and -log10 p-values, with optional p-value correction and filtering.
+
+        Parameters
+        ----------
+        df : pd.DataFrame, shape (n_samples, n_conditions)
+            DataFrame with quantifications. ``Rows`` typically correspond to proteins and ``columns`` to conditions.
+        groups : array-like, shape (n_groups,)
+            List with names grouping conditions from ``df`` columns.
+        test : {'anova', 'kruskal'}, default='anova'
+            Type of multi-group test:
+
+            - ``anova``: One-way ANOVA (F statistic).
+            - ``kruskal``: Kruskal-Wallis H test on ranks (corrected for ties).
+
+        pvals_correction
+            Correction method for p-values {"bonferroni", "sidak", "holm", "hommel", "fdr_bh", "fdr_by"}.
+        pvals_neg_log10
+            Whether to return p-values in -log10 scale.
+        th_pval
+            If given, only proteins with a (corrected) p-value <= ``th_pval`` are returned.
+
+        Returns
+        -------
+        df_anova
+            DataFrame with test statistic ('F' or 'H') and p-value for each protein, indexed like ``df``.
+
+        Notes
+        -----
+        - Statistics are obtained for all proteins at once. Missing values are ignored and groups without
+          values are omitted for the respective protein.
+        - Use ``th_pval`` to restrict pairwise comparisons by :meth:`PreProcess.run` to proteins differing
+          between any groups, e.g., ``pp.run(df=df.loc[df_anova.index], groups=groups)``.
+        """
+        # Check input
+        df = ut.check_df(df=df, accept_none=False)
+        groups = ut.check_list_like(name="groups", val=groups, accept_none=False)
+        ut.check_match_df_groups(df=df, groups=groups, str_quant=self.str_quant)
+        ut.check_str_in_list(name="test", val=test, list_options=LIST_ANOVA_TESTS)
+        ut.check_str_in_list(name="pvals_correction", val=pvals_correction, accept_none=True,
+                             list_options=LIST_PVALS_METHODS)
+        ut.check_bool(name="pvals_neg_log10", val=pvals_neg_log10)
+        ut.check_number_range(name="th_pval", val=th_pval, min_val=0, max_val=1, just_int=False, accept_none=True)
+        # Multi-group test for all proteins
+        layout = ut.get_quant_layout(df=df, groups=groups, str_quant=self.str_quant)
+        df_anova = run_anova(df=df, layout=layout, test=test, pvals_method=pvals_correction,
+                             pvals_neg_log10=pvals_neg_log10, dtype=check_dtype())
+        df_anova.insert(0, self.col_id, df[self.col_id])
+        df_anova.insert(1, self.col_name, df[self.col_name])
+        if th_pval is not None:
+            p_values = 10 ** -df_anova[ut.STR_PVAL] if pvals_neg_log10 else df_anova[ut.STR_PVAL]
+            df_anova = df_anova[p_values <= th_pval]
+        return df_anova
+
+    def run_pooled(self,
+                   df: pd.DataFrame = None,
+                   X_imps: np.ndarray = None,
+                   groups: ut.ArrayLike1D = None,
+                   groups_ctrl: list = None,
+                   pvals_correction: Optional[str] = None,
+                   pvals_neg_log10: bool = True,
+                   pvals_family: str = "contrast",
+                   ) -> pd.DataFrame:
+        """
+        Perform pairwise t-tests for groups on multiple imputations and pool log2 fold changes and p-values
+        by Rubin's rules.
+
+        Parameters
+        ----------
+        df : pd.DataFrame, shape (n_samples, n_conditions)
+            DataFrame with quantifications (before imputation) used for identifiers and quantification columns.
+        X_imps : array-like, shape (n_imputations, n_samples, n_quant_columns)
+            Stacked imputations obtained by :meth:`cImpute.run` with ``n_imputations``.
+        groups : array-like, shape (n_groups,)
+            List with names grouping conditions from ``df`` columns.
+        groups_ctrl
+            List with names control grouping conditions from ``df`` columns.
+        pvals_correction
+            Correction method for t-tests {"bonferroni", "sidak", "holm", "hommel", "fdr_bh", "fdr_by"}.
+            Missing p-values are ignored for the correction.
+        pvals_neg_log10
+            Whether to return p-values in -log10 scale.
+        pvals_family : {'contrast', 'global'}, default='contrast'
+            Whether p-values are corrected for each group comparison (``contrast``) or all at once (``global``).
+
+        Returns
+        -------
+        df_fc
+            DataFrame with pooled p-values and log2 fold changes for each group comparison.
+
+        Notes
+        -----
+        - For each imputation, the fold change and its variance (pooled variance of Student's t-test) are computed.
+          Fold changes are averaged and the total variance is the sum of within- and between-imputation
+          variance. P-values are obtained from a t-distribution with degrees of freedom following Barnard and
+          Rubin (1999).
+        - Columns of ``X_imps`` must be ordered as given by :meth:`PreProcess.get_qcols` for ``groups``.
+        """
+        # Check input
+        df = ut.check_df(df=df, accept_none=False)
+        groups = ut.check_list_like(name="groups", val=groups, accept_none=False)
+        if groups_ctrl is None:
+            groups_ctrl = groups
+        groups_ctrl = ut.check_list_like(name="groups_ctrl", val=groups_ctrl)
+        ut.check_str_in_list(name="pvals_correction", val=pvals_correction, accept_none=True,
+                             list_options=LIST_PVALS_METHODS)
+        ut.check_str_in_list(name="pvals_family", val=pvals_family, list_options=LIST_PVALS_FAMILIES)
+        ut.check_bool(name="pvals_neg_log10", val=pvals_neg_log10)
+        ut.check_match_df_groups(df=df, groups=groups, str_quant=self.str_quant)
+        ut.check_match_df_groups(df=df, groups=groups_ctrl, name_groups="groups_ctrl", str_quant=self.str_quant)
+        layout = ut.get_quant_layout(df=df, groups=groups, str_quant=self.str_quant)
+        check_match_df_x_imps(df=df, X_imps=X_imps, cols_quant=layout.cols_quant)
+        # Pool pairwise t-tests over imputations
+        df_fc = run_preprocess_pooled(X_imps=X_imps, layout=layout, groups_ctrl=groups_ctrl,
+                                      pvals_method=pvals_correction, pvals_neg_log10=pvals_neg_log10,
+                                      dtype=check_dtype(), pvals_family=pvals_family)
+        df_fc.insert(0, self.col_id, df[self.col_id].to_numpy())
+        df_fc.insert(1, self.col_name, df[self.col_name].to_numpy())
         return df_fc
+
+    def run_sam(self,
+                df: pd.DataFrame = None,
+                groups: ut.ArrayLike1D = None,
+                groups_ctrl: list = None,
+                n_permutations: int = 1000,
+                fdr: float = 0.05,
+                s0: Optional[float] = None,
+                n_jobs: Optional[int] = None,
+                random_state: Optional[int] = None,
+                ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Compute SAM statistics for pairwise group comparisons with permutation-based q-values and
+        data-driven thresholds for volcano plots (as in Perseus).
+
+        Parameters
+        ----------
+        df : pd.DataFrame, shape (n_samples, n_conditions)
+            DataFrame with quantifications. ``Rows`` typically correspond to proteins and ``columns`` to conditions.
+        groups : array-like, shape (n_groups,)
+            List with names grouping conditions from ``df`` columns.
+        groups_ctrl
+            List with names control grouping conditions from ``df`` columns.
+        n_permutations
+            Number of random permutations of sample labels for each group comparison.
+        fdr
+            False discovery rate level used to obtain the threshold ``c``.
+        s0
+            Fudge factor added to standard errors. If ``None``, estimated for each group comparison
+            following Tusher et al. (2001).
+        n_jobs : int, optional
+            Number of CPU cores used for permutations. If ``None``, computed sequentially.
+        random_state : int, optional
+            Seed for permutations. If ``None``, permutations are not reproducible.
+
+        Returns
+        -------
+        df_sam
+            DataFrame with log2 fold changes, SAM statistics, and q-values for each group comparison.
+        df_th
+            DataFrame with ``s0``, threshold ``c``, and degrees of freedom ``df`` for each group comparison.
+
+        Notes
+        -----
+        - SAM statistics are ``d = fc / (s + s0)``, where ``fc`` is the log2 fold change (group_ctrl - group)
+          and ``s`` is the standard error of Student's t-test.
+        - Sample labels are shuffled between both groups of a comparison. Statistics of all permutations are
+          computed at once by matrix products of group-wise sums.
+        - Proteins with ``|d| >= c`` are significant at the given ``fdr``, where ``c`` is NaN if no protein
+          is significant. Thresholds are shown as hyperbolic curves in volcano plots via
+          :meth:`PreProcess.get_sam_curve`.
+        """
+        # Check input
+        df = ut.check_df(df=df, accept_none=False)
+        groups = ut.check_list_like(name="groups", val=groups, accept_none=False)
+        if groups_ctrl is None:
+            groups_ctrl = groups
+        groups_ctrl = ut.check_list_like(name="groups_ctrl", val=groups_ctrl)
+        ut.check_match_df_groups(df=df, groups=groups, str_quant=self.str_quant)
+        ut.check_match_df_groups(df=df, groups=groups_ctrl, name_groups="groups_ctrl", str_quant=self.str_quant)
+        ut.check_number_range(name="n_permutations", val=n_permutations, min_val=1, just_int=True,
+                              accept_none=False)
+        ut.check_number_range(name="fdr", val=fdr, min_val=0, max_val=1, just_int=False, accept_none=False)
+        ut.check_number_range(name="s0", val=s0, min_val=0, just_int=False, accept_none=True)
+        n_jobs = check_n_jobs(n_jobs=n_jobs)
+        random_state = check_random_state(random_state=random_state)
+        # Permutation-based FDR
+        layout = ut.get_quant_layout(df=df, groups=groups, str_quant=self.str_quant)
+        df_sam, df_th = run_sam(df=df, layout=layout, groups_ctrl=groups_ctrl, n_permutations=n_permutations,
+                                fdr=fdr, s0=s0, n_jobs=n_jobs, random_state=random_state, dtype=check_dtype())
+        df_sam.insert(0, self.col_id, df[self.col_id].to_numpy())
+        df_sam.insert(1, self.col_name, df[self.col_name].to_numpy())
+        return df_sam, df_th
+
+    @staticmethod
+    def get_sam_curve(x_fc: ut.ArrayLike1D = None,
+                      c: float = None,
+                      s0: float = None,
+                      df: int = None,
+                      ) -> np.ndarray:
+        """
+        Get hyperbolic FDR threshold curve of SAM statistics as -log10 p-values for given log2 fold changes.
+
+        Parameters
+        ----------
+        x_fc : array-like, shape (n_points,)
+            Log2 fold changes at which the curve is evaluated.
+        c
+            Threshold for absolute SAM statistics as obtained by :meth:`PreProcess.run_sam`.
+        s0
+            Fudge factor as obtained by :meth:`PreProcess.run_sam`.
+        df
+            Degrees of freedom of the t-test as obtained by :meth:`PreProcess.run_sam`.
+
+        Returns
+        -------
+        y_curve
+            -log10 p-values of the curve, which are NaN for ``|fc| <= c * s0``.
+        """
+        # Check input
+        x_fc = ut.check_list_like(name="x_fc", val=x_fc, accept_none=False)
+        ut.check_number_range(name="c", val=c, min_val=0, just_int=False, accept_none=False)
+        ut.check_number_range(name="s0", val=s0, min_val=0, just_int=False, accept_none=False)
+        ut.check_number_range(name="df", val=df, min_val=1, just_int=True, accept_none=False)
+        y_curve = get_sam_curve(x_fc=x_fc, c=c, s0=s0, df=df)
+        return y_curve
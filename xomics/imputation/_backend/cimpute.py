@@ -4,28 +4,26 @@ This is a script for backend of the cImpute class
 import pandas as pd
 import numpy as np
 from scipy.stats import truncnorm
-from sklearn.impute import KNNImputer
+from joblib import Parallel, delayed
 
 import xomics.utils as ut
+from .knn import knn_impute, as_float_array
 
+# Codes of missing value classes (positions in ut.LIST_MV_CLASSES)
+_MV_CODES = {mv_class: i for i, mv_class in enumerate(ut.LIST_MV_CLASSES)}
+_ARR_MV_CLASSES = np.array(ut.LIST_MV_CLASSES, dtype=object)
 
 # I Helper Functions
-def _compute_cs(vals=None, mv_class=None, n=None):
-    """Compute confidence score (CS) depending on missing value category and
-    proportion of missing values"""
-    # TODO adjust for MNAR to go up if number of values increase again (minimum if n nan == n/2)
-    count_nan = lambda val: len([x for x in val if str(x) == "nan"])
-    if mv_class == ut.STR_NM:
-        return 1
-    elif mv_class == ut.STR_MAR:
-        return 0
-    elif mv_class == ut.STR_MCAR:
-        return round((n - count_nan(vals)) / n, 2)
-    elif mv_class == ut.STR_MNAR:
-        return round(count_nan(vals) / n, 2)
+def _draw_mnr(size=None, d_min=None, up_mnar=None, random_state=None):
+    """Draw values for MNAR missing values from truncated (left-censored) normal distribution"""
+    # TODO optimize or justify scale factor (middle of MNAR so far. Could be adjusted based on std of distribution)
+    # Factor to control size of standard deviation of left-censored distribution
+    scale = (up_mnar - d_min/2)
+    vals = truncnorm.rvs(a=0, b=1, size=size, loc=d_min, scale=scale, random_state=random_state)
+    return vals
 
 
-def _impute_mnr(df=None, d_min=None, up_mnar=None):
+def _impute_mnr(X=None, d_min=None, up_mnar=None, random_state=None):
     """MinProb imputation as suggested by Lazar et al., 2016
 
     See also
@@ -33,167 +31,246 @@ def _impute_mnr(df=None, d_min=None, up_mnar=None):
     https://www.rdocumentation.org/packages/imputeLCMD/versions/2.0/topics/impute.MinProb
     https://bioconductor.org/packages/release/bioc/vignettes/DEP/inst/doc/MissingValues.html
     """
-    df = df.copy()
-    d1, d2 = df.shape
-    # TODO optimize or justify scale factor (middle of MNAR so far. Could be adjusted based on std of distribution)
-    # Factor to control size of standard deviation of left-censored distribution
-    scale = (up_mnar - d_min/2)
-    # Generate random numbers using truncated (left-censored) normal distribution
-    vals = truncnorm.rvs(a=0, b=1, size=d1*d2, loc=d_min, scale=scale).reshape((d1, d2))
-    mask = df.isnull()
-    df[mask] = vals
-    return df
+    X = X.copy()
+    mask = np.isnan(X)
+    # Generate random numbers only for missing values
+    X[mask] = _draw_mnr(size=mask.sum(), d_min=d_min, up_mnar=up_mnar, random_state=random_state)
+    return X
 
 
-def _impute_mcar(df=None, n_neighbors=6):
-    """KNN imputation via sklearn implementation
+def _impute_mcar(X=None, n_neighbors=6, knn_backend="brute", chunk_size=None, max_memory_mb=None):
+    """KNN imputation via exact (sklearn implementation or chunked) or approximate (tree-based) backend
 
     Arguments
     ---------
-    df: DataFrame
-        DataFrame with missing values just classified as MNAR
+    X: array-like
+        Quantifications with missing values just classified as MCAR
     n neighbors: int, default=6 (Liu and Dongre, 2020)
         Number of neighboring samples to use for imputation
+    knn_backend: str, default='brute'
+        Nearest neighbour backend ('brute', 'chunked', or 'tree')
+    chunk_size: int, optional
+        Number of query rows per chunk for 'chunked' backend
+    max_memory_mb: float, optional
+        Memory budget used to derive the chunk size for 'chunked' backend
     """
-    imputer = KNNImputer(n_neighbors=n_neighbors)
-    X = np.array(df)
-    index, cols = df.index, df.columns
-    X = imputer.fit_transform(X)
-    df = pd.DataFrame(X, columns=cols, index=index)
-    return df
+    X = knn_impute(X=X, n_neighbors=n_neighbors, knn_backend=knn_backend,
+                   chunk_size=chunk_size, max_memory_mb=max_memory_mb)
+    return X
 
 
-def _impute(df=None, mv_class=None, d_min=None, up_mnar=None, n_neighbors=6, min_cs=0.5):
+def _impute(X=None, mv_class=None, d_min=None, up_mnar=None, n_neighbors=6, min_cs=0.5, knn_backend="brute",
+            chunk_size=None, max_memory_mb=None, random_state=None):
     """Wrapper for imputation methods applied on an experimental group"""
+    args_knn = dict(n_neighbors=n_neighbors, knn_backend=knn_backend, chunk_size=chunk_size,
+                    max_memory_mb=max_memory_mb)
     if mv_class == ut.STR_NM:
-        return df
+        return X
     elif mv_class == ut.STR_MAR:
         # Missing at random only imputed if cs == 0
         if min_cs == 0:
-            return _impute_mcar(df=df, n_neighbors=n_neighbors)
-        return df
+            return _impute_mcar(X=X, **args_knn)
+        return X
     elif mv_class == ut.STR_MCAR:
-        return _impute_mcar(df=df, n_neighbors=n_neighbors)
+        return _impute_mcar(X=X, **args_knn)
     elif mv_class == ut.STR_MNAR:
-        return _impute_mnr(df=df, d_min=d_min, up_mnar=up_mnar)
-
-
-def _create_groupwise_dfs(cs_vals=None, mv_classes=None, group_dict=None, index=None, prefixes=None):
-    """Creates and concatenates DataFrames for CS and NaN values per group."""
-    df_cs = pd.DataFrame(cs_vals).T
-    df_cs.columns = [f"{prefixes[0]}_{group}" for group in group_dict]
+        return _impute_mnr(X=X, d_min=d_min, up_mnar=up_mnar, random_state=random_state)
 
-    df_nan = pd.DataFrame(mv_classes).T
-    df_nan.columns = [f"{prefixes[1]}_{group}" for group in group_dict]
 
-    both_dfs = pd.concat([df_cs, df_nan], axis=1)
-    both_dfs.index = index
-    return both_dfs
+def _cimpute_group(X_group=None, mv_codes=None, min_cs=0.5, d_min=None, up_mnar=None, n_neighbors=5,
+                   knn_backend="brute", chunk_size=None, max_memory_mb=None, random_state=None):
+    """Get CS and impute missing values for one experimental group (independent of other groups)"""
+    list_cs = get_cs(X=X_group, mv_codes=mv_codes)
+    X_group = impute(X_group=X_group, mv_codes=mv_codes, list_cs=list_cs, min_cs=min_cs, d_min=d_min,
+                     up_mnar=up_mnar, n_neighbors=n_neighbors, knn_backend=knn_backend,
+                     chunk_size=chunk_size, max_memory_mb=max_memory_mb, random_state=random_state)
+    return X_group, list_cs
 
 
 # II Main Functions
 def get_up_mnar(df=None, loc_pct_upmnar=0.25):
-    """Get upper bound for MNAR MVs for whole data set"""
-    d_min = df.min().min()  # Detection limit
-    d_max = df.max().max()  # Largest detected value
+    """Get upper bound for MNAR MVs for whole data set (given as DataFrame or array)"""
+    X = np.asarray(df, dtype=float)
+    d_min = np.nanmin(X)    # Detection limit
+    d_max = np.nanmax(X)    # Largest detected value
     dr = d_max - d_min      # Detection range
     up_mnar = d_min + loc_pct_upmnar * dr   # Upper MNAR border
     return d_min, up_mnar
 
 
-def classify_of_mvs(df_group=None, up_mnar=None):
-    """Classification of missing values for given protein intensities of an experimental group"""
-    n_groups = len(list(df_group))
-    mv_classes = []     # NaN Classes
-    for i, row in df_group.iterrows():
-        n_nan = row.isnull().sum()
-        n_higher_up_mnar = np.array((row > up_mnar)).sum()
-        n_lower_or_equal_up_mnar = np.array((row <= up_mnar)).sum()
-        # NM (No Missing values)
-        if n_nan == 0:
-            mv_classes.append(ut.STR_NM)
-        # MNAR (Missing Not At Random: all values are nan or lower than up_mnar)
-        elif n_lower_or_equal_up_mnar + n_nan == n_groups:
-            mv_classes.append(ut.STR_MNAR)
-        # MCAR (Missing Completely At Random: all values are nan or higher than up_mnar)
-        elif n_higher_up_mnar + n_nan == n_groups:
-            mv_classes.append(ut.STR_MCAR)
-        # MAR (Missing At Random)
-        else:
-            mv_classes.append(ut.STR_MAR)
-    return mv_classes
-
-
-def compute_cs(df_group=None, mv_classes=None):
-    """Computation of confidence scores depending on missing value classification and proportion of missing values"""
-    n = len(list(df_group))
-    dict_prot_cs = {}
-    for mv_class in ut.LIST_MV_CLASSES:
-        mask = [True if l == mv_class else False for l in mv_classes]
-        df = df_group[mask]
-        for entry, row in df.iterrows():
-            cs = _compute_cs(vals=list(row), mv_class=mv_class, n=n)
-            dict_prot_cs[entry] = cs
-    list_cs = [dict_prot_cs[entry] for entry in df_group.index]
-    return list_cs
-
-
-def impute(df_group=None, mv_classes=None, list_cs=None, min_cs=0.5, d_min=None, up_mnar=None, n_neighbors=5):
-    """Group-wise imputation over whole data set"""
-    df_group = df_group.copy()
-    list_df = []
-    for mv_class in ut.LIST_MV_CLASSES:
-        mask = np.array([True if (l == mv_class and cs >= min_cs) else False for l, cs in zip(mv_classes, list_cs)])
-        df = df_group[mask]
-        if len(df) > 0:
-            df_imput = _impute(df=df, mv_class=mv_class,
-                               n_neighbors=n_neighbors,
-                               d_min=d_min,
-                               up_mnar=up_mnar,
-                               min_cs=min_cs)
-            list_df.append(df_imput)
-    df_group_imputed = pd.concat(list_df, axis=0).sort_index()
-    mask = np.array([True if i in df_group_imputed.index else False for i in df_group.index])
-    df_group[mask] = df_group_imputed
-    return df_group
+def get_mv_codes(X=None, up_mnar=None):
+    """Vectorized classification of missing values for quantifications of one or multiple experimental groups.
 
+    Class codes are positions in ``ut.LIST_MV_CLASSES``. ``X`` is either a 2D array (n_proteins, n_replicates) for
+    a single group or a 3D array (n_proteins, n_groups, n_replicates) to classify all groups at once.
+    """
+    X = as_float_array(X)
+    n = X.shape[-1]
+    mask_nan = np.isnan(X)
+    n_nan = mask_nan.sum(axis=-1)
+    # Comparisons with NaN are False, such that only detected values are counted
+    n_lower_or_equal_up_mnar = (X <= up_mnar).sum(axis=-1)
+    n_higher_up_mnar = n - n_nan - n_lower_or_equal_up_mnar
+    conditions = [n_nan == 0,                   # NM (No Missing values)
+                  n_higher_up_mnar == 0,        # MNAR (all values are nan or lower than up_mnar)
+                  n_lower_or_equal_up_mnar == 0]    # MCAR (all values are nan or higher than up_mnar)
+    choices = [_MV_CODES[ut.STR_NM], _MV_CODES[ut.STR_MNAR], _MV_CODES[ut.STR_MCAR]]
+    mv_codes = np.select(conditions, choices, default=_MV_CODES[ut.STR_MAR])    # MAR (Missing At Random)
+    return mv_codes
+
+
+def get_mv_codes_groups(X=None, list_group_pos=None, up_mnar=None):
+    """Classification of missing values for all experimental groups given by their column positions in ``X``.
+
+    Groups of equal size are classified at once via a 3D view on ``X``. Returns array (n_proteins, n_groups).
+    """
+    X = as_float_array(X)
+    list_n = [len(pos) for pos in list_group_pos]
+    if len(set(list_n)) == 1:
+        X_3d = X[:, np.concatenate(list_group_pos)].reshape(len(X), len(list_group_pos), list_n[0])
+        return get_mv_codes(X=X_3d, up_mnar=up_mnar)
+    return np.stack([get_mv_codes(X=X[:, pos], up_mnar=up_mnar) for pos in list_group_pos], axis=1)
 
-# TODO optimize n_neighbors, optimize for performance
-# Main function
-def run_cimpute(df=None, groups=None, min_cs=0.5, loc_pcat_upmnar=0.25, n_neighbors=5, str_id=None, str_quant=None):
-    """Run complete cImpute pipeline"""
-    df = df.copy()
-    df.index = df[str_id]
-    dict_group_cols_quant = ut.get_dict_group_qcols(df=df, groups=groups, str_quant=str_quant)
-    cols_quant = ut.get_qcols(df=df, groups=groups, str_quant=str_quant)
-    d_min, up_mnar = get_up_mnar(df=df[cols_quant], loc_pct_upmnar=loc_pcat_upmnar)
-    list_df_groups = []
-    list_mv_classes = []
-    cs_vals = []
-    for group in dict_group_cols_quant:
-        cols_quant = dict_group_cols_quant[group]
-        df_group = df[cols_quant]
-        mv_classes = classify_of_mvs(df_group=df_group, up_mnar=up_mnar)
-        list_cs = compute_cs(df_group=df_group, mv_classes=mv_classes)
-        df_group = impute(df_group=df_group, mv_classes=mv_classes, list_cs=list_cs, min_cs=min_cs, d_min=d_min,
-                          up_mnar=up_mnar, n_neighbors=n_neighbors)
-        list_df_groups.append(df_group)
-        list_mv_classes.append(mv_classes)
-        cs_vals.append(list_cs)
-
-    # Merge imputation for all groups
-    df_imp = pd.concat(list_df_groups, axis=1)
 
+def get_cs(X=None, mv_codes=None):
+    """Vectorized computation of confidence scores (CS) from the number of missing values and the missing value
+    class codes (one float per protein, aligned to the rows of ``X``)"""
+    # TODO adjust for MNAR to go up if number of values increase again (minimum if n nan == n/2)
+    X = as_float_array(X)
+    n = X.shape[-1]
+    n_nan = np.isnan(X).sum(axis=-1)
+    conditions = [mv_codes == _MV_CODES[ut.STR_NM],
+                  mv_codes == _MV_CODES[ut.STR_MCAR],
+                  mv_codes == _MV_CODES[ut.STR_MNAR]]
+    choices = [1, (n - n_nan) / n, n_nan / n]
+    cs = np.select(conditions, choices, default=0).round(2)   # MAR: 0
+    return cs
+
+
+def impute(X_group=None, mv_codes=None, list_cs=None, min_cs=0.5, d_min=None, up_mnar=None, n_neighbors=5,
+           knn_backend="brute", chunk_size=None, max_memory_mb=None, random_state=None):
+    """Group-wise imputation over whole data set.
+
+    Proteins of each MV class (with CS >= min_cs) are selected by integer row positions and imputed
+    block-wise, such that the quantifications of the group are written into one array without reordering.
+    """
+    X_group = as_float_array(X_group)
+    X_imp = X_group.copy()
+    mask_cs = np.asarray(list_cs) >= min_cs
+    for code, mv_class in enumerate(ut.LIST_MV_CLASSES):
+        if mv_class == ut.STR_NM:
+            continue
+        rows = np.flatnonzero((mv_codes == code) & mask_cs)
+        if len(rows) > 0:
+            X_imp[rows] = _impute(X=X_group[rows], mv_class=mv_class,
+                                  n_neighbors=n_neighbors,
+                                  d_min=d_min,
+                                  up_mnar=up_mnar,
+                                  min_cs=min_cs,
+                                  knn_backend=knn_backend,
+                                  chunk_size=chunk_size,
+                                  max_memory_mb=max_memory_mb,
+                                  random_state=random_state)
+    return X_imp
+
+
+def merge_groups(X_imp=None, cols_quant=None, mv_codes=None, cs_vals=None, groups=None, index=None):
+    """Build DataFrame of imputed quantifications, CS values, and MV classes of all groups at once
+
+    Parameters
+    ----------
+    X_imp: array-like, shape (n_proteins, n_quant_cols)
+        Imputed quantifications (columns ordered as ``cols_quant``)
+    cols_quant: list
+        Names of quantification columns
+    mv_codes: array-like, shape (n_proteins, n_groups)
+        Codes of missing value classes (positions in ``ut.LIST_MV_CLASSES``) per group
+    cs_vals: array-like, shape (n_proteins, n_groups)
+        CS values per group
+    groups: list
+        Names of experimental groups
+    index: array-like
+        Index of resulting DataFrame
+    """
+    cs_vals = np.asarray(cs_vals, dtype=float)
+    dict_cols = dict(zip(cols_quant, as_float_array(X_imp).T))
     # Add aggregated CS values (mean and std)
-    cs_means = np.array(cs_vals).mean(axis=0).round(2)
-    cs_stds = np.array(cs_vals).std(axis=0).round(2)
-    df_imp[ut.COL_C_SCORE], df_imp[ut.COL_C_STD] = cs_means, cs_stds
-
-    # Add  CS values per group
-    # Concatenate CS and NaN values per group and merge with df_imp
-    df_cs_nan = _create_groupwise_dfs(cs_vals=cs_vals,
-                                      mv_classes=list_mv_classes,
-                                      group_dict=dict_group_cols_quant,
-                                      index=df.index, prefixes=["CS", "MV"])
-    df_imp = pd.concat([df_imp, df_cs_nan], axis=1)
+    dict_cols[ut.COL_C_SCORE] = cs_vals.mean(axis=1).round(2)
+    dict_cols[ut.COL_C_STD] = cs_vals.std(axis=1).round(2)
+    # Add CS values and MV classes per group
+    dict_cols.update({f"CS_{group}": cs_vals[:, i] for i, group in enumerate(groups)})
+    dict_cols.update({f"MV_{group}": _ARR_MV_CLASSES[mv_codes[:, i]] for i, group in enumerate(groups)})
+    df_imp = pd.DataFrame(dict_cols, index=index)
     return df_imp
+
+
+def get_mcar_subsets(df=None, layout=None, min_cs=0.5, loc_pcat_upmnar=0.25, dtype=float):
+    """Get quantifications of proteins imputed by KNN (MCAR with CS >= min_cs) for each experimental group"""
+    X_all = layout.get_X(df=df, dtype=dtype)
+    d_min, up_mnar = get_up_mnar(df=X_all, loc_pct_upmnar=loc_pcat_upmnar)
+    list_X = []
+    for pos in layout.list_group_pos:
+        X = X_all[:, pos]
+        mv_codes = get_mv_codes(X=X, up_mnar=up_mnar)
+        mask = (mv_codes == _MV_CODES[ut.STR_MCAR]) & (get_cs(X=X, mv_codes=mv_codes) >= min_cs)
+        list_X.append(X[mask])
+    return list_X
+
+
+def get_multiple_imputations(X_imp=None, mask_mnr=None, n_imputations=None, d_min=None, up_mnar=None,
+                             random_state=None):
+    """Stack ``n_imputations`` imputations sharing classification, CS, and KNN imputation, where only
+    the MinProb values (``mask_mnr``) are drawn anew for each imputation"""
+    X_imps = np.empty((n_imputations, *X_imp.shape), dtype=np.float32)
+    X_imps[:] = X_imp
+    n_mnr = mask_mnr.sum()
+    vals = _draw_mnr(size=(n_imputations, n_mnr), d_min=d_min, up_mnar=up_mnar, random_state=random_state)
+    X_imps[:, mask_mnr] = vals
+    return X_imps
+
+
+# TODO optimize n_neighbors, optimize for performance
+# Main function
+def run_cimpute(df=None, layout=None, min_cs=0.5, loc_pcat_upmnar=0.25, n_neighbors=5, str_id=None, n_jobs=None,
+                knn_backend="brute", chunk_size=None, max_memory_mb=None, random_state=None, n_imputations=None,
+                dtype=float):
+    """Run complete cImpute pipeline.
+
+    Quantifications are extracted once into a contiguous float array (of given ``dtype``), imputed group-wise via integer column and
+    row positions, and converted into a DataFrame only once at the end.
+    """
+    groups, cols_quant, list_group_pos = list(layout.groups), list(layout.cols_quant), layout.list_group_pos
+    X = np.ascontiguousarray(layout.get_X(df=df, dtype=dtype))
+    d_min, up_mnar = get_up_mnar(df=X, loc_pct_upmnar=loc_pcat_upmnar)
+    # Classify missing values for all groups at once
+    mv_codes = get_mv_codes_groups(X=X, list_group_pos=list_group_pos, up_mnar=up_mnar)
+    # Groups are independent given d_min and up_mnar and can thus be imputed in parallel
+    args = dict(min_cs=min_cs, d_min=d_min, up_mnar=up_mnar, n_neighbors=n_neighbors, knn_backend=knn_backend,
+                chunk_size=chunk_size, max_memory_mb=max_memory_mb)
+    # Independent random generator per group (results do not depend on n_jobs)
+    list_rng = [np.random.default_rng(seed) for seed in np.random.SeedSequence(random_state).spawn(len(groups) + 1)]
+    list_args = [dict(X_group=X[:, pos], mv_codes=mv_codes[:, i], random_state=list_rng[i], **args)
+                 for i, pos in enumerate(list_group_pos)]
+    if n_jobs is None or n_jobs == 1 or len(list_args) == 1:
+        results = [_cimpute_group(**kwargs) for kwargs in list_args]
+    else:
+        n_jobs = min(n_jobs, len(list_args))
+        results = Parallel(n_jobs=n_jobs)(delayed(_cimpute_group)(**kwargs) for kwargs in list_args)
+    X_imp = np.empty_like(X)
+    cs_vals = np.empty(mv_codes.shape, dtype=float)
+    for i, (pos, (X_group, list_cs)) in enumerate(zip(list_group_pos, results)):
+        X_imp[:, pos] = X_group
+        cs_vals[:, i] = list_cs
+    if n_imputations is None:
+        df_imp = merge_groups(X_imp=X_imp, cols_quant=cols_quant, mv_codes=mv_codes, cs_vals=cs_vals,
+                              groups=groups, index=pd.Index(df[str_id]))
+        return df_imp
+
+    # Multiple imputation reusing classification, CS, and KNN imputation (only MinProb values are redrawn)
+    rows_mnr = (mv_codes == _MV_CODES[ut.STR_MNAR]) & (cs_vals >= min_cs)
+    mask_mnr = np.zeros(X.shape, dtype=bool)
+    for i, pos in enumerate(list_group_pos):
+        mask_mnr[:, pos] = rows_mnr[:, [i]] & np.isnan(X[:, pos])
+    X_imps = get_multiple_imputations(X_imp=X_imp, mask_mnr=mask_mnr, n_imputations=n_imputations, d_min=d_min,
+                                      up_mnar=up_mnar, random_state=list_rng[-1])
+    return X_imps
@@ -0,0 +1,166 @@
+"""
+This is a script for backend of the cImpute.fit() and cImpute.transform() methods using a persistable model.
+"""
+import numpy as np
+import pandas as pd
+
+import xomics.utils as ut
+from .cimpute import get_up_mnar, get_mv_codes, get_cs, merge_groups, _draw_mnr, _MV_CODES
+from .knn import get_knn_donors, impute_from_knn_donors, get_chunk_size, knn_impute
+
+
+# I Helper Functions
+def _flatten_donors(dict_donors=None, n_neighbors=None):
+    """Convert dictionary of KNN donors into arrays (columns, receivers, donors padded by -1)"""
+    list_cols, list_receivers, list_donors = [], [], []
+    for col, (receivers, donors_idx) in dict_donors.items():
+        donors_pad = np.full((len(receivers), n_neighbors), -1, dtype=np.int64)
+        donors_pad[:, :donors_idx.shape[1]] = donors_idx
+        list_cols.append(np.full(len(receivers), col, dtype=np.int64))
+        list_receivers.append(receivers)
+        list_donors.append(donors_pad)
+    if len(list_cols) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty((0, n_neighbors), dtype=np.int64)
+    return np.concatenate(list_cols), np.concatenate(list_receivers), np.concatenate(list_donors)
+
+
+def _get_dict_donors(cols=None, receivers=None, donors=None, map_rows=None):
+    """Get dictionary of KNN donors for receivers mapped to new rows by ``map_rows`` (-1 if not mapped)"""
+    rows = map_rows[receivers]
+    mask = rows >= 0
+    cols, rows, donors = cols[mask], rows[mask], donors[mask]
+    dict_donors = {col: (rows[cols == col], donors[cols == col]) for col in np.unique(cols)}
+    return dict_donors
+
+
+def _get_known_rows(X=None, ids=None, X_ref=None, ids_ref=None):
+    """Get mapping of reference rows to rows of ``X`` with the same id and identical quantifications
+    (-1 if reference protein is not in ``X``)"""
+    map_rows = np.full(len(X_ref), -1, dtype=np.int64)
+    if len(X_ref) == 0:
+        return map_rows
+    # First occurrence of ids in reference and in X
+    _, pos_first = np.unique(ids_ref, return_index=True)
+    idx = pd.Index(ids_ref[pos_first]).get_indexer(ids)
+    pos_ref = np.where(idx >= 0, pos_first[idx], -1)
+    rows = np.flatnonzero(pos_ref >= 0)
+    _, idx_first = np.unique(pos_ref[rows], return_index=True)
+    rows = rows[idx_first]
+    # Only proteins with identical quantifications are considered as known
+    X_a, X_b = X[rows], X_ref[pos_ref[rows]]
+    is_identical = ((X_a == X_b) | (np.isnan(X_a) & np.isnan(X_b))).all(axis=1)
+    rows = rows[is_identical]
+    map_rows[pos_ref[rows]] = rows
+    return map_rows
+
+
+def _get_chunk_args(model=None):
+    """Chunk size and memory budget of KNN search stored in model (None if not given or for older models)"""
+    chunk_size = int(model.get("chunk_size", 0))
+    max_memory_mb = float(model.get("max_memory_mb", np.nan))
+    return dict(chunk_size=chunk_size if chunk_size > 0 else None,
+                max_memory_mb=None if np.isnan(max_memory_mb) else max_memory_mb)
+
+
+def _impute_knn_group(X=None, ids=None, mask_knn=None, model=None, i=None):
+    """KNN imputation against the fitted reference, reusing fitted donors for known proteins"""
+    X_ref, ids_ref = model[f"X_ref_{i}"], model[f"ids_ref_{i}"]
+    rows_knn = np.flatnonzero(mask_knn)
+    X_knn = X[rows_knn]
+    # Known proteins: Reuse neighbours from fitting
+    map_rows = _get_known_rows(X=X_knn, ids=ids[rows_knn], X_ref=X_ref, ids_ref=ids_ref)
+    dict_donors = _get_dict_donors(cols=model[f"donors_cols_{i}"], receivers=model[f"donors_receivers_{i}"],
+                                   donors=model[f"donors_idx_{i}"], map_rows=map_rows)
+    X_knn = impute_from_knn_donors(X=X_knn, X_ref=X_ref, dict_donors=dict_donors)
+    # New proteins: Search neighbours in reference
+    rows_new = np.setdiff1d(np.arange(len(rows_knn)), map_rows[map_rows >= 0])
+    if len(rows_new) > 0:
+        n_neighbors = int(model["n_neighbors"])
+        chunk_size = get_chunk_size(n_ref=len(X_ref), **_get_chunk_args(model=model))
+        dict_donors_new = get_knn_donors(X=X_knn[rows_new], X_ref=X_ref, n_neighbors=n_neighbors,
+                                         chunk_size=chunk_size)
+        X_knn[rows_new] = impute_from_knn_donors(X=X_knn[rows_new], X_ref=X_ref, dict_donors=dict_donors_new)
+    return rows_knn, X_knn
+
+
+# II Main Functions
+def fit_cimpute(df=None, layout=None, min_cs=0.5, loc_pcat_upmnar=0.25, n_neighbors=5, str_id=None,
+                chunk_size=None, max_memory_mb=None, dtype=float):
+    """Fit cImpute model consisting of detection limits, per-group KNN reference matrices, and their neighbours"""
+    groups, dict_group_cols_quant = list(layout.groups), layout.dict_group_qcols
+    X_all = layout.get_X(df=df, dtype=dtype)
+    d_min, up_mnar = get_up_mnar(df=X_all, loc_pct_upmnar=loc_pcat_upmnar)
+    ids = np.array(df[str_id].astype(str), dtype=str)
+    model = dict(groups=np.array(groups, dtype=str), d_min=np.float64(d_min), up_mnar=np.float64(up_mnar),
+                 min_cs=np.float64(min_cs), n_neighbors=np.int64(n_neighbors),
+                 # Not given values are stored as 0 (chunk_size) and NaN (max_memory_mb) since None can not be saved
+                 chunk_size=np.int64(0 if chunk_size is None else chunk_size),
+                 max_memory_mb=np.float64(np.nan if max_memory_mb is None else max_memory_mb))
+    for i, group in enumerate(groups):
+        X = X_all[:, layout.list_group_pos[i]]
+        mv_codes = get_mv_codes(X=X, up_mnar=up_mnar)
+        mask_ref = (mv_codes == _MV_CODES[ut.STR_MCAR]) & (get_cs(X=X, mv_codes=mv_codes) >= min_cs)
+        X_ref = X[mask_ref]
+        dict_donors = get_knn_donors(X=X_ref, n_neighbors=n_neighbors,
+                                     chunk_size=get_chunk_size(n_ref=len(X_ref), chunk_size=chunk_size,
+                                                               max_memory_mb=max_memory_mb))
+        donors_cols, donors_receivers, donors_idx = _flatten_donors(dict_donors=dict_donors, n_neighbors=n_neighbors)
+        model.update({f"cols_{i}": np.array(dict_group_cols_quant[group], dtype=str),
+                      f"X_ref_{i}": X_ref,
+                      f"ids_ref_{i}": ids[mask_ref],
+                      f"donors_cols_{i}": donors_cols,
+                      f"donors_receivers_{i}": donors_receivers,
+                      f"donors_idx_{i}": donors_idx})
+    return model
+
+
+def transform_cimpute(df=None, model=None, str_id=None, random_state=None, dtype=float):
+    """Impute missing values of (new) proteins using a fitted cImpute model"""
+    groups = model["groups"].tolist()
+    d_min, up_mnar = float(model["d_min"]), float(model["up_mnar"])
+    min_cs, n_neighbors = float(model["min_cs"]), int(model["n_neighbors"])
+    ids = np.array(df[str_id].astype(str), dtype=str)
+    list_rng = [np.random.default_rng(seed) for seed in np.random.SeedSequence(random_state).spawn(len(groups))]
+    list_cols = [model[f"cols_{i}"].tolist() for i in range(len(groups))]
+    cols_quant = [col for cols in list_cols for col in cols]
+    X_all = np.ascontiguousarray(df[cols_quant].to_numpy(dtype=dtype))
+    X_imp = X_all.copy()
+    mv_codes = np.empty((len(df), len(groups)), dtype=np.int64)
+    cs_vals = np.empty((len(df), len(groups)), dtype=float)
+    start = 0
+    for i, cols in enumerate(list_cols):
+        pos = slice(start, start + len(cols))
+        start += len(cols)
+        X = X_all[:, pos]
+        mv_codes[:, i] = get_mv_codes(X=X, up_mnar=up_mnar)
+        cs_vals[:, i] = get_cs(X=X, mv_codes=mv_codes[:, i])
+        mask_cs = cs_vals[:, i] >= min_cs
+        # MNAR: MinProb imputation using detection limits of fitted data
+        mask_mnr = ((mv_codes[:, i] == _MV_CODES[ut.STR_MNAR]) & mask_cs)[:, np.newaxis] & np.isnan(X)
+        X_group = X_imp[:, pos]
+        X_group[mask_mnr] = _draw_mnr(size=mask_mnr.sum(), d_min=d_min, up_mnar=up_mnar, random_state=list_rng[i])
+        # MCAR: KNN imputation against fitted reference
+        mask_knn = (mv_codes[:, i] == _MV_CODES[ut.STR_MCAR]) & mask_cs
+        if mask_knn.any() and len(model[f"X_ref_{i}"]) > 0:
+            rows_knn, X_knn = _impute_knn_group(X=X, ids=ids, mask_knn=mask_knn, model=model, i=i)
+            X_group[rows_knn] = X_knn
+        # MAR (only if min_cs=0): KNN imputation within MAR proteins of df (as by cImpute.run)
+        rows_mar = np.flatnonzero(mv_codes[:, i] == _MV_CODES[ut.STR_MAR])
+        if min_cs == 0 and len(rows_mar) > 0:
+            X_group[rows_mar] = knn_impute(X=X[rows_mar], n_neighbors=n_neighbors, knn_backend="chunked",
+                                           **_get_chunk_args(model=model))
+    df_imp = merge_groups(X_imp=X_imp, cols_quant=cols_quant, mv_codes=mv_codes, cs_vals=cs_vals, groups=groups,
+                          index=pd.Index(df[str_id]))
+    return df_imp
+
+
+def save_model(model=None, file_path=None):
+    """Save cImpute model as compressed numpy archive"""
+    np.savez_compressed(file_path, **model)
+
+
+def load_model(file_path=None):
+    """Load cImpute model from compressed numpy archive"""
+    with np.load(file_path, allow_pickle=False) as f:
+        model = {key: f[key] for key in f.files}
+    return model
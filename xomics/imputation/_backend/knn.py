@@ -0,0 +1,180 @@
+"""
+This is a script for the nearest neighbour backends used by cImpute for KNN imputation of MCAR missing values.
+"""
+import time
+import numpy as np
+from sklearn.impute import KNNImputer
+from sklearn.metrics.pairwise import nan_euclidean_distances
+from sklearn.neighbors import KDTree
+
+LIST_KNN_BACKENDS = ["brute", "chunked", "tree"]
+MAX_MEMORY_MB = 1024
+# Number of (n_chunk, n_ref) float64 arrays alive while computing nan-euclidean distances of one chunk
+_N_DIST_ARRAYS = 6
+
+
+# I Helper Functions
+def as_float_array(X=None):
+    """Convert ``X`` into float array keeping its data type if already float32 or float64"""
+    X = np.asarray(X)
+    return X if X.dtype in (np.float32, np.float64) else X.astype(float)
+
+
+def _get_col_means(X=None, mask=None):
+    """Mean of detected values per column (NaN if column is completely missing)"""
+    n_detected = (~mask).sum(axis=0)
+    col_sums = np.where(mask, 0, X).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        col_means = col_sums / n_detected
+    return col_means
+
+
+def get_chunk_size(n_ref=None, chunk_size=None, max_memory_mb=None):
+    """Get number of query rows per chunk such that distances to ``n_ref`` reference rows fit into memory"""
+    if chunk_size is not None:
+        return chunk_size
+    max_memory_mb = MAX_MEMORY_MB if max_memory_mb is None else max_memory_mb
+    bytes_per_row = max(n_ref, 1) * 8 * _N_DIST_ARRAYS
+    return max(int(max_memory_mb * 2 ** 20 // bytes_per_row), 1)
+
+
+def _get_top_k_donors(dist=None, n_neighbors=5):
+    """Get positions of the ``n_neighbors`` nearest donors (columns of ``dist``) for each receiver (rows of ``dist``).
+    Donors with undefined (NaN) distance are set to -1."""
+    k = min(n_neighbors, dist.shape[1])
+    donors_idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+    donors_dist = np.take_along_axis(dist, donors_idx, axis=1)
+    donors_idx[np.isnan(donors_dist)] = -1
+    return donors_idx
+
+
+def _impute_from_donors(vals_donors=None, donors_idx=None, col_mean=None):
+    """Impute receivers by the mean of their donors or by the column mean if no donor is defined"""
+    valid = donors_idx >= 0
+    n_valid = valid.sum(axis=1)
+    sum_vals = np.where(valid, vals_donors[np.where(valid, donors_idx, 0)], 0).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        imputed = np.where(n_valid > 0, sum_vals / n_valid, col_mean)
+    return imputed
+
+
+def get_knn_donors(X=None, n_neighbors=5, chunk_size=None, X_ref=None):
+    """Get nearest donors (row positions in ``X_ref``) for each missing value based on nan-euclidean distances.
+
+    Query rows are processed in chunks against all reference rows and only the top-k donors are kept per chunk,
+    such that peak memory is bounded by the chunk size. Returns dictionary assigning each column with missing
+    values a tuple of receivers (row positions, shape (n_receivers,)) and donors (shape (n_receivers, k)).
+    If ``X_ref`` is None, ``X`` is used as reference.
+    """
+    X_ref = X if X_ref is None else X_ref
+    mask = np.isnan(X)
+    mask_ref = np.isnan(X_ref)
+    chunk_size = get_chunk_size(n_ref=len(X_ref)) if chunk_size is None else chunk_size
+    row_missing_idx = np.flatnonzero(mask.any(axis=1))
+    dict_donors = {}
+    for start in range(0, len(row_missing_idx), chunk_size):
+        rows = row_missing_idx[start:start + chunk_size]
+        dist_chunk = nan_euclidean_distances(X[rows], X_ref)
+        for col in np.flatnonzero(mask[rows].any(axis=0)):
+            donors = np.flatnonzero(~mask_ref[:, col])
+            if len(donors) == 0:
+                continue
+            receivers = np.flatnonzero(mask[rows, col])
+            top_k = _get_top_k_donors(dist=dist_chunk[receivers][:, donors], n_neighbors=n_neighbors)
+            donors_idx = np.where(top_k >= 0, donors[top_k], -1)
+            dict_donors.setdefault(col, []).append((rows[receivers], donors_idx))
+        del dist_chunk
+    dict_donors = {col: (np.concatenate([r for r, _ in list_chunks]), np.concatenate([d for _, d in list_chunks]))
+                   for col, list_chunks in dict_donors.items()}
+    return dict_donors
+
+
+def impute_from_knn_donors(X=None, X_ref=None, dict_donors=None):
+    """Impute missing values of ``X`` by mean of their donors from ``X_ref`` (obtained by ``get_knn_donors``)"""
+    X_ref = X if X_ref is None else X_ref
+    X_imp = X.copy()
+    col_means = _get_col_means(X=X_ref, mask=np.isnan(X_ref))
+    for col, (receivers, donors_idx) in dict_donors.items():
+        X_imp[receivers, col] = _impute_from_donors(vals_donors=X_ref[:, col], donors_idx=donors_idx,
+                                                    col_mean=col_means[col])
+    return X_imp
+
+
+# Backends
+def _knn_brute(X=None, n_neighbors=5):
+    """Exact KNN imputation via sklearn implementation (reference)"""
+    # Completely missing columns are kept missing (dropped by KNNImputer otherwise)
+    valid_cols = ~np.isnan(X).all(axis=0)
+    X_imp = X.copy()
+    X_imp[:, valid_cols] = KNNImputer(n_neighbors=n_neighbors).fit_transform(X[:, valid_cols])
+    return X_imp
+
+
+def _knn_chunked(X=None, n_neighbors=5, chunk_size=None):
+    """Exact KNN imputation computing nan-euclidean distances block-wise for ``chunk_size`` query rows"""
+    dict_donors = get_knn_donors(X=X, n_neighbors=n_neighbors, chunk_size=chunk_size)
+    X_imp = impute_from_knn_donors(X=X, dict_donors=dict_donors)
+    return X_imp
+
+
+def _knn_tree(X=None, n_neighbors=5):
+    """Approximate KNN imputation using one KD-tree per column built on mean-filled donors"""
+    mask = np.isnan(X)
+    X_imp = X.copy()
+    col_means = _get_col_means(X=X, mask=mask)
+    # Distances are approximated on mean-filled values instead of nan-euclidean distances
+    X_filled = np.where(mask, col_means, X)
+    for col in np.flatnonzero(mask.any(axis=0)):
+        donors = ~mask[:, col]
+        receivers = mask[:, col]
+        if not donors.any():
+            continue
+        other_cols = np.flatnonzero((np.arange(X.shape[1]) != col) & ~np.isnan(col_means))
+        if len(other_cols) == 0:
+            X_imp[receivers, col] = col_means[col]
+            continue
+        k = min(n_neighbors, donors.sum())
+        tree = KDTree(X_filled[donors][:, other_cols])
+        donors_idx = tree.query(X_filled[receivers][:, other_cols], k=k, return_distance=False)
+        X_imp[receivers, col] = X[donors, col][donors_idx].mean(axis=1)
+    return X_imp
+
+
+# II Main Functions
+def knn_impute(X=None, n_neighbors=5, knn_backend="brute", chunk_size=None, max_memory_mb=None):
+    """KNN imputation of missing values in ``X`` using the given nearest neighbour backend (data type is kept)"""
+    X = as_float_array(X)
+    if knn_backend == "brute":
+        return _knn_brute(X=X, n_neighbors=n_neighbors)
+    elif knn_backend == "chunked":
+        chunk_size = get_chunk_size(n_ref=len(X), chunk_size=chunk_size, max_memory_mb=max_memory_mb)
+        return _knn_chunked(X=X, n_neighbors=n_neighbors, chunk_size=chunk_size)
+    elif knn_backend == "tree":
+        return _knn_tree(X=X, n_neighbors=n_neighbors)
+    raise ValueError(f"'knn_backend' ({knn_backend}) should be one of: {LIST_KNN_BACKENDS}")
+
+
+def eval_knn_backends(list_X=None, n_neighbors=5, knn_backends=None):
+    """Compare runtime and accuracy of KNN backends against exact (brute force) imputation"""
+    knn_backends = LIST_KNN_BACKENDS if knn_backends is None else knn_backends
+    dict_imp = {}
+    list_evals = []
+    for knn_backend in ["brute"] + [b for b in knn_backends if b != "brute"]:
+        t0 = time.time()
+        dict_imp[knn_backend] = [knn_impute(X=X, n_neighbors=n_neighbors, knn_backend=knn_backend) for X in list_X]
+        runtime = time.time() - t0
+        # Difference to exact imputation over all imputed values
+        mask = np.concatenate([np.isnan(X).ravel() for X in list_X])
+        x_exact = np.concatenate([X.ravel() for X in dict_imp["brute"]])[mask]
+        x_imp = np.concatenate([X.ravel() for X in dict_imp[knn_backend]])[mask]
+        # Values of completely missing columns stay missing for all backends
+        x_exact, x_imp = x_exact[~np.isnan(x_exact)], x_imp[~np.isnan(x_exact)]
+        diff = x_imp - x_exact
+        n = max(len(diff), 1)
+        list_evals.append({"knn_backend": knn_backend,
+                           "time": round(runtime, 4),
+                           "n_imputed": len(diff),
+                           "rmse": np.sqrt((diff ** 2).sum() / n),
+                           "mae": np.abs(diff).sum() / n,
+                           "pct_exact": np.isclose(x_imp, x_exact).sum() / n * 100})
+    return [e for e in list_evals if e["knn_backend"] in knn_backends]
@@ -4,9 +4,12 @@ This is a script for interface of the cImpute (conditional Imputation) class.
 import pandas as pd
 import numpy as np
 import xomics.utils as ut
-from typing import Tuple
+from xomics.config import check_n_jobs, check_random_state, check_dtype
+from typing import Tuple, Optional, List, Union
 
-from ._backend.cimpute import run_cimpute, get_up_mnar
+from ._backend.cimpute import run_cimpute, get_up_mnar, get_mcar_subsets
+from ._backend.cimpute_model import fit_cimpute, transform_cimpute, save_model, load_model
+from ._backend.knn import eval_knn_backends, LIST_KNN_BACKENDS
 
 
 # TODO a) generalize (e.g., lfq -> intensities, test with other input)
@@ -15,6 +18,23 @@ from ._backend.cimpute import run_cimpute, get_up_mnar
 # TODO d) Extend to other omics data
 
 # I Helper Functions
+def check_is_fitted(model=None):
+    """Check if cImpute model is fitted"""
+    if model is None:
+        raise ValueError("cImpute model is not fitted. Call 'cImpute.fit' or 'cImpute.load_model' first.")
+
+
+def check_match_df_model(df=None, model=None):
+    """Check if df contains the quantification columns of the fitted model"""
+    cols_model = [c for key in model if key.startswith("cols_") for c in model[key].tolist()]
+    missing_cols = [c for c in cols_model if c not in df]
+    if len(missing_cols) > 0:
+        raise ValueError(f"The following quantification columns of the fitted model are not in 'df': {missing_cols}")
+
+
+def check_knn_backend(knn_backend=None):
+    """Check if knn_backend is valid"""
+    ut.check_str_in_list(name="knn_backend", val=knn_backend, list_options=LIST_KNN_BACKENDS, accept_none=False)
 
 
 # II Main Functions
@@ -65,6 +85,7 @@ class cImpute:
         self.col_id = col_id
         self.col_name = col_name
         self.str_quant = str_quant
+        self.model = None
 
     def get_limits(self,
                    df: pd.DataFrame = None,
@@ -117,8 +138,14 @@ class cImpute:
             groups: ut.ArrayLike1D = None,
             loc_pct_upmnar: float = 0.25,
             min_cs: float = 0.5,
-            n_neighbors: int = 5
-            ) -> pd.DataFrame:
+            n_neighbors: int = 5,
+            n_jobs: Optional[int] = None,
+            knn_backend: str = "brute",
+            chunk_size: Optional[int] = None,
+            max_memory_mb: Optional[float] = None,
+            random_state: Optional[int] = None,
+            n_imputations: Optional[int] = None,
+            ) -> Union[pd.DataFrame, np.ndarray]:
         """
         Run cImpute algorithm.
 
@@ -140,15 +167,48 @@ class cImpute:
             Minimum of confidence score [0-1] used for selecting values for protein in groups to apply imputation on.
         n_neighbors: int, default=5
             Number of neighboring samples to use for MCAR imputation by KNN.
+        n_jobs : int, optional
+            Number of CPU cores (>=1) used for imputing experimental groups in parallel. If ``None`` or ``1``,
+            groups are imputed sequentially. If ``-1``, all available cores are used. Set to ``1`` if
+            ``options['allow_multiprocessing']`` is ``False``.
+        knn_backend : {'brute', 'chunked', 'tree'}, default='brute'
+            Nearest neighbour backend for MCAR imputation:
+
+            - ``brute``: Exact nan-euclidean KNN imputation (sklearn ``KNNImputer``).
+            - ``chunked``: Exact nan-euclidean KNN imputation computing distances block-wise with bounded memory.
+            - ``tree``: Approximate KNN imputation using KD-trees on mean-filled values, recommended for
+              groups with tens of thousands of MCAR proteins. See :meth:`cImpute.eval_knn_backends` for accuracy.
+
+        chunk_size : int, optional
+            Number of proteins (query rows) per chunk for ``knn_backend='chunked'``. For each chunk, distances to all
+            MCAR proteins of a group are computed and only the ``n_neighbors`` nearest neighbours are kept.
+            Overrides ``max_memory_mb`` if given.
+        max_memory_mb : float, optional
+            Memory budget (in MB) for the distance computation of one chunk for ``knn_backend='chunked'``, from
+            which the ``chunk_size`` is derived. If ``None`` and ``chunk_size=None``, 1024 MB are used.
+        random_state : int, optional
+            The seed used by the random number generator for MinProb imputation of MNAR missing values.
+            If a positive integer, imputation is reproducible (also for ``n_jobs > 1``). Overwritten by
+            ``options['random_state']`` if set.
+        n_imputations : int, optional
+            Number of imputations (>=1) for multiple imputation. If given, an array with stacked imputations is
+            returned instead of ``df_imp``. Classification, confidence scores, and KNN imputation are shared across
+            imputations and only MinProb values for MNAR missing values are drawn anew for each imputation.
 
         Return
         ------
         df_imp : pd.DataFrame
             DataFrame with (a) imputed intensities values and (b) group-wise confidence score and NaN classification.
+        X_imps : array-like, shape (n_imputations, n_samples, n_quant_columns)
+            Stacked imputed intensities (float32) with columns as given by :meth:`PreProcess.get_qcols`.
+            Only returned if ``n_imputations`` is given. Results can be combined by :meth:`PreProcess.run_pooled`.
 
         Notes
         -----
         - MAR is only imputed if ``min_cs=0`` using the imputation for MCAR.
+        - Experimental groups are imputed independently once ``d_min`` and ``up_mnar`` are obtained
+          for the whole dataset, which enables group-wise parallelization.
+        - Quantifications are imputed in the float data type given by ``options['dtype']`` (default 'float64').
         """
         # Check input
         df = ut.check_df(df=df, accept_none=False)
@@ -160,8 +220,208 @@ class cImpute:
                               just_int=False, accept_none=False)
         ut.check_number_range(name="n_neighbors", val=n_neighbors, min_val=1,
                               just_int=True, accept_none=False)
+        n_jobs = check_n_jobs(n_jobs=n_jobs)
+        check_knn_backend(knn_backend=knn_backend)
+        ut.check_number_range(name="chunk_size", val=chunk_size, min_val=1, just_int=True, accept_none=True)
+        ut.check_number_range(name="max_memory_mb", val=max_memory_mb, min_val=0, exclusive_limits=True,
+                              just_int=False, accept_none=True)
+        random_state = check_random_state(random_state=random_state)
+        ut.check_number_range(name="n_imputations", val=n_imputations, min_val=1, just_int=True, accept_none=True)
         # Run imputation
-        df_imp = run_cimpute(df=df, groups=groups,
+        layout = ut.get_quant_layout(df=df, groups=groups, str_quant=self.str_quant)
+        df_imp = run_cimpute(df=df, layout=layout,
                              min_cs=min_cs, loc_pcat_upmnar=loc_pct_upmnar, n_neighbors=n_neighbors,
-                             str_quant=self.str_quant, str_id=self.col_id)
+                             str_id=self.col_id, n_jobs=n_jobs,
+                             knn_backend=knn_backend, chunk_size=chunk_size, max_memory_mb=max_memory_mb,
+                             random_state=random_state, n_imputations=n_imputations, dtype=check_dtype())
         return df_imp
+
+    def eval_knn_backends(self,
+                          df: pd.DataFrame = None,
+                          groups: ut.ArrayLike1D = None,
+                          loc_pct_upmnar: float = 0.25,
+                          min_cs: float = 0.5,
+                          n_neighbors: int = 5,
+                          knn_backends: Optional[List[str]] = None,
+                          ) -> pd.DataFrame:
+        """
+        Evaluate runtime and accuracy of nearest neighbour backends for MCAR imputation.
+
+        Each backend is applied on the MCAR missing values of all groups and compared against the exact
+        brute force imputation (``knn_backend='brute'``).
+
+        Parameters
+        ----------
+        df : pd.DataFrame, shape(n_samples, n_conditions)
+            DataFrame containing quantified values with missing values. ``Rows`` typically correspond to proteins
+            and ``columns``  to conditions.
+        groups : array-like, shape (n_groups,)
+            List of quantification group (substrings of columns in ``df``).
+        loc_pct_upmnar : float, default=0.25
+            Location factor [0-1] for the upper MNAR limit (upMNAR) given as relative proportion (percentage)
+            of the detection range.
+        min_cs : float, default=0.5
+            Minimum of confidence score [0-1] used for selecting values for protein in groups to apply imputation on.
+        n_neighbors: int, default=5
+            Number of neighboring samples to use for MCAR imputation by KNN.
+        knn_backends : list of str, optional
+            Backends to evaluate ('brute', 'chunked', 'tree'). If ``None``, all backends are evaluated.
+
+        Return
+        ------
+        df_eval : pd.DataFrame
+            DataFrame with runtime (in seconds), number of imputed values, and root-mean-square error (``rmse``),
+            mean absolute error (``mae``), and percentage of exactly matching values (``pct_exact``) compared to
+            the exact imputation for each backend.
+        """
+        # Check input
+        df = ut.check_df(df=df, accept_none=False)
+        groups = ut.check_list_like(name="groups", val=groups, accept_none=False)
+        ut.check_match_df_groups(groups=groups, df=df, str_quant=self.str_quant)
+        ut.check_number_range(name="loc_pct_upmnar", val=loc_pct_upmnar, min_val=0, max_val=1,
+                              just_int=False, accept_none=False)
+        ut.check_number_range(name="min_cs", val=min_cs, min_val=0, max_val=1,
+                              just_int=False, accept_none=False)
+        ut.check_number_range(name="n_neighbors", val=n_neighbors, min_val=1,
+                              just_int=True, accept_none=False)
+        knn_backends = ut.check_list_like(name="knn_backends", val=knn_backends, accept_none=True, accept_str=True)
+        for knn_backend in knn_backends or []:
+            check_knn_backend(knn_backend=knn_backend)
+        # Evaluate backends
+        layout = ut.get_quant_layout(df=df, groups=groups, str_quant=self.str_quant)
+        list_X = get_mcar_subsets(df=df, layout=layout, min_cs=min_cs, loc_pcat_upmnar=loc_pct_upmnar,
+                                  dtype=check_dtype())
+        list_evals = eval_knn_backends(list_X=list_X, n_neighbors=n_neighbors, knn_backends=knn_backends)
+        df_eval = pd.DataFrame(list_evals)
+        return df_eval
+
+    def fit(self,
+            df: pd.DataFrame = None,
+            groups: ut.ArrayLike1D = None,
+            loc_pct_upmnar: float = 0.25,
+            min_cs: float = 0.5,
+            n_neighbors: int = 5,
+            chunk_size: Optional[int] = None,
+            max_memory_mb: Optional[float] = None,
+            ) -> "cImpute":
+        """
+        Fit cImpute model for imputing new proteins via :meth:`cImpute.transform`.
+
+        The model captures the minimum of detected values (``d_min``) and the upper bound of MNAR MVs (``up_mnar``)
+        of ``df``, as well as for each group the reference matrix of MCAR proteins used for KNN imputation
+        together with the nearest neighbours of its missing values.
+
+        Parameters
+        ----------
+        df : pd.DataFrame, shape(n_samples, n_conditions)
+            DataFrame containing quantified values with missing values. ``Rows`` typically correspond to proteins
+            and ``columns``  to conditions.
+        groups : array-like, shape (n_groups,)
+            List of quantification group (substrings of columns in ``df``).
+        loc_pct_upmnar : float, default=0.25
+            Location factor [0-1] for the upper MNAR limit (upMNAR) given as relative proportion (percentage)
+            of the detection range.
+        min_cs : float, default=0.5
+            Minimum of confidence score [0-1] used for selecting values for protein in groups to apply imputation on.
+        n_neighbors: int, default=5
+            Number of neighboring samples to use for MCAR imputation by KNN.
+        chunk_size : int, optional
+            Number of proteins (query rows) per chunk for the nearest neighbour search.
+        max_memory_mb : float, optional
+            Memory budget (in MB) for the distance computation of one chunk, from which the ``chunk_size`` is derived.
+
+        Return
+        ------
+        self : cImpute
+            The fitted cImpute object with the model stored in ``cImpute.model``.
+        """
+        # Check input
+        df = ut.check_df(df=df, accept_none=False, cols_requiered=self.col_id)
+        groups = ut.check_list_like(name="groups", val=groups, accept_none=False)
+        ut.check_match_df_groups(groups=groups, df=df, str_quant=self.str_quant)
+        ut.check_number_range(name="loc_pct_upmnar", val=loc_pct_upmnar, min_val=0, max_val=1,
+                              just_int=False, accept_none=False)
+        ut.check_number_range(name="min_cs", val=min_cs, min_val=0, max_val=1,
+                              just_int=False, accept_none=False)
+        ut.check_number_range(name="n_neighbors", val=n_neighbors, min_val=1,
+                              just_int=True, accept_none=False)
+        ut.check_number_range(name="chunk_size", val=chunk_size, min_val=1, just_int=True, accept_none=True)
+        ut.check_number_range(name="max_memory_mb", val=max_memory_mb, min_val=0, exclusive_limits=True,
+                              just_int=False, accept_none=True)
+        # Fit model
+        layout = ut.get_quant_layout(df=df, groups=groups, str_quant=self.str_quant)
+        self.model = fit_cimpute(df=df, layout=layout, min_cs=min_cs, loc_pcat_upmnar=loc_pct_upmnar,
+                                 n_neighbors=n_neighbors, str_id=self.col_id, chunk_size=chunk_size,
+                                 max_memory_mb=max_memory_mb, dtype=check_dtype())
+        return self
+
+    def transform(self,
+                  df: pd.DataFrame = None,
+                  random_state: Optional[int] = None,
+                  ) -> pd.DataFrame:
+        """
+        Impute missing values of (new) proteins using the fitted cImpute model.
+
+        Missing values are classified based on the fitted ``up_mnar``. MNAR MVs are imputed by MinProb using the
+        fitted limits and MCAR MVs by KNN imputation against the fitted reference matrix of their group. For proteins
+        with the same identifier and quantifications as in the fitted data, the fitted neighbours are reused.
+        If ``min_cs=0``, MAR MVs are imputed by KNN imputation among the MAR proteins of ``df`` (as by
+        :meth:`cImpute.run`), such that ``transform`` of the fitted data equals ``run``.
+
+        Parameters
+        ----------
+        df : pd.DataFrame, shape(n_samples, n_conditions)
+            DataFrame containing quantified values with missing values and the quantification columns of the
+            fitted data.
+        random_state : int, optional
+            The seed used by the random number generator for MinProb imputation of MNAR missing values.
+
+        Return
+        ------
+        df_imp : pd.DataFrame
+            DataFrame with (a) imputed intensities values and (b) group-wise confidence score and NaN classification.
+        """
+        # Check input
+        check_is_fitted(model=self.model)
+        df = ut.check_df(df=df, accept_none=False, cols_requiered=self.col_id)
+        check_match_df_model(df=df, model=self.model)
+        random_state = check_random_state(random_state=random_state)
+        # Impute using fitted model
+        df_imp = transform_cimpute(df=df, model=self.model, str_id=self.col_id, random_state=random_state,
+                                   dtype=check_dtype())
+        return df_imp
+
+    def save_model(self,
+                   file_path: str = None
+                   ) -> None:
+        """
+        Save fitted cImpute model as compressed binary numpy archive (``.npz``).
+
+        Parameters
+        ----------
+        file_path : str
+            Path to file. The ``.npz`` extension is appended if not given.
+        """
+        check_is_fitted(model=self.model)
+        ut.check_str(name="file_path", val=file_path, accept_none=False)
+        save_model(model=self.model, file_path=file_path)
+
+    def load_model(self,
+                   file_path: str = None
+                   ) -> "cImpute":
+        """
+        Load cImpute model saved by :meth:`cImpute.save_model`.
+
+        Parameters
+        ----------
+        file_path : str
+            Path to ``.npz`` file.
+
+        Return
+        ------
+        self : cImpute
+            The cImpute object with the loaded model stored in ``cImpute.model``.
+        """
+        ut.check_str(name="file_path", val=file_path, accept_none=False)
+        self.model = load_model(file_path=file_path)
+        return self
@@ -2,42 +2,65 @@
 This is a script for the backend of the e_hits (enrichment association hit) function of the pRank object.
 """
 import pandas as pd
+import numpy as np
+from scipy.sparse import csr_matrix
+
 import xomics.utils as ut
 
 
 # I Helper Functions
+def _get_hit_matrix(ids=None, id_lists=None):
+    """Sparse binary hit matrix (n_terms, n_ids) in CSR format obtained by one inverted index of ``ids``"""
+    dict_id_pos = {x: i for i, x in enumerate(ids)}
+    unique_items, codes, indptr = ut.intern_list(list_in=id_lists)
+    # Column of each unique item in term lists (-1 for items not in ids)
+    pos_items = np.array([dict_id_pos.get(x, -1) for x in unique_items], dtype=np.int64)
+    cols = pos_items[codes]
+    rows = np.repeat(np.arange(len(id_lists)), np.diff(indptr))
+    mask = cols >= 0
+    x_hit = csr_matrix((np.ones(mask.sum(), dtype=np.int64), (rows[mask], cols[mask])),
+                       shape=(len(id_lists), len(ids)))
+    # Duplicated ids in one term count once
+    x_hit.data[:] = 1
+    return x_hit
+
+
+def _get_top_pos(x_sums=None, n=None):
+    """Positions of the ``n`` highest sums in descending order (ties in original order)"""
+    return np.argsort(-x_sums, kind="stable")[:n]
 
 
 # II Main Functions
-def e_hits(ids=None, id_lists=None, terms=None, terms_sub_list=None, n_ids=None, n_terms=None, sort_alpha=False):
+def e_hits(ids=None, id_lists=None, terms=None, terms_sub_list=None, n_ids=None, n_terms=None, sort_alpha=False,
+           sparse=False):
     """
     Get matrix with associations between protein/gene ids and id sets representing protein/gene lists
     associated with specific biological terms obtained from an enrichment analysis (referred to as 'enrichment terms')
     such as GO or KEGG pathway terms.
     """
     # Obtain gene/protein associations with enrichment terms
-    list_hits = []
-    for ids_in_term in id_lists:
-        _ids_in_term = ut.flatten_list(ids_in_term)
-        list_hits.append([int(x in _ids_in_term) for x in ids])
-    df_e_hits = pd.DataFrame(list_hits, columns=ids, index=terms)
-    # Filter results
+    x_hit = _get_hit_matrix(ids=ids, id_lists=id_lists)
+    ids, terms = np.asarray(ids, dtype=object), np.asarray(terms, dtype=object)
+    # Filter results on sparse row and column sums
     if terms_sub_list is not None:
         if sort_alpha:
             terms_sub_list = sorted(terms_sub_list)
-        df_e_hits = df_e_hits.loc[terms_sub_list]
+        dict_term_pos = {x: i for i, x in enumerate(terms)}
+        pos_terms = np.array([dict_term_pos[x] for x in terms_sub_list], dtype=np.int64)
+        x_hit, terms = x_hit[pos_terms], terms[pos_terms]
     if n_ids is not None:
-        # Filter the DataFrame by keeping only the 'n_ids' with the highest number of associations
-        id_sums = df_e_hits.sum(axis=0).sort_values(ascending=False)
-        top_ids = id_sums.nlargest(n_ids).index
+        # Keep only the 'n_ids' with the highest number of associations
+        pos_ids = _get_top_pos(x_sums=np.asarray(x_hit.sum(axis=0)).ravel(), n=n_ids)
         if sort_alpha:
-            top_ids = sorted(top_ids)
-        df_e_hits = df_e_hits[top_ids]
+            pos_ids = pos_ids[np.argsort(ids[pos_ids], kind="stable")]
+        x_hit, ids = x_hit[:, pos_ids], ids[pos_ids]
     if n_terms is not None and terms_sub_list is None:
-        # Filter the DataFrame by keeping only the 'n_terms' with the highest number of associations
-        term_sums = df_e_hits.sum(axis=1).sort_values(ascending=False)
-        top_terms = term_sums.nlargest(n_terms).index
+        # Keep only the 'n_terms' with the highest number of associations
+        pos_terms = _get_top_pos(x_sums=np.asarray(x_hit.sum(axis=1)).ravel(), n=n_terms)
         if sort_alpha:
-            top_terms = sorted(top_terms)
-        df_e_hits = df_e_hits.loc[top_terms]
+            pos_terms = pos_terms[np.argsort(terms[pos_terms], kind="stable")]
+        x_hit, terms = x_hit[pos_terms], terms[pos_terms]
+    if sparse:
+        return pd.DataFrame.sparse.from_spmatrix(x_hit, index=list(terms), columns=list(ids))
+    df_e_hits = pd.DataFrame(x_hit.toarray(), index=list(terms), columns=list(ids))
     return df_e_hits
@@ -3,6 +3,8 @@ This is a script for the backend of the ranking methods of the pRank (protein-ce
 """
 import pandas as pd
 import numpy as np
+from scipy.sparse import csr_matrix
+import warnings
 
 import xomics.utils as ut
 
@@ -22,11 +24,31 @@ def _normalize_values(x, z_norm=True):
     # Min-max normalization
     min_val, max_val = np.nanmin(x), np.nanmax(x)
     if min_val == max_val:
-        return np.full(x.shape, 0.5)  # Return array with constant value if all inputs are identical
+        return np.full(x.shape, 0.5, dtype=x.dtype)  # Return array with constant value if all inputs are identical
     min_max_scores = (x - min_val) / (max_val - min_val)
     return min_max_scores
 
 
+def _normalize_columns(X=None, z_norm=True):
+    """Normalize each column of the 2D float array ``X`` in place (NaNs are ignored)."""
+    with warnings.catch_warnings():
+        # All-NaN columns stay NaN
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Z normalization
+            if z_norm:
+                X -= np.nanmean(X, axis=0)
+                X /= np.nanstd(X, axis=0)
+                return X
+            # Min-max normalization
+            min_vals, max_vals = np.nanmin(X, axis=0), np.nanmax(X, axis=0)
+            X -= min_vals
+            X /= max_vals - min_vals
+    # Constant value for columns with identical values
+    X[:, min_vals == max_vals] = 0.5
+    return X
+
+
 def _normalize_folds(x_vals=None, z_norm=True):
     """Normalize fold changes or fold enrichment."""
     # Scale
@@ -37,6 +59,25 @@ def _normalize_folds(x_vals=None, z_norm=True):
     return x_vals
 
 
+def get_hit_matrix(name_lists=None, sep=",", dtype=float):
+    """
+    Get sparse binary hit matrix (n_terms, n_unique_names) in CSR format representing the presence of names
+    in each name list (term), and the unique names (in order of first occurrence) given by integer codes.
+
+    Names are matched exactly (not as substrings), and duplicated names in one name list count once.
+    """
+    unique_ids, codes, indptr = ut.intern_list(list_in=name_lists, sep=sep)
+    x_hit = csr_matrix((np.ones(len(codes), dtype=dtype), codes, indptr), shape=(len(indptr) - 1, len(unique_ids)))
+    x_hit.sum_duplicates()
+    x_hit.data[:] = 1
+    # Remove empty names (e.g., from 'A,,B')
+    mask = np.array([x != "" for x in unique_ids], dtype=bool)
+    if not mask.all():
+        x_hit = x_hit[:, mask]
+        unique_ids = [x for x, keep in zip(unique_ids, mask) if keep]
+    return x_hit, unique_ids
+
+
 # Ranking functions
 def _p_ranking(x_fc, x_pvals, z_norm=False):
     """
@@ -66,7 +107,7 @@ def _e_ranking(x_fe, x_pvals, x_hit, z_norm=False):
     Parameters
     x_fe: array-like, fold enrichment scores for each protein
     x_pvals: array-like, p-values associated with each protein
-    x_hit: binary matrix denoting presence (1) or absence (0) of each protein
+    x_hit: binary (sparse) matrix (n_terms, n_proteins) denoting presence (1) or absence (0) of each protein
     z_norm: boolean, whether to apply z-normalization
 
     Returns
@@ -80,10 +121,8 @@ def _e_ranking(x_fe, x_pvals, x_hit, z_norm=False):
     x_pvals += abs(min(x_pvals)) + 0.00001
     # Combine the shifted fold enrichment and p-values for each protein
     x_fe_p = x_fe + x_pvals
-    # Weight the combined values by presence (1) or absence (0) of each protein
-    x_s = np.transpose(x_hit) * x_fe_p
-    # Sum the weighted scores for each protein
-    x_s = x_s.sum(axis=1)
+    # Sum the combined values of all terms containing a protein (matrix-vector product over hits only)
+    x_s = x_hit.T @ x_fe_p
     # Normalize the ranking scores
     ranking_score = _normalize_values(x_s, z_norm=z_norm)
     return ranking_score
@@ -95,7 +134,7 @@ def _e_ranking_only_pvals(x_pvals, x_hit, z_norm=False):
 
     Parameters
     x_pvals: array-like, p-values associated with each protein
-    x_hit: binary matrix denoting presence (1) or absence (0) of each protein
+    x_hit: binary (sparse) matrix (n_terms, n_proteins) denoting presence (1) or absence (0) of each protein
     z_norm: boolean, whether to apply z-normalization
 
     Returns
@@ -105,18 +144,17 @@ def _e_ranking_only_pvals(x_pvals, x_hit, z_norm=False):
     # The addition of 0.00001  avoids identical values, which can cause problems in min-max normalization
     # Values <= 0.001 have same impact (empirically tested)
     x_pvals += abs(min(x_pvals)) + 0.00001
-    # Weight the combined values by presence (1) or absence (0) of each protein
-    x_s = np.transpose(x_hit) * x_pvals
-    # Sum the weighted scores for each protein
-    x_s = x_s.sum(axis=1)
+    # Sum the values of all terms containing a protein (matrix-vector product over hits only)
+    x_s = x_hit.T @ x_pvals
     # Normalize the ranking scores
     ranking_score = _normalize_values(x_s, z_norm=z_norm)
     return ranking_score
 
 
 # II Main Functions
-def p_score(x_fc=None, x_pvals=None):
+def p_score(x_fc=None, x_pvals=None, dtype=float):
     """Calculate the single protein use_cases ranking score (P score)."""
+    x_fc, x_pvals = np.asarray(x_fc, dtype=dtype), np.asarray(x_pvals, dtype=dtype)
     # Normalize data
     norm_fc = _normalize_folds(x_vals=x_fc, z_norm=True)
     norm_pvals = _normalize_values(x_pvals, z_norm=True)
@@ -125,36 +163,50 @@ def p_score(x_fc=None, x_pvals=None):
     return p_scores
 
 
-def e_score(names=None, name_lists=None, x_fe=None, x_pval=None):
+def p_score_contrasts(X_fc=None, X_pval=None, dtype=float):
+    """Calculate P scores for multiple contrasts (columns) at once by column-wise normalization in one 2D pass."""
+    X_s = np.array(X_fc, dtype=dtype)
+    X_pval = np.array(X_pval, dtype=dtype)
+    # Normalize data (absolute fold changes for contrasts with negative values)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        mask_neg = np.nanmin(X_s, axis=0) < 0
+    np.abs(X_s, out=X_s, where=mask_neg[np.newaxis, :])
+    _normalize_columns(X_s, z_norm=True)
+    _normalize_columns(X_pval, z_norm=True)
+    # Scoring (min-max normalized) in place of fold change array
+    X_s += X_pval
+    return _normalize_columns(X_s, z_norm=False)
+
+
+def e_score(names=None, name_lists=None, x_fe=None, x_pval=None, dtype=float):
     """Calculate the single protein enrichment score (E score)."""
+    x_fe, x_pval = np.asarray(x_fe, dtype=dtype), np.asarray(x_pval, dtype=dtype)
     # Normalize data
     norm_pvals = _normalize_values(x_pval, z_norm=True)
     norm_fe = _normalize_folds(x_vals=x_fe, z_norm=True)
-    # Get unique protein IDs from input sets
-    unique_ids = ut.flatten_list(list_in=name_lists, sep=",")
-    # Create binary hit matrix to represent the presence of unique IDs in each set
-    x_hit = [[int(x in id_set) for x in unique_ids] for id_set in name_lists]
+    # Create sparse binary hit matrix to represent the presence of unique IDs in each set
+    x_hit, unique_ids = get_hit_matrix(name_lists=name_lists, sep=",", dtype=dtype)
     # Scoring for unique IDs (min-max normalized)
     _ranking_scores = _e_ranking(norm_fe, norm_pvals, x_hit)
     # Map unique IDs to their final scores
     dict_val = dict(zip(unique_ids, _ranking_scores))
-    e_scores = np.array([dict_val.get(i, 0) for i in names])
+    e_scores = np.array([dict_val.get(i, 0) for i in names], dtype=dtype)
     return e_scores
 
 
-def e_score_only_pvals(names=None, name_lists=None, x_pval=None):
+def e_score_only_pvals(names=None, name_lists=None, x_pval=None, dtype=float):
     """Calculate the single protein enrichment score (E score)."""
+    x_pval = np.asarray(x_pval, dtype=dtype)
     # Normalize data
     norm_pvals = _normalize_values(x_pval, z_norm=True)
-    # Get unique protein IDs from input sets
-    unique_ids = ut.flatten_list(list_in=name_lists, sep=",")
-    # Create binary hit matrix to represent the presence of unique IDs in each set
-    x_hit = [[int(x in id_set) for x in unique_ids] for id_set in name_lists]
+    # Create sparse binary hit matrix to represent the presence of unique IDs in each set
+    x_hit, unique_ids = get_hit_matrix(name_lists=name_lists, sep=",", dtype=dtype)
     # Scoring for unique IDs (min-max normalized)
     _ranking_scores = _e_ranking_only_pvals(norm_pvals, x_hit)
     # Map unique IDs to their final scores
     dict_val = dict(zip(unique_ids, _ranking_scores))
-    e_scores = np.array([dict_val.get(i, 0) for i in names])
+    e_scores = np.array([dict_val.get(i, 0) for i in names], dtype=dtype)
     return e_scores
 
 
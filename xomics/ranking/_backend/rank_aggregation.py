@@ -0,0 +1,129 @@
+"""
+This is a script for the backend of the rank aggregation (weighted mean, RRA, Borda) of pRank.aggregate_ranks().
+"""
+import pandas as pd
+import numpy as np
+from scipy.stats import rankdata
+from scipy.special import betainc
+
+LIST_AGG_METHODS = ["mean", "rra", "borda"]
+COL_AGG_SCORE = "agg_score"
+COL_AGG_RANK = "agg_rank"
+COL_AGG_PVAL = "agg_p-value"
+
+
+# I Helper Functions
+def _get_norm_ranks(X=None):
+    """Normalized ranks (rank / number of values, in (0, 1]) of each column of ``X`` with highest score first
+    (average ranks for ties, NaN for missing values)"""
+    mask_nan = np.isnan(X)
+    # Missing values are ranked last and thus do not affect ranks of given values
+    ranks = rankdata(np.where(mask_nan, np.inf, -X), method="average", axis=0)
+    ranks[mask_nan] = np.nan
+    return ranks / (~mask_nan).sum(axis=0)
+
+
+def _get_weights(weights=None, n_cols=None):
+    """Weights normalized to sum of one"""
+    weights = np.ones(n_cols) if weights is None else np.asarray(weights, dtype=float)
+    return weights / weights.sum()
+
+
+def _weighted_mean(R=None, weights=None):
+    """Weighted mean of normalized ranks of given values (lower is better)"""
+    mask = ~np.isnan(R)
+    w = np.where(mask, weights, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(mask, R, 0) @ weights / w.sum(axis=1)
+
+
+def _borda(R=None, weights=None):
+    """Weighted Borda count of normalized points (1 - normalized rank; 0 for missing values; higher is better)"""
+    points = np.where(np.isnan(R), 0, 1 - R)
+    return points @ weights
+
+
+def _rra(R=None):
+    """Robust rank aggregation (Kolde et al., 2012): rho scores as minimum of beta probabilities of the ordered
+    normalized ranks over all order statistics, and p-values as Bonferroni corrected rho scores (lower is better).
+    Only given (non-missing) values are considered for each row."""
+    n = (~np.isnan(R)).sum(axis=1, keepdims=True)
+    R_sorted = np.sort(R, axis=1)
+    k = np.arange(1, R.shape[1] + 1)[np.newaxis, :]
+    with np.errstate(invalid="ignore"):
+        beta = betainc(k, np.maximum(n - k + 1, 1), np.nan_to_num(R_sorted, nan=1))
+    # Order statistics beyond number of given values are ignored
+    beta = np.where(k <= n, beta, np.inf)
+    rho = beta.min(axis=1)
+    rho[n[:, 0] == 0] = np.nan
+    p_vals = np.minimum(rho * n[:, 0], 1)
+    return rho, p_vals
+
+
+# II Main Functions
+def get_top_k(x=None, k=None):
+    """Positions of the ``k`` lowest values of ``x`` in ascending order by partial sorting (NaNs last, ties in
+    original order)"""
+    x = np.asarray(x, dtype=float)
+    x = np.where(np.isnan(x), np.inf, x)
+    k = min(k, len(x))
+    if k == 0:
+        return np.array([], dtype=np.int64)
+    x_kth = x[np.argpartition(x, k - 1)[k - 1]]
+    # Values tied with the k-th value are selected in original order (as by a stable full sort)
+    idx_lower = np.flatnonzero(x < x_kth)
+    idx_tied = np.flatnonzero(x == x_kth)[:k - len(idx_lower)]
+    idx_top = np.concatenate([idx_lower, idx_tied])
+    return idx_top[np.argsort(x[idx_top], kind="stable")]
+
+
+def _get_order_ranks(x_order=None):
+    """Aggregated ranks (1 is best, minimum rank for ties, missing values last) of all proteins"""
+    return rankdata(np.where(np.isnan(x_order), np.inf, x_order), method="min").astype(np.int64)
+
+
+def _aggregate_scores(X=None, method="rra", weights=None):
+    """Aggregated scores, p-values (NaN if not given by method), and values to order proteins (lower is better)"""
+    X = np.asarray(X, dtype=float)
+    R = _get_norm_ranks(X=X)
+    p_vals = np.full(len(X), np.nan)
+    if method == "mean":
+        x_score = _weighted_mean(R=R, weights=_get_weights(weights=weights, n_cols=X.shape[1]))
+        x_order = x_score
+    elif method == "borda":
+        x_score = _borda(R=R, weights=_get_weights(weights=weights, n_cols=X.shape[1]))
+        x_order = -x_score
+    elif method == "rra":
+        x_score, p_vals = _rra(R=R)
+        x_order = x_score
+    else:
+        raise ValueError(f"'method' ({method}) should be one of: {LIST_AGG_METHODS}")
+    return x_score, p_vals, x_order
+
+
+def aggregate_ranks(X=None, method="rra", weights=None):
+    """
+    Aggregate rankings given by score columns of ``X`` (higher scores are better) into one ranking.
+
+    Returns aggregated scores, aggregated ranks (1 is best), and p-values (NaN if not given by method).
+    """
+    x_score, p_vals, x_order = _aggregate_scores(X=X, method=method, weights=weights)
+    return x_score, _get_order_ranks(x_order=x_order), p_vals
+
+
+def get_df_agg(X=None, index=None, method="rra", weights=None, top_k=None):
+    """Get DataFrame with aggregated scores, ranks, and p-values (only top ``top_k`` rows sorted by rank if given)"""
+    x_score, p_vals, x_order = _aggregate_scores(X=X, method=method, weights=weights)
+    if top_k is None:
+        idx, ranks = np.arange(len(x_order)), _get_order_ranks(x_order=x_order)
+    else:
+        # Partial sorting: only the top k proteins are sorted and ranked. All proteins with a lower value than
+        # a selected one are selected as well, such that ranks equal those among all proteins.
+        idx = get_top_k(x=x_order, k=top_k)
+        x_top = np.where(np.isnan(x_order[idx]), np.inf, x_order[idx])
+        ranks = np.searchsorted(x_top, x_top, side="left").astype(np.int64) + 1
+    df_agg = pd.DataFrame({COL_AGG_SCORE: x_score[idx], COL_AGG_RANK: ranks, COL_AGG_PVAL: p_vals[idx]},
+                          index=index[idx])
+    if method != "rra":
+        df_agg = df_agg.drop(columns=COL_AGG_PVAL)
+    return df_agg
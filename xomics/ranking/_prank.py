@@ -6,8 +6,10 @@ import numpy as np
 from typing import Optional, List
 
 import xomics.utils as ut
-from ._backend.prank import p_score, e_score, c_score, e_score_only_pvals
+from xomics.config import check_dtype
+from ._backend.prank import p_score, p_score_contrasts, e_score, c_score, e_score_only_pvals
 from ._backend.ehits import e_hits
+from ._backend.rank_aggregation import get_df_agg, LIST_AGG_METHODS
 
 
 # I Helper Functions
@@ -181,10 +183,57 @@ class pRank:
         check_numeric_elements(x_fc, name="x_fc")
         check_numeric_elements(x_pval, name="x_pvals")
         # Get P-score
-        p_scores = p_score(x_fc=x_fc, x_pvals=x_pval)
+        p_scores = p_score(x_fc=x_fc, x_pvals=x_pval, dtype=check_dtype())
         df_fc[ut.COL_P_SCORE] = p_scores
         return df_fc
 
+    @staticmethod
+    def p_score_contrasts(df_fc: pd.DataFrame = None,
+                          contrasts: Optional[List[str]] = None,
+                          ) -> pd.DataFrame:
+        """
+        Calculate P scores (see :meth:`pRank.p_score`) for multiple group comparisons (contrasts) at once.
+
+        Fold changes and p-values of all contrasts are normalized column-wise in one 2D pass.
+
+        Parameters
+        ----------
+        df_fc
+            DataFrame with fold-change and p-values for group comparisons as obtained by :meth:`PreProcess.run`.
+        contrasts
+            Names of group comparisons (e.g., '(group/group_ctrl)') given by pairs of fold change
+            (``log2_fc_(group/group_ctrl)``) and p-value (``-log10_p-value_(group/group_ctrl)``) columns.
+            If None, all group comparisons of ``df_fc`` are scored.
+
+        Returns
+        -------
+        df_p_scores
+            DataFrame (proteins x contrasts) with P-score for each protein given in 'p_score_(group/group_ctrl)'
+            columns.
+        """
+        # Checking functions
+        df_fc = ut.check_df(name="df_fc", df=df_fc)
+        if contrasts is None:
+            contrasts = ut.get_contrast_names(df=df_fc)
+            if len(contrasts) == 0:
+                raise ValueError(f"'df_fc' should contain fold change ('{ut.STR_FC}_*') and corresponding p-value "
+                                 f"('{ut.STR_PVAL}_*') columns.")
+        contrasts = ut.check_list_like(name="contrasts", val=contrasts, accept_str=True)
+        cols_fc = [f"{ut.STR_FC}_{c}" for c in contrasts]
+        cols_pval = [f"{ut.STR_PVAL}_{c}" for c in contrasts]
+        ut.check_col_in_df(df=df_fc, name_df="df_fc", cols=cols_fc + cols_pval, accept_nan=True)
+        # Get arrays with values
+        try:
+            X_fc = df_fc[cols_fc].to_numpy(dtype=check_dtype())
+            X_pval = df_fc[cols_pval].to_numpy(dtype=check_dtype())
+        except (ValueError, TypeError):
+            raise ValueError("Fold change and p-value columns of 'df_fc' should only contain numerical values")
+        # Get P-scores of all contrasts
+        X_p_scores = p_score_contrasts(X_fc=X_fc, X_pval=X_pval, dtype=check_dtype())
+        df_p_scores = pd.DataFrame(X_p_scores, columns=[f"{ut.COL_P_SCORE}_{c}" for c in contrasts],
+                                   index=df_fc.index)
+        return df_p_scores
+
     @staticmethod
     def e_score(df_fc: pd.DataFrame = None,
                 col_name: str = None,
@@ -242,9 +291,10 @@ class pRank:
             check_numeric_elements(x_pval, name="col_pvals")
         # Get E-score
         if col_fe is not None:
-            e_scores = e_score(names=names, name_lists=name_lists, x_fe=x_fe, x_pval=x_pval)
+            e_scores = e_score(names=names, name_lists=name_lists, x_fe=x_fe, x_pval=x_pval, dtype=check_dtype())
         else:
-            e_scores = e_score_only_pvals(names=names, name_lists=name_lists, x_pval=x_pval)
+            e_scores = e_score_only_pvals(names=names, name_lists=name_lists, x_pval=x_pval,
+                                          dtype=check_dtype())
         df_fc[ut.COL_E_SCORE] = e_scores
         return df_fc
 
@@ -273,6 +323,72 @@ class pRank:
         df_imp[ut.COL_C_SCORE] = c_scores
         return df_imp
 
+    @staticmethod
+    def aggregate_ranks(df_scores: pd.DataFrame = None,
+                        cols: Optional[List[str]] = None,
+                        method: str = "rra",
+                        weights: Optional[ut.ArrayLike1D] = None,
+                        top_k: Optional[int] = None,
+                        ) -> pd.DataFrame:
+        """
+        Aggregate protein rankings given by multiple scores (e.g., P, E, and C scores of several contrasts or
+        omics layers) into one ranking.
+
+        Each score column is converted into normalized ranks (rank / number of proteins with a score, highest
+        score first), which are aggregated for each protein by one of the following methods:
+
+        - 'mean': Weighted mean of normalized ranks (lower is better).
+        - 'rra': Robust rank aggregation (RRA; Kolde et al., 2012) giving rho scores (lower is better) and p-values.
+        - 'borda': Weighted Borda count of normalized points (1 - normalized rank, higher is better).
+
+        Parameters
+        ----------
+        df_scores
+            DataFrame with scores for each protein (rows), where higher scores indicate a better rank.
+        cols
+            Names of score columns from ``df_scores``. If None, all numerical columns are used.
+        method : {'rra', 'mean', 'borda'}, default='rra'
+            Rank aggregation method.
+        weights
+            Non-negative weight for each score column (only for 'mean' and 'borda'). If None, equal weights are used.
+        top_k
+            If given, only the ``top_k`` proteins with the best aggregated rank are returned (sorted by rank).
+
+        Returns
+        -------
+        df_agg
+            DataFrame with aggregated score ('agg_score') and rank ('agg_rank', 1 is best) for each protein,
+            and the p-value ('agg_p-value') for 'rra'.
+
+        Notes
+        -----
+        - Missing scores are ignored for 'mean' and 'rra' and give no points for 'borda'.
+        - The p-values of 'rra' are Bonferroni corrected rho scores (upper bound of exact p-values).
+        - ``top_k`` proteins are obtained by partial sorting.
+        """
+        # Checking functions
+        df_scores = ut.check_df(name="df_scores", df=df_scores)
+        if cols is None:
+            cols = list(df_scores.select_dtypes(include="number"))
+        cols = ut.check_list_like(name="cols", val=cols, accept_str=True)
+        ut.check_col_in_df(df=df_scores, name_df="df_scores", cols=cols, accept_nan=True)
+        ut.check_str_in_list(name="method", val=method, list_options=LIST_AGG_METHODS)
+        ut.check_number_range(name="top_k", val=top_k, min_val=1, accept_none=True, just_int=True)
+        if weights is not None:
+            if method == "rra":
+                raise ValueError("'weights' can only be used for 'mean' and 'borda' method")
+            weights = np.asarray(weights, dtype=float)
+            if len(weights) != len(cols) or weights.min() < 0 or weights.sum() == 0:
+                raise ValueError(f"'weights' should contain non-negative values (not all zero) "
+                                 f"for each column of 'cols' (n={len(cols)})")
+        try:
+            X = df_scores[cols].to_numpy(dtype=float)
+        except (ValueError, TypeError):
+            raise ValueError("Score columns of 'df_scores' should only contain numerical values")
+        # Aggregate rankings
+        df_agg = get_df_agg(X=X, index=df_scores.index, method=method, weights=weights, top_k=top_k)
+        return df_agg
+
     @staticmethod
     def e_hits(ids=None,
                id_lists=None,
@@ -280,7 +396,8 @@ class pRank:
                terms_sub_list=None,
                n_ids=None,
                n_terms=None,
-               sort_alpha=False
+               sort_alpha=False,
+               sparse=False
                ) -> pd.DataFrame:
         """
         Get association matrix for protein ids and enrichment terms.
@@ -305,6 +422,9 @@ class pRank:
             Filter results for 'n_terms' terms from 'term_list' with the highest number of associations if not None
         sort_alpha : bool, default = False
             Sort falues in alphabetically (if True) or in descending order of hit counts (if False)
+        sparse : bool, default = False
+            Return DataFrame with sparse columns (e.g., for genome-wide term sets), which can be converted
+            into a SciPy sparse matrix by ``df_e_hit.sparse.to_coo()``.
 
         Returns
         -------
@@ -330,8 +450,9 @@ class pRank:
         _check_duplicates(name="terms", lst=terms)
         ut.check_number_range(name="n_ids", val=n_ids, min_val=1, accept_none=True, just_int=True)
         ut.check_number_range(name="n_terms", val=n_terms, min_val=1, accept_none=True, just_int=True)
+        ut.check_bool(name="sparse", val=sparse)
         # Obtain gene/protein associations with enrichment terms
         df_e_hits = e_hits(ids=ids, id_lists=id_lists, terms=terms, terms_sub_list=terms_sub_list, n_ids=n_ids,
-                           n_terms=n_terms, sort_alpha=sort_alpha)
+                           n_terms=n_terms, sort_alpha=sort_alpha, sparse=sparse)
         return df_e_hits
 
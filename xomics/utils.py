@@ -7,7 +7,6 @@ import platform
 from functools import lru_cache
 import pandas as pd
 import numpy as np
-import itertools
 
 
 from .config import options
@@ -45,7 +44,8 @@ from ._utils.check_data import (check_X,
                                 check_match_list_labels_names_datasets,
                                 check_array_like,
                                 check_superset_subset,
-                                check_df)
+                                check_df,
+                                check_col_in_df)
 from ._utils.check_models import (check_mode_class,
                                   check_model_kwargs)
 from ._utils.check_plots import (check_fig,
@@ -70,7 +70,12 @@ from ._utils.utils_output import (print_out,
                                   print_end_progress)
 
 # External (system-level) utility functions (only backend)
-from ._utils.utils_groups import get_dict_qcol_group, get_dict_group_qcols, get_qcols
+from ._utils.utils_groups import (QuantLayout,
+                                  get_quant_layout,
+                                  get_col_substrings,
+                                  get_dict_qcol_group,
+                                  get_dict_group_qcols,
+                                  get_qcols)
 from ._utils.utils_plotting import plot_gco, plot_legend_, plot_get_clist_
 
 
@@ -111,6 +116,8 @@ COL_PE_MEAN = "pe_mean"
 
 STR_PVAL = "-log10_p-value"
 STR_FC = "log2_fc"
+STR_SAM = "sam_d"
+STR_QVAL = "q-value"
 
 # Volcano default colors
 COLOR_TH = "black"
@@ -120,6 +127,7 @@ COLOR_GEM = "#69C2CA"
 STR_SIG_POS = "Up"
 STR_SIG_NEG = "Down"
 STR_NON_SIG = "Unchanged"
+LIST_SIG_CLASSES = [STR_SIG_POS, STR_SIG_NEG, STR_NON_SIG]
 
 COL_SIG_CLASS = "sig_class"
 
@@ -137,35 +145,72 @@ def is_nested_list_with_strings(lst):
     return False
 
 
+def _get_items(x, sep=","):
+    """Get stripped items of a ``sep``-separated string or list of such strings (no items for missing values)"""
+    if isinstance(x, str):
+        return [i.strip() for i in x.split(sep)] if sep in x else [x.strip()]
+    if isinstance(x, (list, tuple, np.ndarray)):
+        items = []
+        for item in x:
+            if isinstance(item, str) and sep not in item:
+                items.append(item.strip())
+            else:
+                items.extend(_get_items(item, sep=sep))
+        return items
+    if x is None or (isinstance(x, float) and np.isnan(x)):
+        return []
+    return [x]
+
+
+def intern_list(list_in, sep=","):
+    """
+    Flatten list with (``sep``-separated) items and intern items as integer codes (in order of first occurrence).
+
+    Returns
+    -------
+    unique_items: List with unique items in order of first occurrence
+    codes: Array with integer codes (positions in ``unique_items``) of all flattened items
+    indptr: Array with offsets, such that codes[indptr[i]:indptr[i+1]] are the codes of the i-th element of list_in
+    """
+    if isinstance(list_in, pd.Series):
+        list_in = list_in.to_list()
+    list_items = [_get_items(x, sep=sep) for x in list_in]
+    indptr = np.zeros(len(list_items) + 1, dtype=np.int64)
+    np.cumsum([len(items) for items in list_items], out=indptr[1:])
+    flat_items = np.empty(indptr[-1], dtype=object)
+    flat_items[:] = [i for items in list_items for i in items]
+    # Hash-based factorization (linear time and order-preserving without sorting)
+    codes, unique_items = pd.factorize(flat_items, sort=False, use_na_sentinel=False)
+    return unique_items.tolist(), codes.astype(np.int64, copy=False), indptr
+
+
 def flatten_list(list_in, sep=","):
-    """Flatten list the list and provide unique items"""
+    """Flatten list the list and provide unique items (in order of first occurrence)"""
     if isinstance(list_in, pd.Series):
         list_in = list_in.to_list()
-    elif is_nested_list_with_strings(list_in):
-        list_in = list(itertools.chain.from_iterable(list_in))
-    f_ = lambda l: [x.strip() for x in l] if type(l) is list else (l.strip() if type(l) is str else np.NaN)
-    f = lambda x: x.split(sep) if sep in x and type(x) is str else [x]
-    chained_list = list(itertools.chain.from_iterable([f_(f(x)) for x in list_in]))
-    unique_items = []
-    for item in chained_list:
-        if item not in unique_items:
-            unique_items.append(item)
-    return unique_items
+    return list(dict.fromkeys(i for x in list_in for i in _get_items(x, sep=sep)))
+
+
+def get_contrast_names(df=None):
+    """Get names of group comparisons (e.g., '(group/group_ctrl)') given by pairs of fold change and p-value columns"""
+    str_fc = f"{STR_FC}_"
+    return [col[len(str_fc):] for col in df if isinstance(col, str) and col.startswith(str_fc)
+            and f"{STR_PVAL}_{col[len(str_fc):]}" in df]
+
+
+def get_sig_codes(x_fc=None, x_pval=None, th_pval=None, th_fc=None):
+    """Get significance class codes (positions in LIST_SIG_CLASSES) for arrays of fold changes and -log10 p-values
+    of any shape (e.g., multiple contrasts at once). Missing values are not significant."""
+    x_fc, x_pval = np.asarray(x_fc, dtype=float), np.asarray(x_pval, dtype=float)
+    is_sig = x_pval >= th_pval
+    conditions = [is_sig & (x_fc >= th_fc), is_sig & (x_fc <= -th_fc)]
+    return np.select(conditions, [0, 1], default=2).astype(np.int8)
 
 
 def get_sig_classes(df=None, col_fc=None, col_pval=None, th_pval=None, th_fc=None):
     """Get significance classes for proteins based on thresholds for fold change and p-values"""
-    sig_classes = []
-    for index, row in df.iterrows():
-        if row[col_pval] >= th_pval:
-            if row[col_fc] >= th_fc:
-                sig_classes.append(STR_SIG_POS)
-            elif row[col_fc] <= -th_fc:
-                sig_classes.append(STR_SIG_NEG)
-            else:
-                sig_classes.append(STR_NON_SIG)
-        else:
-            sig_classes.append(STR_NON_SIG)
+    sig_codes = get_sig_codes(x_fc=df[col_fc], x_pval=df[col_pval], th_pval=th_pval, th_fc=th_fc)
+    sig_classes = pd.Categorical.from_codes(sig_codes, categories=LIST_SIG_CLASSES)
     return sig_classes
 
 
@@ -187,13 +232,10 @@ def read_csv_cached(name, sep=None):
 
 # Main check functions
 def check_match_df_groups(df=None, groups=None, name_groups="groups", str_quant=None):
-    """"""
-    print(df)
+    """Check if all groups are substrings of columns in df (separated by '_')"""
     if str_quant is None:
         raise ValueError("'str_quant' must be given.")
-    list_substr_cols = [col.replace(str_quant, "").split("_") for col in list(df)]
-    list_substr_cols = flatten_list(list_substr_cols)
-    wrong_groups = [x for x in groups if x not in list_substr_cols]
+    col_substrings = get_col_substrings(df=df, str_quant=str_quant)
+    wrong_groups = [x for x in groups if x not in col_substrings]
     if len(wrong_groups) > 0:
         raise ValueError(f"The following entries from '{name_groups}' are not in 'df': {wrong_groups}")
-